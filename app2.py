@@ -1,21 +1,38 @@
 import streamlit as st
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import time
 from datetime import datetime, timedelta, timezone, time as dt_time
-import yfinance as yf
 import plotly.graph_objects as go
-import google.generativeai as genai 
+
+from backtest import DEFAULT_THRESHOLDS, RETURN_COLUMNS, run_backtest
+from bottoms import BOTTOM_COLUMNS, BOTTOM_SIGNALS, add_bottom_signals, screen_bottoms, top_bottoms
+from charts import RENDER_MODES, build_candle_figure, build_seasonal_figure
+from indicators import INDICATOR_COLUMNS, IndicatorCache, add_indicators
+from markets import fetch_global_markets
+from metrics import METRICS
+from ohlcv_store import OhlcvStore
+from peers import build_return_matrix, correlation_matrix, parse_codes, top_peers
+from parsers import decode_response, parse_stock_detail
+from prefetch import DetailPrefetcher
+from ranking import SORT_KEYS, filter_ranking
+from ranking_history import RankingHistory
+from result_cache import RESULT_CACHE, shared_cache
+from seasonal import MAX_YEARS, seasonal_analogs
+from scheduler import PHASE_IDLE, PHASE_LABELS, PHASE_NIGHT, PHASE_ZARABA, PrefetchScheduler, market_phase
+from scraper import RANKING_TARGETS, PageFetcher, fetch_ranking
+from summarizer import Summarizer, make_model
+from tdnet import TdnetIngester
+from tdnet_archive import CATEGORY_KEYWORDS, TdnetArchive
+from universe import UniversePanel
+from watchlist import AlertRules, WatchlistMonitor, latest_quotes, volume_baseline
 
 # ==========================================
 # 設定 & ページ構成
 # ==========================================
 st.set_page_config(layout="wide", page_title="底打確認組")
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
-}
+# 株探への取得設定 (ホスト単位の秒間リクエスト数 / 同時接続数)
+FETCH_RATE_PER_SEC = 5.0
+FETCH_MAX_WORKERS = 4
 
 JST = timezone(timedelta(hours=9))
 
@@ -48,118 +65,107 @@ div[data-testid="stMetric"] {
 """, unsafe_allow_html=True)
 
 # ==========================================
-# グローバル市況ダッシュボード取得
+# 株価データ: ローカルOHLCVストア
 # ==========================================
-@st.cache_data(ttl=300)
-def get_global_markets_data():
-    tickers = {
-        "NYダウ": "^DJI",
-        "NASDAQ": "^IXIC",
-        "日経先物 (CME)": "NIY=F",
-        "ドル / 円": "JPY=X"
-    }
-    data = {}
-    for name, symbol in tickers.items():
-        try:
-            tkr = yf.Ticker(symbol)
-            hist = tkr.history(period="5d")
-            if len(hist) >= 2:
-                current_price = hist['Close'].iloc[-1]
-                prev_price = hist['Close'].iloc[-2]
-                diff = current_price - prev_price
-                pct_change = (diff / prev_price) * 100
-                data[name] = {
-                    "price": current_price,
-                    "diff": diff,
-                    "pct": pct_change
-                }
-            else:
-                data[name] = None
-        except Exception:
-            data[name] = None
-    return data
+@st.cache_resource
+def get_ohlcv_store():
+    return OhlcvStore()
+
+@st.cache_resource
+def get_indicator_cache():
+    return IndicatorCache()
+
+@st.cache_resource
+def get_universe_panel():
+    return UniversePanel()
+
+@st.cache_resource
+def get_ranking_history():
+    return RankingHistory()
 
 # ==========================================
 # 関数: チャート描画
 # ==========================================
-def display_chart(code, show_past=False):
+# 表示名: (足種, 表示期間(年), 移動平均1, 移動平均2, ラベル1, ラベル2)
+CHART_VIEWS = {
+    "日足": ("1d", 1, 25, 75, "25日", "75日"),
+    "週足": ("1wk", 2, 13, 26, "13週", "26週"),
+    "月足": ("1mo", 5, 12, 24, "12月", "24月"),
+}
+
+def get_past_date(dt, years):
+    try:
+        return dt.replace(year=dt.year - years)
+    except ValueError:
+        return dt.replace(year=dt.year - years, day=28)
+
+@shared_cache(ttl=600, name="chart")
+def get_chart_figure(ticker_symbol, interval, start, end, title, ma1, ma2, label_ma1, label_ma2,
+                     x_range=None, render_mode="standard"):
+    """銘柄・足種・期間・描画モードごとに図をメモ化する。データが無ければ None。"""
+    df = get_ohlcv_store().bars(ticker_symbol, interval, start=start, end=end)
+    if df.empty:
+        return None
+    with METRICS.span("chart.build", interval=interval, mode=render_mode):
+        return build_candle_figure(df, title, ma1, ma2, label_ma1, label_ma2, interval,
+                                   height=350, x_range=x_range, render_mode=render_mode)
+
+def plot_chart(title, *args, **kwargs):
+    with METRICS.span("chart.display"):
+        fig = get_chart_figure(*args, title=title, **kwargs)
+    if fig is None:
+        st.warning(f"{title} のデータが取得できませんでした。")
+        return
+    st.plotly_chart(fig, use_container_width=True)
+
+@shared_cache(ttl=600, name="seasonal")
+def get_seasonal_figure(ticker_symbol, anchor, years):
+    """長期日足を1度だけ読み、過去 years 年の同時期の値動きを1枚の図に重ねる。データが無ければ None。"""
+    daily = get_ohlcv_store().daily(ticker_symbol)
+    if daily.empty:
+        return None
+    with METRICS.span("chart.seasonal", years=years):
+        analogs = seasonal_analogs(daily, anchor, years=years)
+        if not len(analogs.years):
+            return None
+        title = f"🕒 季節性比較: 過去{len(analogs.years)}年の同時期 ({', '.join(map(str, analogs.years))})"
+        return build_seasonal_figure(analogs, title)
+
+def chart_request(ticker_symbol, view, today, render_mode="standard"):
+    """足種 view のチャートの (タイトル, get_chart_figure の引数, キーワード引数)。先読みと表示で同じキャッシュキーにする。"""
+    interval, years, ma1, ma2, label_ma1, label_ma2 = CHART_VIEWS[view]
+    kwargs = dict(ma1=ma1, ma2=ma2, label_ma1=label_ma1, label_ma2=label_ma2, render_mode=render_mode)
+    if interval == "1d":
+        start_date = get_past_date(today, 1)
+        args = (ticker_symbol, interval, start_date - timedelta(days=120), today + timedelta(days=5))
+        return "現在の日足 (過去1年間)", args, dict(kwargs, x_range=[start_date, today])
+    return f"現在の{view} (過去{years}年間)", (ticker_symbol, interval, get_past_date(today, years), None), kwargs
+
+def display_chart(code, show_past=False, render_mode="standard"):
     st.markdown("##### 📉 株価チャート")
     ticker_symbol = f"{code}.T"
-    
-    def get_past_date(dt, years):
-        try:
-            return dt.replace(year=dt.year - years)
-        except ValueError:
-            return dt.replace(year=dt.year - years, day=28)
-
-    def plot_candle(df, title, ma1, ma2, label_ma1, label_ma2, interval, height=350, x_range=None):
-        if df.empty:
-            st.warning(f"{title} のデータが取得できませんでした。")
-            return
-            
-        df['MA1'] = df['Close'].rolling(window=ma1).mean()
-        df['MA2'] = df['Close'].rolling(window=ma2).mean()
-
-        fig = go.Figure()
-        fig.add_trace(go.Candlestick(
-            x=df.index, open=df['Open'], high=df['High'], low=df['Low'], close=df['Close'],
-            name='株価', increasing_line_color='#00C805', decreasing_line_color='#FF333A'
-        ))
-        fig.add_trace(go.Scatter(x=df.index, y=df['MA1'], mode='lines', name=label_ma1, line=dict(color='orange', width=1)))
-        fig.add_trace(go.Scatter(x=df.index, y=df['MA2'], mode='lines', name=label_ma2, line=dict(color='skyblue', width=1)))
-        
-        fig.update_layout(
-            title=title,
-            height=height, margin=dict(l=10, r=10, t=40, b=10),
-            xaxis_rangeslider_visible=False, template="plotly_white", showlegend=True,
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        
-        xaxes_config = {}
-        if interval == "1d":
-            xaxes_config['rangebreaks'] = [dict(bounds=["sat", "mon"])]
-        if x_range:
-            xaxes_config['range'] = x_range
-            
-        if xaxes_config:
-            fig.update_xaxes(**xaxes_config)
-            
-        st.plotly_chart(fig, use_container_width=True)
 
     try:
-        stock = yf.Ticker(ticker_symbol)
         now = datetime.now(JST)
         current_end_date = now.date()
-        current_start_date = get_past_date(current_end_date, 1) 
         
-        tab_d, tab_w, tab_m = st.tabs(["日足", "週足", "月足"])
-        
-        with tab_d: 
-            fetch_start_curr = current_start_date - timedelta(days=120)
-            fetch_end_curr = current_end_date + timedelta(days=5)
-            df_d = stock.history(start=fetch_start_curr.strftime('%Y-%m-%d'), end=fetch_end_curr.strftime('%Y-%m-%d'), interval="1d")
-            plot_candle(df_d, "現在の日足 (過去1年間)", 25, 75, "25日", "75日", "1d", height=350, x_range=[current_start_date, current_end_date])
-            
-        with tab_w: 
-            df_w = stock.history(period="2y", interval="1wk")
-            plot_candle(df_w, "現在の週足 (過去2年間)", 13, 26, "13週", "26週", "1wk", height=350)
-            
-        with tab_m: 
-            df_m = stock.history(period="5y", interval="1mo")
-            plot_candle(df_m, "現在の月足 (過去5年間)", 12, 24, "12月", "24月", "1mo", height=350)
+        # 選択中の足種だけを取得・構築する (タブのように全足種を先に描画しない)
+        view = st.radio("足種", list(CHART_VIEWS), horizontal=True, key="chart_view", label_visibility="collapsed")
+        title, args, kwargs = chart_request(ticker_symbol, view, current_end_date, render_mode)
+        plot_chart(title, *args, **kwargs)
 
         if show_past:
             st.markdown("---")
-            st.markdown("##### 🕒 過去チャート比較 (現在と横軸を同期)")
-            for years_ago in [1, 2, 3]:
-                past_start_date = get_past_date(current_start_date, years_ago)
-                past_end_date = get_past_date(current_end_date, years_ago)
-                fetch_start = past_start_date - timedelta(days=120)
-                fetch_end = past_end_date + timedelta(days=5)
-                df_past = stock.history(start=fetch_start.strftime('%Y-%m-%d'), end=fetch_end.strftime('%Y-%m-%d'), interval="1d")
-                title_lbl = f"📉 {years_ago}年前 ({past_start_date.strftime('%Y/%m/%d')} 〜 {past_end_date.strftime('%Y/%m/%d')})"
-                plot_candle(df_past, title_lbl, 25, 75, "25日", "75日", "1d", height=350, x_range=[past_start_date, past_end_date])
+            st.markdown("##### 🕒 過去の同時期との比較 (今日の終値を 0% として重ね描き)")
+            n_years = st.slider("比較する年数", 1, MAX_YEARS, 5, key="seasonal_years")
+            fig = get_seasonal_figure(ticker_symbol, current_end_date, n_years)
+            if fig is None:
+                st.warning("比較できる過去データがありません。")
+            else:
+                st.plotly_chart(fig, use_container_width=True)
+                st.caption("帯は過去年の10〜90% / 25〜75% の範囲、青線は平均、赤線は今年の値動きです。")
     except Exception as e:
+        METRICS.error("chart", e)
         st.warning(f"チャート取得エラーが発生しました: {e}")
 
 # ==========================================
@@ -170,8 +176,9 @@ def display_correlation_chart(base_code, comp_code):
         base_sym = f"{base_code}.T"
         comp_sym = f"{comp_code}.T"
 
-        base_df = yf.Ticker(base_sym).history(period="6mo")[['Close']].rename(columns={'Close': base_code})
-        comp_df = yf.Ticker(comp_sym).history(period="6mo")[['Close']].rename(columns={'Close': comp_code})
+        store = get_ohlcv_store()
+        base_df = store.period(base_sym, months=6)[['Close']].rename(columns={'Close': base_code})
+        comp_df = store.period(comp_sym, months=6)[['Close']].rename(columns={'Close': comp_code})
 
         if base_df.empty or comp_df.empty:
             st.warning(f"データが取得できませんでした。コード({comp_code})が正しいか確認してください。")
@@ -212,8 +219,21 @@ def display_correlation_chart(base_code, comp_code):
         st.plotly_chart(fig, use_container_width=True)
 
     except Exception as e:
+        METRICS.error("correlation", e)
         st.error(f"相関分析エラー: {e}")
 
+@shared_cache(ttl=900, name="correlation")
+def get_correlation_matrix(codes):
+    """銘柄集合ごとにリターン行列と相関行列を1度だけ計算する (以後の検索は行の切り出しのみ)。"""
+    return correlation_matrix(build_return_matrix(list(codes)))
+
+# ==========================================
+# AI要約サービス
+# ==========================================
+@st.cache_resource
+def get_summarizer(api_key):
+    return Summarizer(make_model(api_key), fetch=lambda url: get_page_fetcher().get(url, timeout=10))
+
 # ==========================================
 # 関数: PDF表示用
 # ==========================================
@@ -224,167 +244,201 @@ def display_pdf(url):
         unsafe_allow_html=True
     )
 
+# ==========================================
+# 関数: 共有HTTPクライアント
+# ==========================================
+@st.cache_resource
+def get_page_fetcher():
+    return PageFetcher(rate_per_sec=FETCH_RATE_PER_SEC, max_workers=FETCH_MAX_WORKERS)
+
 # ==========================================
 # 関数: TDnetデータ取得
 # ==========================================
-@st.cache_data(ttl=300)
+@st.cache_resource
+def get_tdnet_archive():
+    return TdnetArchive()
+
+@st.cache_resource
+def get_tdnet_ingester():
+    return TdnetIngester(fetcher=get_page_fetcher(), listeners=[get_tdnet_archive().on_rows])
+
+def get_tdnet_window(end_date, days):
+    """アーカイブから end_date までの days 日分の開示を {code: [item, ...]} で返す。"""
+    return get_tdnet_archive().disclosure_map(end_date - timedelta(days=days - 1), end_date)
+
+@shared_cache(ttl=600, name="topic")
+def _get_topic_hits(end_date, days, keywords, categories, version):
+    return get_tdnet_archive().topic_labels(end_date - timedelta(days=days - 1), end_date, keywords, categories)
+
+def get_topic_hits(end_date, days, keywords, categories):
+    """
+    期間内でキーワード・開示種別に該当した開示を銘柄ごとの該当ラベル {code: [label, ...]} にまとめる。
+    結果は (期間, 条件) ごとに共有し、アーカイブに新しい開示が入ったら (version が変わったら) 検索し直す。
+    """
+    return _get_topic_hits(end_date, days, tuple(keywords), tuple(categories), get_tdnet_archive().version())
+
+@shared_cache(ttl=300, name="tdnet")
 def get_tdnet_data(target_date):
-    date_str = target_date.strftime('%Y%m%d')
-    base_url = "https://www.release.tdnet.info/inbs/I_list_{}_{}.html"
-    root_url = "https://www.release.tdnet.info/inbs/"
-    disclosure_map = {}
-    page = 1
-    while True:
-        url = base_url.format(f"{page:03}", date_str)
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=5)
-            if res.status_code == 404: break
-            res.encoding = 'utf-8'
-            soup = BeautifulSoup(res.text, 'html.parser')
-            rows = soup.select("table tr")
-            for row in rows:
-                cols = row.find_all('td')
-                if len(cols) >= 4:
-                    code_full = cols[1].text.strip()
-                    code_4 = code_full[:4]
-                    title = cols[3].text.strip()
-                    link_tag = cols[3].find('a')
-                    pdf_url = ""
-                    if link_tag and 'href' in link_tag.attrs:
-                        pdf_url = root_url + link_tag['href']
-                    if code_4 not in disclosure_map: disclosure_map[code_4] = []
-                    disclosure_map[code_4].append({"time": cols[0].text.strip(), "title": title, "url": pdf_url})
-            page += 1
-            time.sleep(0.1)
-        except: break
-    return disclosure_map
+    state = get_tdnet_ingester().refresh(target_date)
+    return dict(state.disclosure_map)
 
 # ==========================================
 # 関数: ランキング取得
 # ==========================================
-def get_ranking_data_no_cache(mode, threshold, max_items):
-    candidates = []
-    seen_codes = set()
-    
-    if mode == "PTS": 
-        targets = [
-            ("https://kabutan.jp/warning/pts_night_price_increase", "急騰"),
-            ("https://kabutan.jp/warning/pts_night_price_decrease", "急落")
-        ]
-        idxs = {"code": 0, "name": 1, "market": 2, "price": 6, "change": 7, "pct": 8}
-    elif mode == "PTS_DAY": 
-        targets = [
-            ("https://kabutan.jp/warning/pts_day_price_increase", "急騰"),
-            ("https://kabutan.jp/warning/pts_day_price_decrease", "急落")
-        ]
-        idxs = {"code": 0, "name": 1, "market": 2, "price": 6, "change": 7, "pct": 8}
-    else: 
-        targets = [
-            ("https://kabutan.jp/warning/?mode=2_1", "急騰"), 
-            ("https://kabutan.jp/warning/?mode=2_2", "急落")  
-        ]
-        idxs = {"code": 0, "name": 1, "market": 2, "price": 6, "change": 7, "pct": 8}
-
+def get_ranking_data_no_cache(mode, top_n=0, threshold=0.0):
+    """
+    ランキングをその場で強制取得し、共有スナップショットとして公開する。
+    取得中はページが届くたびに途中経過の上位表を表示する。
+    top_n > 0 なら |変動率| の上位 top_n 件が確定した時点で取得を打ち切る (スナップショットは一部のみ)。
+    閾値・件数での絞り込みは filter_ranking で行う。
+    """
     progress_text = f"{mode}データを取得中..."
     my_bar = st.progress(0, text=progress_text)
-    
-    for base_url, label in targets:
-        page = 1
-        keep_fetching = True
-        
-        while keep_fetching:
-            separator = "&" if "?" in base_url else "?"
-            url = base_url if page == 1 else f"{base_url}{separator}page={page}"
-            if page > 20: break
-            
-            try:
-                time.sleep(0.2)
-                res = requests.get(url, headers=HEADERS, timeout=10)
-                res.encoding = res.apparent_encoding 
-                soup = BeautifulSoup(res.text, 'html.parser')
-                table = soup.select_one("table.stock_table")
-                
-                if not table:
-                    keep_fetching = False; continue
-                
-                tbody = table.find("tbody")
-                rows = tbody.find_all("tr") if tbody else table.find_all("tr")[1:]
-                
-                if not rows:
-                    keep_fetching = False; continue
-                
-                valid_count = 0
-                for row in rows:
-                    cols = row.find_all(["td", "th"])
-                    if len(cols) < max(idxs.values()) + 1: continue
-                    
-                    try:
-                        pct_str = cols[idxs["pct"]].text.strip()
-                        clean_pct = pct_str.replace("%", "").replace("+", "").replace(",", "")
-                        if not clean_pct: continue
-                        change_pct = float(clean_pct)
-                        
-                        if abs(change_pct) < threshold or change_pct == 0: continue
-                        
-                        change_str = cols[idxs["change"]].text.strip()
-                        clean_change = change_str.replace(",", "").replace("+", "") 
-                        change_val = float(clean_change) if clean_change.replace("-", "").replace(".", "").isdigit() else 0
+    live_table = st.empty()
 
-                        code_col = cols[idxs["code"]]
-                        code_tag = code_col.find('a')
-                        code = code_tag.text.strip() if code_tag else code_col.text.strip()
-                        
-                        if code in seen_codes: continue
-                        seen_codes.add(code)
-                        
-                        name = cols[idxs["name"]].text.strip()
-                        market = cols[idxs["market"]].text.strip()
-                        
-                        price_str = cols[idxs["price"]].text.strip()
-                        price = float(price_str.replace(",", "")) if price_str.replace(",", "").replace(".", "").isdigit() else 0
-                        
-                        candidates.append({
-                            "Code": code, "Name": name, "Market": market,
-                            "Price": price, "Change": change_val, "Change_Pct": change_pct, "Label": label
-                        })
-                        valid_count += 1
-                    except Exception: continue
-                
-                if valid_count == 0:
-                    keep_fetching = False
-                else:
-                    page += 1
-                    my_bar.progress(min(len(candidates), 100), text=f"{label} {page-1}ページ目... ({len(candidates)}件)")
-                    if max_items > 0 and len(candidates) >= max_items * 2: keep_fetching = False
-            except: keep_fetching = False
-            
+    def on_page(done, total, label, page, n_rows):
+        my_bar.progress(min(done / total, 1.0), text=f"{label} {page}ページ目... ({n_rows}件)")
+
+    def on_partial(df):
+        head = filter_ranking(df, threshold=threshold, top_n=top_n or 50)
+        if not head.empty:
+            live_table.dataframe(head[["Code", "Name", "Price", "Change_Pct", "Label"]],
+                                 use_container_width=True, hide_index=True, height=300)
+
+    snap = get_scheduler().refresh(f"ranking:{mode}", progress=on_page, top_n=top_n, partial=on_partial)
     my_bar.empty()
-    return pd.DataFrame(candidates)
+    live_table.empty()
+    return snap
+
+# ==========================================
+# バックグラウンド更新: 全セッション共有のスナップショット
+# ==========================================
+# 時間帯ごとの更新間隔 (秒)
+REFRESH_INTERVALS = {
+    "ranking:PTS": {PHASE_NIGHT: 60, PHASE_ZARABA: 900, PHASE_IDLE: 1800},
+    "ranking:PTS_DAY": {PHASE_NIGHT: 1800, PHASE_ZARABA: 60, PHASE_IDLE: 1800},
+    "ranking:Daytime": {PHASE_NIGHT: 1800, PHASE_ZARABA: 60, PHASE_IDLE: 1800},
+    "tdnet:today": {PHASE_NIGHT: 300, PHASE_ZARABA: 120, PHASE_IDLE: 900},
+    "global": {PHASE_NIGHT: 120, PHASE_ZARABA: 300, PHASE_IDLE: 900},
+    "bottoms": {PHASE_NIGHT: 1800, PHASE_ZARABA: 1800, PHASE_IDLE: 1800},
+    "watchlist": {PHASE_NIGHT: 20, PHASE_ZARABA: 20, PHASE_IDLE: 600},
+}
+WATCH_REFRESH_SEC = 20
+
+@st.cache_resource
+def get_scheduler():
+    scheduler = PrefetchScheduler()
+    fetcher = get_page_fetcher()
+    ingester = get_tdnet_ingester()
+    history = get_ranking_history()
+
+    def ranking_job(mode):
+        def job(progress=None, top_n=0, partial=None):
+            df = fetch_ranking(mode, 0.0, top_n, fetcher=fetcher, progress=progress, partial=partial)
+            df.attrs["top_n"] = top_n
+            # 上位だけで打ち切った取得は全件ではないため履歴に残さない
+            if not df.attrs.get("stopped_early"):
+                tdnet = scheduler.snapshot("tdnet:today")
+                try:
+                    history.append(mode, df, news_codes=tdnet.data if tdnet else None)
+                except OSError as e:
+                    METRICS.error("history.append", e)
+            return df
+        return job
+
+    def tdnet_job():
+        return dict(ingester.refresh(datetime.now(JST).date()).disclosure_map)
+
+    for mode in RANKING_TARGETS:
+        scheduler.add_job(f"ranking:{mode}", ranking_job(mode), REFRESH_INTERVALS[f"ranking:{mode}"])
+    scheduler.add_job("tdnet:today", tdnet_job, REFRESH_INTERVALS["tdnet:today"])
+    scheduler.add_job("global", fetch_global_markets, REFRESH_INTERVALS["global"])
+    return scheduler.start()
+
+@st.cache_resource
+def enable_bottom_screen():
+    """全銘柄パネルの更新 (大引け後に1日1回) と底打ち判定をバックグラウンドジョブとして登録する。"""
+    panel = get_universe_panel()
+    # 初回の全件取得は数分かかるため、ランキング等の更新を止めないよう専用レーンで実行する
+    get_scheduler().add_job("bottoms", lambda: screen_bottoms(panel.update_if_stale()), REFRESH_INTERVALS["bottoms"],
+                            lane="universe")
+    return True
+
+@st.cache_resource
+def get_watchlist():
+    """
+    プロセス共有のウォッチリスト。監視はバックグラウンドジョブで続け、画面を見ていない間もアラートを記録する。
+    ランキングはスケジューラの取得結果を使い、平均出来高・ランキング外の株価の一括ダウンロードは専用レーンで行う。
+    """
+    monitor = WatchlistMonitor(baseline=lambda codes: volume_baseline(codes, get_universe_panel().frames()),
+                               quotes=latest_quotes)
+    scheduler = get_scheduler()
+
+    def watch_job():
+        monitor.poll(scheduler, market_phase())
+        return monitor.table()
+
+    scheduler.add_job("watchlist", watch_job, REFRESH_INTERVALS["watchlist"], lane="watchlist")
+    return monitor
+
+def get_snapshot(key):
+    """最新スナップショットを返す。起動直後でまだ無い場合のみその場で取得する。"""
+    scheduler = get_scheduler()
+    return scheduler.snapshot(key) or scheduler.refresh(key)
+
+def get_global_markets_data():
+    return get_snapshot("global").data or {}
+
+def format_age(snap):
+    age = int(snap.age())
+    age_txt = f"{age}秒前" if age < 60 else f"{age // 60}分前"
+    return f"{snap.fetched_at.strftime('%H:%M:%S')} ({age_txt})"
 
 # ==========================================
 # 関数: 日中4本値 & 出来高
 # ==========================================
-def get_daily_ohlc(code):
+EMPTY_OHLC = {"Open": "-", "High": "-", "Low": "-", "Close": "-", "Volume": "-", "Value": "-"}
+
+def get_daily_ohlc(code, fetcher):
     url = f"https://kabutan.jp/stock/?code={code}"
-    d = {"Open": "-", "High": "-", "Low": "-", "Close": "-", "Volume": "-", "Value": "-"}
-    try:
-        res = requests.get(url, headers=HEADERS, timeout=5)
-        soup = BeautifulSoup(res.text, 'html.parser')
-        def find_val(label):
-            th = soup.find("th", string=label)
-            if th:
-                td = th.find_next_sibling("td")
-                if td: return td.text.strip()
-            return "-"
-        d["Open"] = find_val("始値"); d["High"] = find_val("高値")
-        d["Low"] = find_val("安値"); d["Close"] = find_val("終値")
-        d["Volume"] = find_val("出来高"); d["Value"] = find_val("売買代金")
-        
-        if d["Close"] == "-":
-            span = soup.select_one("span.kabuka")
-            if span: d["Close"] = span.text.strip()
-        return d
-    except: return d
+    with METRICS.span("stock_detail"):
+        res = fetcher.get(url, timeout=5)
+        return parse_stock_detail(decode_response(res))
+
+def get_volume_multiplier(code, ohlc, store):
+    """当日出来高 / 直近25営業日の平均出来高 の表示文字列。計算できなければ "-"。"""
+    hist = store.period(f"{code}.T", months=2)
+    if len(hist) > 25:
+        avg_vol_25 = hist['Volume'].iloc[-26:-1].mean()
+        vol_str = ohlc["Volume"].replace("株", "").replace(",", "").strip()
+        if vol_str.isdigit() and avg_vol_25 > 0:
+            return f"{float(vol_str) / avg_vol_25:.1f} 倍"
+    return "-"
+
+@st.cache_resource
+def get_detail_prefetcher():
+    """
+    行クリックで表示する詳細 (日中4本値・出来高急増率・既定表示の日足チャート) を上位銘柄について先読みする。
+    4本値の取得に失敗した場合は例外のままにし、失敗結果をキャッシュしない。
+    """
+    fetcher = get_page_fetcher()
+    store = get_ohlcv_store()
+
+    def load(code):
+        ohlc = get_daily_ohlc(code, fetcher)
+        try:
+            volume_multiplier = get_volume_multiplier(code, ohlc, store)
+        except Exception as e:
+            METRICS.error("volume_multiplier", e)
+            volume_multiplier = "-"
+        try:
+            title, args, kwargs = chart_request(f"{code}.T", next(iter(CHART_VIEWS)), datetime.now(JST).date())
+            get_chart_figure(*args, title=title, **kwargs)
+        except Exception as e:
+            METRICS.error("prefetch.chart", e)
+        return {"ohlc": ohlc, "volume_multiplier": volume_multiplier}
+
+    return DetailPrefetcher(load)
 
 # ==========================================
 # UI構築: サイドバー
@@ -416,6 +470,8 @@ else:
         display_mode_label = "東証 (大引け 🏁Final)"
 
 search_date = st.sidebar.date_input("TDnet検索日", value=now_jst.date())
+news_days = st.sidebar.number_input("開示の対象期間 (日)", min_value=1, max_value=30, value=1, step=1,
+                                    help="2日以上にすると、検索日までの期間の開示をアーカイブから結合します")
 
 st.sidebar.subheader(f"{display_mode_label} 設定")
 threshold_percent = st.sidebar.slider("変動率 閾値 (%)", 0.0, 20.0, 3.0, 0.1)
@@ -425,18 +481,42 @@ max_price = col_p2.number_input("上限 (円)", value=0, step=100)
 max_items = st.sidebar.number_input("検索上限数", value=0, step=10)
 
 filter_news = st.sidebar.checkbox("📄 適時開示ありの銘柄のみ表示", value=False)
+topic_categories = st.sidebar.multiselect("開示種別で絞り込み", list(CATEGORY_KEYWORDS))
+topic_text = st.sidebar.text_input("開示タイトルのキーワード", help="空白区切りで複数指定 (いずれかを含む開示)")
+
+calc_indicators = st.sidebar.checkbox("📊 出来高急増率・移動平均乖離を計算", value=True, help="ヒットした全銘柄の日足をまとめて取得して計算します")
+min_vol_surge = st.sidebar.number_input("出来高急増率 下限 (倍)", value=0.0, step=0.5, disabled=not calc_indicators)
+screen_bottoms_on = st.sidebar.checkbox("🔻 底打スクリーニング (東証全銘柄)", value=False,
+                                        help="東証全銘柄の日足を大引け後に1日1回まとめて更新し、底打ちの条件を判定します (初回は全銘柄の取得に数分かかります)")
+min_bottom_score = st.sidebar.slider("底打スコア 下限", 0, len(BOTTOM_SIGNALS), 0, disabled=not screen_bottoms_on,
+                                     help="、".join(BOTTOM_SIGNALS.values()) + " のうち満たした条件の数")
+sort_label = st.sidebar.selectbox("並び順 (降順)", list(SORT_KEYS), index=0)
+
+st.sidebar.divider()
+watchlist = get_watchlist()
+with st.sidebar.expander(f"👀 ウォッチリスト ({len(watchlist.codes)}銘柄)"):
+    with st.form("watchlist_form", border=False):
+        watch_text = st.text_area("監視する銘柄コード", ", ".join(watchlist.codes), height=100,
+                                  help=f"カンマ・空白・改行区切りで最大{watchlist.max_codes}銘柄 (全セッション共通)")
+        watch_pct = st.number_input("変動率アラート (±%)", value=float(watchlist.rules.pct), step=0.5, min_value=0.0)
+        watch_vol = st.number_input("出来高アラート (25日平均の倍)", value=float(watchlist.rules.vol_multiple), step=0.5, min_value=0.0)
+        watch_news = st.checkbox("新しい適時開示で通知", value=watchlist.rules.news)
+        if st.form_submit_button("保存して監視"):
+            watchlist.configure(parse_codes(watch_text), AlertRules(watch_pct, watch_vol, watch_news))
+            get_scheduler().force("watchlist")
 
 st.sidebar.divider()
 st.sidebar.subheader("🤖 AI分析設定 (第4弾用・準備中)")
 api_key_input = st.sidebar.text_input("Gemini API Key", type="password", help="適時開示のAI要約・スコアリングに使用します")
+presummarize = st.sidebar.checkbox("表示中の銘柄の開示を事前に要約する", value=False, disabled=not api_key_input,
+                                   help="ランキングに表示中の銘柄の適時開示をバックグラウンドで要約し、結果をディスクに保存します")
 
 st.sidebar.divider()
 update_clicked = st.sidebar.button("データ更新 / リロード", type="primary")
-
-if 'ranking_df' not in st.session_state:
-    st.session_state['ranking_df'] = pd.DataFrame()
-if 'last_update' not in st.session_state:
-    st.session_state['last_update'] = None
+show_backtest = st.sidebar.checkbox("📈 翌日成績のバックテストを表示", value=False,
+                                    help="記録したランキング履歴と全銘柄の日足から、翌営業日の寄り・引けまでの騰落率を集計します")
+show_diagnostics = st.sidebar.checkbox("🩺 診断パネルを表示", value=False, help="取得・解析・描画の所要時間やキャッシュ状況を表示します")
+st.sidebar.caption(f"🔄 バックグラウンド自動更新中 ({PHASE_LABELS[market_phase()]})")
 
 # ==========================================
 # UI構築: メイン画面
@@ -462,56 +542,158 @@ for i, key in enumerate(metrics_keys):
         else:
             st.metric(label=key, value="取得中...", delta="-")
 
+# ==========================================
+# ウォッチリスト (一定間隔でこの部分だけ再描画)
+# ==========================================
+@st.fragment(run_every=WATCH_REFRESH_SEC)
+def show_watchlist():
+    monitor = get_watchlist()
+    latest = monitor.alerts()
+    # 初回表示時は過去のアラートを通知し直さない
+    seen = st.session_state.setdefault("watch_alert_seen", latest[0][0] if latest else 0)
+    fresh = [a for a in latest if a[0] > seen]
+    if fresh:
+        st.session_state["watch_alert_seen"] = fresh[0][0]
+        for _, ts, code, name, kind, message in reversed(fresh[:5]):
+            st.toast(f"🔔 {code} {name} [{kind}] {message}")
+
+    phase = market_phase()
+    with st.expander(f"👀 ウォッチリスト ({len(monitor.codes)}銘柄 / {PHASE_LABELS[phase]})", expanded=True):
+        table = monitor.table()
+        st.dataframe(
+            table.style.format({"Price": "{:,.0f}", "Change_Pct": "{:+.2f}%", "Volume": "{:,.0f}",
+                                "Vol_Multiple": "{:.1f}倍", "Updated": lambda t: t.strftime("%H:%M:%S")}, na_rep="-"),
+            use_container_width=True, hide_index=True, height=min(38 + 35 * len(table), 300)
+        )
+        if phase == PHASE_IDLE:
+            st.caption("閑散時間は監視を休止しています。")
+        watch_c1, watch_c2 = st.columns([1, 1])
+        with watch_c1:
+            st.caption("直近のアラート")
+            for _, ts, code, name, kind, message in latest[:10]:
+                st.text(f"{ts.strftime('%H:%M:%S')} {code} {name} [{kind}] {message}")
+        with watch_c2:
+            tick_code = st.selectbox("ティック推移", monitor.codes, key="watch_tick_code")
+            ticks = monitor.ticks(tick_code) if tick_code else None
+            if ticks is not None and not ticks.empty:
+                st.line_chart(ticks.set_index("Time")["Change_Pct"], height=160)
+
+if watchlist.codes:
+    st.markdown("---")
+    show_watchlist()
+
 st.markdown("---")
 st.subheader(f"{display_mode_label} 変動 & 適時開示モニター")
 
 # ★ 安定稼働のため、セクター一覧機能を削除しました。
 
+is_today = search_date == now_jst.date()
+# 上位N件だけで結果が決まる条件 (価格帯・開示・出来高の絞り込みなし、変動率順) なら取得を早期に打ち切れる
+early_stop = (max_items > 0 and min_price == 0 and max_price == 0 and not filter_news
+              and not (topic_text.split() or topic_categories) and SORT_KEYS[sort_label] == "Change_Pct"
+              and not (calc_indicators and min_vol_surge > 0) and not (screen_bottoms_on and min_bottom_score > 0))
+
 if update_clicked:
     with st.spinner(f'{search_date.strftime("%Y/%m/%d")} のデータ収集中...'):
-        tdnet_data = get_tdnet_data(search_date) 
-        raw_df = get_ranking_data_no_cache(mode_key, threshold_percent, max_items)
-        
-        st.session_state['ranking_df'] = raw_df
-        st.session_state['tdnet_data'] = tdnet_data 
-        st.session_state['last_update'] = datetime.now(JST).strftime("%H:%M:%S")
+        if is_today:
+            get_scheduler().refresh("tdnet:today")
+        else:
+            get_tdnet_data(search_date)
+            st.session_state['tdnet_date'] = search_date
+        tdnet_report = get_tdnet_ingester().report(search_date)
+        if tdnet_report.truncated:
+            failed = ", ".join(f"{p}ページ目 ({err})" for p, err in tdnet_report.failed_pages)
+            st.warning(f"TDnetの一部ページを取得できませんでした: {failed}")
+        if news_days > 1:
+            failed_days = get_tdnet_archive().backfill(
+                get_tdnet_ingester(), search_date - timedelta(days=news_days - 1), search_date, today=now_jst.date()
+            )
+            if failed_days:
+                st.warning("TDnetの取得が完了しなかった日: " + ", ".join(d.strftime("%m/%d") for d in failed_days))
+        get_ranking_data_no_cache(mode_key, top_n=max_items if early_stop else 0, threshold=threshold_percent)
+
+# 共有スナップショットをローカルで絞り込む (スライダー操作で再取得しない)
+snapshot = get_snapshot(f"ranking:{mode_key}")
+if news_days > 1:
+    tdnet_data = get_tdnet_window(search_date, news_days)
+elif is_today:
+    tdnet_data = get_snapshot("tdnet:today").data or {}
+else:
+    # 取得済みの日付だけをセッションに持ち、データはプロセス共有のキャッシュから読む
+    tdnet_data = get_tdnet_data(search_date) if st.session_state.get('tdnet_date') == search_date else {}
+news_period_lbl = "本日" if news_days == 1 else f"過去{news_days}日"
+topic_keywords = topic_text.split()
+topic_hits = get_topic_hits(search_date, news_days, topic_keywords, topic_categories) if (topic_keywords or topic_categories) else None
+universe_df = snapshot.data if snapshot.data is not None else pd.DataFrame()
+partial_top_n = universe_df.attrs.get("top_n", 0) if universe_df.attrs.get("stopped_early") else 0
+if partial_top_n and not (early_stop and max_items <= partial_top_n):
+    # 打ち切り済みの一部データでは足りない条件に変わったため、全件をバックグラウンドで取り直す
+    get_scheduler().force(f"ranking:{mode_key}")
+
+if calc_indicators and not universe_df.empty:
+    hit_codes = universe_df.loc[universe_df["Change_Pct"].abs() >= threshold_percent, "Code"]
+    with st.spinner('出来高急増率・移動平均乖離を計算中...'):
+        universe_df = add_indicators(universe_df, get_indicator_cache().get(hit_codes))
+
+bottoms = None
+if screen_bottoms_on:
+    enable_bottom_screen()
+    bottoms_snap = get_scheduler().snapshot("bottoms")
+    bottoms = bottoms_snap.data if bottoms_snap else None
+    if bottoms is not None and not universe_df.empty:
+        universe_df = add_bottom_signals(universe_df, bottoms)
+
+with METRICS.span("ranking.filter"):
+    df_result = filter_ranking(
+        universe_df, threshold=threshold_percent,
+        min_price=min_price, max_price=max_price,
+        news_codes=tdnet_data, news_only=filter_news, top_n=max_items,
+        min_vol_surge=min_vol_surge if calc_indicators else 0.0, sort_by=SORT_KEYS[sort_label],
+        topic_hits=topic_hits, min_bottom_score=min_bottom_score if screen_bottoms_on else 0
+    )
 
-df_result = st.session_state['ranking_df']
-tdnet_data = st.session_state.get('tdnet_data', {})
+if presummarize and api_key_input and not df_result.empty:
+    hit_urls = [n['url'] for code in df_result["Code"] if code in tdnet_data for n in tdnet_data[code] if n['url']]
+    queued = get_summarizer(api_key_input).submit(hit_urls)
+    if queued:
+        st.toast(f"✨ {queued}件の開示をバックグラウンドで要約しています")
 
+# 表示中の上位銘柄の詳細を裏で読み込んでおき、行クリック時はキャッシュから表示する
 if not df_result.empty:
-    if min_price > 0: df_result = df_result[df_result["Price"] >= min_price]
-    if max_price > 0: df_result = df_result[df_result["Price"] <= max_price]
-    
-    df_result["News"] = df_result["Code"].apply(lambda x: "📄あり" if x in tdnet_data else "")
-
-    if filter_news:
-        df_result = df_result[df_result["News"] == "📄あり"]
-
-    if not df_result.empty:
-        df_result = df_result.reindex(df_result["Change_Pct"].abs().sort_values(ascending=False).index)
-    
-    if max_items > 0: df_result = df_result.head(max_items)
+    get_detail_prefetcher().prefetch(df_result["Code"])
 
 col_L, col_R = st.columns([1, 1])
 
 with col_L:
     st.subheader(f"{display_mode_label} ランキング")
-    if st.session_state['last_update']:
-        st.caption(f"最終更新: {st.session_state['last_update']}")
+    st.caption(f"最終更新: {format_age(snapshot)} (全{len(universe_df)}件から絞り込み)")
+    if universe_df.attrs.get("failed_pages"):
+        failed = ", ".join(f"{label} {page}ページ目" for label, page, _ in universe_df.attrs["failed_pages"])
+        st.warning(f"ランキングの一部ページを取得できませんでした: {failed}")
+    if partial_top_n:
+        st.info(f"上位{partial_top_n}件が確定した時点で取得を打ち切りました。全件は次回のバックグラウンド更新で取得します。")
+    if snapshot.error:
+        st.warning(f"直近の自動更新に失敗しました (前回のデータを表示中): {snapshot.error}")
         
     if not df_result.empty:
         limit_txt = f"上位{max_items}件" if max_items > 0 else "全件"
         st.caption(f"閾値: ±{threshold_percent}% | 表示: {limit_txt} | Hits: {len(df_result)}")
         
-        show_df = df_result[["Code", "Name", "Market", "Price", "Change", "Change_Pct", "News", "Label"]]
+        show_cols = ["Code", "Name", "Market", "Price", "Change", "Change_Pct", "News", "Label"]
+        if "Topic" in df_result.columns: show_cols.append("Topic")
+        show_cols += [c for c in INDICATOR_COLUMNS + BOTTOM_COLUMNS if c in df_result.columns]
+        show_df = df_result[show_cols]
         
         event = st.dataframe(
             show_df.style.format({
                 "Change_Pct": "{:.2f}%", 
                 "Price": "{:,.0f}",
-                "Change": "{:+,.0f}" 
-            }).map(
+                "Change": "{:+,.0f}",
+                "Vol_Surge": "{:.1f}倍",
+                "MA25_Dev": "{:+.1f}%",
+                "MA75_Dev": "{:+.1f}%",
+                "Bottom_Score": "{:.0f}"
+            }, na_rep="-").map(
                 lambda x: 'color: red;' if x < 0 else 'color: green;', subset=['Change_Pct', 'Change']
             ),
             use_container_width=True, hide_index=True, on_select="rerun", selection_mode="single-row", height=700
@@ -522,6 +704,28 @@ with col_L:
     else:
         st.warning("該当なし (データ更新を押すか、条件を緩めてください)"); sel_code = None
 
+    if screen_bottoms_on:
+        with st.expander("🔻 底打候補 (東証全銘柄)", expanded=sel_code is None):
+            if bottoms is None:
+                st.info("全銘柄の日足を準備中です。完了するとここに表示されます。")
+            else:
+                if get_scheduler().running("bottoms"):
+                    st.caption("⏳ 全銘柄の日足を更新中です (完了まで前回の判定を表示しています)")
+                st.caption(f"判定: {format_age(bottoms_snap)} | 対象 {len(bottoms)}銘柄 | 日足更新: "
+                           + (get_universe_panel().updated_at() or now_jst).strftime("%m/%d %H:%M"))
+                candidates = top_bottoms(bottoms, max(min_bottom_score, 2), get_universe_panel().codes())
+                cand_cols = ["Code", "Name", "Market", "Close", "Bottom_Score", "Bottom", "Rebound_Pct", "Low52_Days", "Vol_Surge"]
+                cand_event = st.dataframe(
+                    candidates[cand_cols].style.format({
+                        "Close": "{:,.0f}", "Bottom_Score": "{:.0f}", "Rebound_Pct": "{:+.1f}%",
+                        "Low52_Days": "{:.0f}日前", "Vol_Surge": "{:.1f}倍"
+                    }, na_rep="-"),
+                    use_container_width=True, hide_index=True, on_select="rerun", selection_mode="single-row", height=400
+                )
+                if cand_event.selection.rows and sel_code is None:
+                    picked = candidates.iloc[cand_event.selection.rows[0]]
+                    sel_code, sel_name = picked["Code"], picked["Name"]
+
 with col_R:
     d_lbl = search_date.strftime("%Y/%m/%d")
     st.subheader(f"詳細 & 開示 ({d_lbl})")
@@ -532,26 +736,19 @@ with col_R:
         tv_url = f"https://www.tradingview.com/chart/?symbol=TSE:{sel_code}"
         st.markdown(f'<a href="{tv_url}" target="_blank" style="text-decoration:none;"><button style="margin: 5px; padding: 5px 10px; border-radius: 5px; border: 1px solid #ccc;">📈 TradingViewで開く</button></a>', unsafe_allow_html=True)
         
-        show_past_chart = st.checkbox("🕒 過去のチャート（1〜3年前）を比較表示する", value=False)
+        show_past_chart = st.checkbox("🕒 過去の同時期の値動き (最大10年) を重ねて表示する", value=False)
+        render_label = st.radio("描画モード", list(RENDER_MODES), horizontal=True, key="chart_render_mode",
+                                help="長期の足では「間引き」「WebGL」で描画データ量を一定に抑えます")
         
-        display_chart(sel_code, show_past=show_past_chart)
+        display_chart(sel_code, show_past=show_past_chart, render_mode=RENDER_MODES[render_label])
 
         with st.spinner('詳細取得中...'): 
-            ohlc = get_daily_ohlc(sel_code)
-            
-            volume_multiplier = "-"
             try:
-                stock = yf.Ticker(f"{sel_code}.T")
-                hist = stock.history(period="2mo")
-                if len(hist) > 25:
-                    avg_vol_25 = hist['Volume'].iloc[-26:-1].mean()
-                    vol_str = ohlc["Volume"].replace("株", "").replace(",", "").strip()
-                    if vol_str.isdigit() and avg_vol_25 > 0:
-                        latest_vol = float(vol_str)
-                        vol_mult = latest_vol / avg_vol_25
-                        volume_multiplier = f"{vol_mult:.1f} 倍"
-            except:
-                pass
+                detail = get_detail_prefetcher().get(sel_code)
+            except Exception as e:
+                METRICS.error("stock_detail", e)
+                detail = {"ohlc": EMPTY_OHLC, "volume_multiplier": "-"}
+            ohlc, volume_multiplier = detail["ohlc"], detail["volume_multiplier"]
 
         st.markdown("##### 📊 本日の値動き・出来高")
         c1, c2, c3, c4 = st.columns(4)
@@ -581,6 +778,27 @@ with col_R:
                     display_correlation_chart(sel_code, comp_code_input)
             else:
                 st.warning("⚠️ 4桁の数字で入力してください。")
+
+        show_peers = st.toggle("🔎 ピア探索 (ランキング銘柄との相関行列)", value=False)
+        if show_peers:
+            peer_extra = st.text_area("追加ユニバース (セクター・ウォッチリストの銘柄コード)", placeholder="例: 7203, 7267, 7201", key="peer_universe")
+            peer_k = st.slider("表示件数", 3, 20, 5, key="peer_k")
+            peer_codes = tuple(sorted(set([sel_code] + df_result["Code"].tolist() + parse_codes(peer_extra))))
+            with st.spinner(f'{len(peer_codes)}銘柄の相関行列を計算中...'):
+                corr = get_correlation_matrix(peer_codes)
+            top_pos, top_neg = top_peers(corr, sel_code, peer_k)
+            if top_pos.empty and top_neg.empty:
+                st.warning("相関を計算できる銘柄がありませんでした。")
+            else:
+                names = universe_df.set_index("Code")["Name"] if not universe_df.empty else pd.Series(dtype=str)
+                def peer_table(series):
+                    return pd.DataFrame({"Code": series.index, "Name": series.index.map(names).fillna(""), "相関係数": series.values})
+                pc1, pc2 = st.columns(2)
+                pc1.markdown("**🔴 連動しやすい銘柄**")
+                pc1.dataframe(peer_table(top_pos).style.format({"相関係数": "{:.2f}"}), hide_index=True, use_container_width=True)
+                pc2.markdown("**🔵 逆に動きやすい銘柄**")
+                pc2.dataframe(peer_table(top_neg).style.format({"相関係数": "{:.2f}"}), hide_index=True, use_container_width=True)
+                st.caption(f"過去半年の日次リターンで計算 (ユニバース: {len(corr)}銘柄)")
         
         st.divider()
         
@@ -594,8 +812,8 @@ with col_R:
 
         if sel_code in tdnet_data:
             news = tdnet_data[sel_code]
-            st.success(f"本日の適時開示: {len(news)} 件")
-            tabs = st.tabs([f"{n['time']}" for n in news])
+            st.success(f"{news_period_lbl}の適時開示: {len(news)} 件")
+            tabs = st.tabs([f"{n['date'][5:].replace('-', '/')} {n['time']}" if 'date' in n else f"{n['time']}" for n in news])
             for i, t in enumerate(tabs):
                 with t:
                     st.markdown(f"**{news[i]['title']}**")
@@ -603,33 +821,83 @@ with col_R:
                         st.link_button("↗ PDFを開く", news[i]['url'])
                         
                         if api_key_input:
-                            if st.button(f"✨ AIで要約・スコアリング ({i+1}件目)", key=f"ai_btn_{sel_code}_{i}"):
+                            summarizer = get_summarizer(api_key_input)
+                            pdf_url = news[i]['url']
+                            summary = summarizer.cached(pdf_url)
+                            if summary:
+                                st.info(summary)
+                            elif summarizer.status(pdf_url) == "pending":
+                                st.caption("⏳ バックグラウンドで要約中です。しばらくしてから再表示してください。")
+                            elif st.button(f"✨ AIで要約・スコアリング ({i+1}件目)", key=f"ai_btn_{sel_code}_{i}"):
                                 with st.spinner("GeminiがPDFを読んで分析中..."):
                                     try:
-                                        pdf_res = requests.get(news[i]['url'], headers=HEADERS, timeout=10)
-                                        genai.configure(api_key=api_key_input)
-                                        model = genai.GenerativeModel('gemini-1.5-flash')
-                                        prompt = """
-                                        あなたはプロの株式アナリストです。添付された適時開示（PDF）を読み取り、個人投資家向けに分かりやすく分析してください。
-                                        
-                                        ### 📊 決算・開示スコア (5段階評価)
-                                        * サプライズ度: (★1〜5)
-                                        * 業績モメンタム: (★1〜5)
-                                        
-                                        ### 📝 発表の要点 (3行で)
-                                        * ### 💡 ポジティブ材料 / ⚠️ ネガティブ材料
-                                        * ### 🎯 投資家への示唆 (今後の注目ポイント)
-                                        * """
-                                        ai_res = model.generate_content([
-                                            {"mime_type": "application/pdf", "data": pdf_res.content},
-                                            prompt
-                                        ])
-                                        st.info(ai_res.text)
+                                        st.info(summarizer.summarize(pdf_url))
                                     except Exception as e:
+                                        METRICS.error("summary", e)
                                         st.error(f"AI分析中にエラーが発生しました。APIキーが正しいか確認してください。({e})")
                         
                         display_pdf(news[i]['url'])
         else:
-            st.info("本日の適時開示はありません")
+            st.info(f"{news_period_lbl}の適時開示はありません")
     else:
-        st.info("👈 銘柄を選択")
\ No newline at end of file
+        st.info("👈 銘柄を選択")
+
+# ==========================================
+# バックテスト: ランキング履歴 × 翌営業日の値動き
+# ==========================================
+if show_backtest:
+    st.markdown("---")
+    st.subheader("📈 翌日成績 (ランキング履歴のバックテスト)")
+    history_days = get_ranking_history().days()
+    panel_frames = get_universe_panel().frames()
+    if not history_days:
+        st.info("ランキング履歴がまだありません。バックグラウンド更新のたびに記録されます。")
+    elif not panel_frames:
+        st.info("全銘柄の日足がまだありません。サイドバーの「底打スクリーニング」を有効にすると取得します。")
+    else:
+        bt_c1, bt_c2, bt_c3 = st.columns([2, 2, 1])
+        bt_range = bt_c1.date_input("期間", value=(history_days[0], history_days[-1]),
+                                    min_value=history_days[0], max_value=history_days[-1])
+        bt_thresholds = bt_c2.multiselect("変動率 閾値 (%)", [2.0, 3.0, 5.0, 7.0, 10.0, 15.0, 20.0],
+                                          default=list(DEFAULT_THRESHOLDS))
+        bt_entry = bt_c3.radio("基準価格", ["last", "first"], horizontal=True,
+                               format_func=lambda e: {"last": "当日最後", "first": "初出時"}[e])
+        if len(bt_range) == 2 and bt_thresholds:
+            history_df = get_ranking_history().load(bt_range[0], bt_range[1], [mode_key])
+            stats = run_backtest(history_df, panel_frames, bt_thresholds, entry=bt_entry)
+            st.caption(f"{display_mode_label} | スナップショット {history_df['Fetched_At'].nunique()}件 | "
+                       "騰落率はスナップショットの価格から翌営業日の始値・終値まで (%)、Win は上昇した割合")
+            fmt = {f"{c}_{s}": "{:+.2f}" if s == "Mean" else "{:.1f}" for c in RETURN_COLUMNS for s in ("Mean", "Std", "Win")}
+            st.dataframe(stats.style.format({"Threshold": "±{:.0f}%", **fmt}, na_rep="-"),
+                         use_container_width=True, hide_index=True)
+
+# ==========================================
+# 診断パネル (計測結果)
+# ==========================================
+if show_diagnostics:
+    with st.sidebar.expander("🩺 診断", expanded=True):
+        st.caption("ステージ別の所要時間 (プロセス起動以降)")
+        st.dataframe(
+            METRICS.stages().style.format({"Total_s": "{:.2f}", "Mean_ms": "{:.1f}", "P95_ms": "{:.1f}", "Last_ms": "{:.1f}"}),
+            use_container_width=True, hide_index=True
+        )
+        st.caption("カウンタ")
+        st.dataframe(pd.Series(METRICS.counters(), name="Value", dtype=float).rename_axis("Counter").reset_index(),
+                     use_container_width=True, hide_index=True)
+        st.caption(f"共有キャッシュ ({RESULT_CACHE.used_bytes / 1024 / 1024:.1f} / {RESULT_CACHE.max_bytes / 1024 / 1024:.0f} MB)")
+        st.dataframe(RESULT_CACHE.stats().style.format({"MB": "{:.2f}", "Hit_Rate": "{:.0f}%"}, na_rep="-"),
+                     use_container_width=True, hide_index=True)
+        st.caption("バックグラウンド更新")
+        st.dataframe(pd.DataFrame([
+            {"Job": key, "Version": snap.version, "Elapsed_s": round(snap.elapsed, 2), "Age": format_age(snap), "Error": snap.error or ""}
+            for key, snap in sorted(get_scheduler().snapshots().items())
+        ]), use_container_width=True, hide_index=True)
+        open_circuits = get_page_fetcher().open_circuits()
+        if open_circuits:
+            st.warning("接続を一時停止中のホスト: " + ", ".join(open_circuits))
+        recent_errors = METRICS.errors()
+        if recent_errors:
+            st.caption("直近のエラー")
+            for ts, stage, msg in recent_errors[:10]:
+                st.text(f"{ts.strftime('%H:%M:%S')} [{stage}] {msg}")
+METRICS.flush()
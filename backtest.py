@@ -0,0 +1,155 @@
+"""
+ランキング履歴 (ranking_history.py) と全銘柄の日足パネル (universe.py) を突き合わせる翌日成績のバックテスト。
+
+    python backtest.py --mode PTS --thresholds 3 5 10 --start 2026-09-01
+
+スナップショットの価格で買い (急落は反発狙いとしても同じ向きで計算)、翌営業日の寄り・引けまでの騰落率を、
+変動率の閾値 × 急騰/急落 × 適時開示の有無 の組み合わせごとに集計する。
+各スナップショットは取得時刻からその時点のランキングが示すセッション (営業日) に割り当てる
+(例: 深夜0時過ぎ・翌朝の PTS 夜間ランキングは前営業日の夜間セッション)。
+日足は調整後価格のため、配当落ち・分割の直前のスナップショットは騰落率がずれることがある。
+"""
+import argparse
+import sys
+from datetime import date, time as dt_time
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+RETURN_COLUMNS = {"Ret_Open": "翌寄り", "Ret_Close": "翌引け", "Ret_Intraday": "寄り→引け"}
+DEFAULT_THRESHOLDS = (3.0, 5.0, 7.0, 10.0, 15.0)
+DEFAULT_GROUPS = ("Mode", "Label", "News")
+# 各ランキングが当日のセッションに切り替わる時刻 (これより前は前営業日のランキングが表示されている)
+SESSION_OPEN = {"PTS": dt_time(17, 0), "PTS_DAY": dt_time(8, 20), "Daytime": dt_time(9, 0)}
+
+
+def session_dates(fetched_at, modes, trading_days):
+    """
+    取得時刻 (tz 付き) とモードから、そのスナップショットが属するセッションの日付 (tz なしの 0 時) を求める。
+    SESSION_OPEN より前の取得は前日扱いにし、土日は金曜、日足の範囲内で足が無い日 (祝日) は直前の営業日に寄せる。
+    """
+    local = fetched_at.dt.tz_convert("Asia/Tokyo").dt.tz_localize(None).to_numpy(dtype="datetime64[ms]")
+    modes = modes.astype("category")
+    offsets = np.array([pd.Timedelta(hours=SESSION_OPEN[m].hour, minutes=SESSION_OPEN[m].minute).value // 10**6
+                        if m in SESSION_OPEN else 0 for m in modes.cat.categories] + [0], dtype="int64")
+    day = (local - offsets[modes.cat.codes.to_numpy()].astype("timedelta64[ms]")).astype("datetime64[D]")
+    # 1970-01-01 は木曜 (weekday=3)
+    weekday = (day.astype("int64") + 3) % 7
+    day = day - np.maximum(weekday - 4, 0).astype("timedelta64[D]")
+    day = day.astype("datetime64[ns]")
+    if len(trading_days):
+        known = trading_days.to_numpy(dtype="datetime64[ns]")
+        pos = known.searchsorted(day, side="right") - 1
+        holiday = (day <= known[-1]) & (pos >= 0)
+        day = np.where(holiday, known[np.maximum(pos, 0)], day)
+    return pd.Series(day, index=fetched_at.index)
+
+
+def next_day_events(history, frames, entry="last"):
+    """
+    スナップショット履歴を (Mode, セッション日, 銘柄) ごとの1イベントにまとめ、翌営業日の始値・終値との騰落率 (%) を付ける。
+    セッション日は session_dates() で取得時刻から求める。
+    entry="last" はその日の最後のスナップショット、"first" は最初に現れた時点の価格を使う。
+    News はその日のいずれかのスナップショットで開示ありなら True。
+    """
+    if history.empty or not frames:
+        return pd.DataFrame(columns=["Mode", "Date", "Code", "Label", "News", "Change_Pct", "Price",
+                                     "Next_Date", *RETURN_COLUMNS])
+
+    with METRICS.span("backtest.events", entry=entry):
+        dates = frames["Close"].index
+        df = history.sort_values("Fetched_At", kind="stable")
+        df = df.assign(Date=session_dates(df["Fetched_At"], df["Mode"], dates))
+        keys = ["Mode", "Date", "Code"]
+        grouped = df.groupby(keys, observed=True, sort=False)
+        events = (grouped.last() if entry == "last" else grouped.first())[["Label", "Change_Pct", "Price"]]
+        events["News"] = grouped["News"].any()
+        events = events.reset_index()
+
+        pos = dates.searchsorted(events["Date"].to_numpy(), side="right")
+        col = frames["Close"].columns.get_indexer(events["Code"].astype(str))
+        ok = (pos < len(dates)) & (col >= 0)
+        pos, col = np.where(ok, pos, 0), np.where(ok, col, 0)
+
+        def pick(field):
+            return np.where(ok, frames[field].to_numpy(dtype=float)[pos, col], np.nan)
+
+        next_open, next_close = pick("Open"), pick("Close")
+        price = events["Price"].to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            events["Ret_Open"] = (next_open / price - 1) * 100
+            events["Ret_Close"] = (next_close / price - 1) * 100
+            events["Ret_Intraday"] = (next_close / next_open - 1) * 100
+        events["Next_Date"] = pd.Series(dates[pos], index=events.index).where(ok)
+    return events
+
+
+def grid_stats(events, thresholds=DEFAULT_THRESHOLDS, groups=DEFAULT_GROUPS):
+    """
+    閾値ごとの |変動率| >= 閾値 の条件を 銘柄×閾値 の行列にし、グループごとに行列積で件数・平均・標準偏差・勝率を求める。
+    N は翌引けの騰落率が計算できたイベント数、*_Win は騰落率が正だった割合 (%)。
+    """
+    thresholds = np.asarray(sorted(thresholds), dtype=float)
+    groups = list(groups)
+    columns = groups + ["Threshold", "N"] + [f"{c}_{s}" for c in RETURN_COLUMNS for s in ("Mean", "Std", "Win")]
+    if events.empty:
+        return pd.DataFrame(columns=columns)
+
+    with METRICS.span("backtest.grid", thresholds=len(thresholds)):
+        hit = (np.abs(events["Change_Pct"].to_numpy(dtype=float))[:, None] >= thresholds[None, :]).astype(float)
+        returns = {c: events[c].to_numpy(dtype=float) for c in RETURN_COLUMNS}
+        blocks = []
+        for key, idx in events.groupby(groups, observed=True).indices.items():
+            m = hit[idx]
+            block = {g: [v] * len(thresholds) for g, v in zip(groups, key if isinstance(key, tuple) else (key,))}
+            block["Threshold"] = thresholds
+            for c, r in returns.items():
+                r = r[idx]
+                valid = ~np.isnan(r)
+                r = np.where(valid, r, 0.0)
+                n = m.T @ valid
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    mean = (m.T @ r) / n
+                    block[f"{c}_Mean"] = mean
+                    block[f"{c}_Std"] = np.sqrt(np.maximum((m.T @ (r * r)) / n - mean * mean, 0.0))
+                    block[f"{c}_Win"] = (m.T @ (r > 0)) / n * 100
+                if c == "Ret_Close":
+                    block["N"] = n.astype(int)
+            blocks.append(pd.DataFrame(block))
+        out = pd.concat(blocks, ignore_index=True)[columns]
+    return out[out["N"] > 0].reset_index(drop=True)
+
+
+def run_backtest(history, frames, thresholds=DEFAULT_THRESHOLDS, groups=DEFAULT_GROUPS, entry="last"):
+    return grid_stats(next_day_events(history, frames, entry=entry), thresholds, groups)
+
+
+def main(argv=None):
+    from ranking_history import RankingHistory
+    from universe import UniversePanel
+
+    ap = argparse.ArgumentParser(description="ランキング履歴の翌日成績バックテスト")
+    ap.add_argument("--mode", action="append", help="対象モード (複数指定可、既定: すべて)")
+    ap.add_argument("--start", type=date.fromisoformat)
+    ap.add_argument("--end", type=date.fromisoformat)
+    ap.add_argument("--thresholds", type=float, nargs="+", default=list(DEFAULT_THRESHOLDS))
+    ap.add_argument("--entry", choices=("last", "first"), default="last")
+    ap.add_argument("--no-news-split", action="store_true", help="適時開示の有無で分けない")
+    ap.add_argument("-o", "--output", help="CSV の出力先 (既定: 標準出力)")
+    args = ap.parse_args(argv)
+
+    history = RankingHistory().load(args.start, args.end, args.mode)
+    frames = UniversePanel().frames()
+    if not frames:
+        raise SystemExit("全銘柄の日足がありません (scan.py --bottoms か画面の底打スクリーニングで取得してください)")
+    groups = [g for g in DEFAULT_GROUPS if not (args.no_news_split and g == "News")]
+    result = run_backtest(history, frames, args.thresholds, groups, args.entry)
+    result.to_csv(args.output or sys.stdout, index=False, float_format="%.3f")
+    print(f"スナップショット {history['Fetched_At'].nunique() if not history.empty else 0}件 / 行 {len(history)}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+保存済みフィクスチャを使ったHTML解析ベンチマーク。
+
+従来経路 (apparent_encoding による文字コード判定 + html.parser で全体を構築) と
+新経路 (既知エンコーディング + 対象テーブルのみ構築) の1ページあたり解析時間を比較する。
+
+    python bench/bench_parse.py [-n 回数]
+"""
+import argparse
+import os
+import sys
+import time
+
+from requests.models import Response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import decode_response, get_parser  # noqa: E402
+from tdnet import TDNET_ROOT_URL  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+CASES = [
+    ("ranking", "kabutan_pts_night_increase.html", "https://kabutan.jp/warning/pts_night_price_increase",
+     lambda p, html: p.ranking(html, "急騰", 0.0)),
+    ("ranking", "kabutan_pts_night_decrease.html", "https://kabutan.jp/warning/pts_night_price_decrease",
+     lambda p, html: p.ranking(html, "急落", 0.0)),
+    ("tdnet", "tdnet_I_list_001.html", "https://www.release.tdnet.info/inbs/I_list_001_20261016.html",
+     lambda p, html: p.tdnet(html, TDNET_ROOT_URL)),
+    ("detail", "kabutan_stock_7203.html", "https://kabutan.jp/stock/?code=7203",
+     lambda p, html: p.stock_detail(html)),
+]
+
+
+def make_response(body, url):
+    res = Response()
+    res._content = body
+    res.status_code = 200
+    res.url = url
+    return res
+
+
+def legacy_decode(res):
+    res.encoding = res.apparent_encoding
+    return res.text
+
+
+def same_result(a, b):
+    if hasattr(a, "equals"):
+        return a.equals(b)
+    return a == b
+
+
+def time_path(body, url, decode, parser, parse, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        result = parse(parser, decode(make_response(body, url)))
+    return (time.perf_counter() - start) / n * 1000, result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20, help="1ケースあたりの反復回数")
+    args = ap.parse_args()
+
+    old_parser = get_parser("bs4")
+    new_parser = get_parser("fast")
+    print(f"{'page':<36} {'old ms':>9} {'new ms':>9} {'speedup':>8}")
+    for kind, fname, url, parse in CASES:
+        with open(os.path.join(FIXTURE_DIR, fname), "rb") as f:
+            body = f.read()
+        old_ms, old_rows = time_path(body, url, legacy_decode, old_parser, parse, args.n)
+        new_ms, new_rows = time_path(body, url, decode_response, new_parser, parse, args.n)
+        if not same_result(old_rows, new_rows):
+            raise SystemExit(f"{fname}: 新旧の解析結果が一致しません")
+        print(f"{fname:<36} {old_ms:>9.2f} {new_ms:>9.2f} {old_ms / new_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
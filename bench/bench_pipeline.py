@@ -0,0 +1,213 @@
+"""
+ローカル代替サーバ (bench/stand_in.py) を使った更新パイプライン全体のベンチマーク。
+
+ステージごと (取得・解析・DataFrame 構築・絞り込み/並べ替え・チャート図の構築) と、
+「データ更新」ボタン1回分に相当する一連の処理 (end_to_end) の所要時間を計測し、JSON に保存する。
+
+    python bench/bench_pipeline.py [-n 回数] [--latency-ms 50] [--label v2]
+    python bench/bench_pipeline.py --compare bench/results/pipeline_v1.json
+
+--compare を指定すると、保存済みの結果と中央値を比較し、--tolerance を超えて遅くなったステージを表示する。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from io import StringIO
+
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from charts import RENDER_MODES, build_candle_figure  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from ohlcv_store import OhlcvStore  # noqa: E402
+from parsers import decode_response, parse_stock_detail  # noqa: E402
+from ranking import filter_ranking  # noqa: E402
+from scraper import (RANKING_TARGETS, PageFetcher, ParsedPageCache, build_ranking_frame,  # noqa: E402
+                     fetch_ranking, parse_ranking_page, ranking_page_url)
+from stand_in import StandInServer  # noqa: E402
+from tdnet import TdnetIngester  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+MODE = "PTS"
+TDNET_DATE = date(2026, 10, 16)
+CHART_RANGE = (date(2025, 10, 16), date(2026, 10, 16))
+
+
+def history_loader(base_url, fetcher):
+    """OhlcvStore の loader を代替サーバの CSV 履歴で置き換える。"""
+    def load(symbol, start=None):
+        res = fetcher.get(f"{base_url}/history/{symbol}.csv")
+        df = pd.read_csv(StringIO(res.text), index_col="Date")
+        df.index = pd.to_datetime(df.index, utc=True).tz_convert("Asia/Tokyo")
+        if start is not None:
+            df = df[df.index >= start]
+        return df
+    return load
+
+
+class Timer:
+    def __init__(self):
+        self.samples = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.setdefault(stage, []).append((time.perf_counter() - started) * 1000)
+        return result
+
+    def summary(self):
+        return {
+            stage: {"n": len(v), "median_ms": statistics.median(v), "min_ms": min(v), "max_ms": max(v)}
+            for stage, v in self.samples.items()
+        }
+
+
+def fetch_pages(fetcher, base_url, max_pages):
+    """ranking ステージと同じ URL を取得だけ行う (ターゲットごとに並列、ページは順に)。"""
+    targets = [(base_url + path, label) for path, label in RANKING_TARGETS[MODE]]
+
+    def crawl(target_url, label):
+        return [(label, fetcher.get(ranking_page_url(target_url, page))) for page in range(1, max_pages + 1)]
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        return list(pool.map(lambda t: crawl(*t), targets))
+
+
+def parse_pages(pages):
+    results = []
+    for target_pages in pages:
+        frames = []
+        for label, res in target_pages:
+            frame = parse_ranking_page(decode_response(res), label)
+            if frame is None:
+                break
+            frames.append(frame)
+        results.append(frames)
+    return results
+
+
+def run_once(timer, base_url, fetcher, args):
+    # --- ステージ別 ---
+    pages = timer.run("fetch", fetch_pages, fetcher, base_url, args.ranking_pages + 1)
+    parsed = timer.run("parse", parse_pages, pages)
+    df = timer.run("dataframe", build_ranking_frame, parsed)
+
+    ingester = TdnetIngester(fetcher=fetcher, list_url=base_url + "/inbs/I_list_{}_{}.html",
+                             root_url=base_url + "/inbs/")
+    tdnet_map = timer.run("tdnet", lambda: dict(ingester.refresh(TDNET_DATE).disclosure_map))
+    timer.run("filter_sort", filter_ranking, df, threshold=3.0, news_codes=tdnet_map, top_n=50,
+              sort_by="Change_Pct")
+
+    detail = timer.run("detail", lambda: parse_stock_detail(decode_response(fetcher.get(f"{base_url}/stock/?code=7203"))))
+    if detail["Close"] == "-":
+        raise SystemExit("個別銘柄ページの解析に失敗しました")
+
+    with tempfile.TemporaryDirectory() as root:
+        store = OhlcvStore(root=root, loader=history_loader(base_url, fetcher))
+        bars = timer.run("history", store.bars, "7203.T", "1d")
+        for mode in RENDER_MODES.values():
+            timer.run(f"figure:{mode}", build_candle_figure, bars, "bench", 25, 75, "25日", "75日", "1d",
+                      x_range=list(CHART_RANGE), render_mode=mode)
+
+    # --- 一連の処理 (データ更新1回分) ---
+    def end_to_end():
+        # 解析結果のキャッシュもプロセス共有のものを使うと2回目以降の解析が計測されないため、毎回空にする
+        ranking = fetch_ranking(MODE, 0.0, 0, fetcher=fetcher, base_url=base_url, page_cache=ParsedPageCache())
+        e2e_ingester = TdnetIngester(fetcher=fetcher, list_url=base_url + "/inbs/I_list_{}_{}.html",
+                                     root_url=base_url + "/inbs/")
+        news = dict(e2e_ingester.refresh(TDNET_DATE).disclosure_map)
+        result = filter_ranking(ranking, threshold=3.0, news_codes=news, top_n=50)
+        parse_stock_detail(decode_response(fetcher.get(f"{base_url}/stock/?code={result['Code'].iloc[0]}")))
+        with tempfile.TemporaryDirectory() as e2e_root:
+            e2e_store = OhlcvStore(root=e2e_root, loader=history_loader(base_url, fetcher))
+            build_candle_figure(e2e_store.bars("7203.T", "1d"), "bench", 25, 75, "25日", "75日", "1d",
+                                x_range=list(CHART_RANGE))
+        return len(ranking)
+
+    return len(df), timer.run("end_to_end", end_to_end)
+
+
+def compare(current, baseline, tolerance):
+    print(f"\n比較対象: {baseline['label']} ({baseline['created_at']})")
+    print(f"{'stage':<22} {'base ms':>10} {'now ms':>10} {'ratio':>7}")
+    regressions = []
+    for stage, now in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base:
+            print(f"{stage:<22} {'-':>10} {now['median_ms']:>10.2f} {'new':>7}")
+            continue
+        ratio = now["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        flag = " !" if ratio > 1 + tolerance else ""
+        if flag:
+            regressions.append(stage)
+        print(f"{stage:<22} {base['median_ms']:>10.2f} {now['median_ms']:>10.2f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=5, help="反復回数 (各ステージの中央値を記録)")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="代替サーバの応答遅延")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--ranking-pages", type=int, default=5, help="ターゲットあたりのランキングページ数")
+    ap.add_argument("--tdnet-pages", type=int, default=3)
+    ap.add_argument("--rate", type=float, default=0.0, help="ホストあたりのリクエスト/秒 (0 で無制限)")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--label", default=datetime.now().strftime("%Y%m%d_%H%M%S"))
+    ap.add_argument("--out", help="結果の保存先 (既定: bench/results/pipeline_<label>.json)")
+    ap.add_argument("--compare", help="比較する保存済みの結果 JSON")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="この割合を超えて遅くなったら回帰とみなす")
+    args = ap.parse_args()
+
+    timer = Timer()
+    with StandInServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                       ranking_pages=args.ranking_pages, tdnet_pages=args.tdnet_pages) as server:
+        # 応答キャッシュを使うと2回目以降の取得が計測されないため無効にする
+        fetcher = PageFetcher(rate_per_sec=args.rate, max_workers=args.workers, cache_ttl=0)
+        # 1回目は import やコネクション確立を含むため計測から外す
+        run_once(Timer(), server.url, fetcher, args)
+        for _ in range(args.n):
+            rows, e2e_rows = run_once(timer, server.url, fetcher, args)
+        fetcher.close()
+        requests_served, bytes_served = server.requests, server.bytes_sent
+
+    result = {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "params": {k: getattr(args, k) for k in ("n", "latency_ms", "jitter_ms", "ranking_pages", "tdnet_pages", "rate", "workers")},
+        "rows": {"ranking": rows, "end_to_end": e2e_rows},
+        "server": {"requests": requests_served, "bytes": bytes_served},
+        "stages": timer.summary(),
+        "instrumentation": METRICS.stages().to_dict(orient="records"),
+    }
+
+    print(f"{'stage':<22} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<22} {s['median_ms']:>10.2f} {s['min_ms']:>10.2f} {s['max_ms']:>10.2f}")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline_{args.label}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n保存しました: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(f"回帰: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+ローカル代替サーバ (bench/stand_in.py) の代替モデルを使った開示要約のベンチマーク。
+
+SUMMARY_MODEL_ENDPOINT を代替サーバの /model に向けて make_model() から HttpModel を作り、
+Summarizer の事前要約 (ワーカープール) と要約キャッシュ (URL / 内容ハッシュ) を通して計測する。
+
+    python bench/bench_summary.py [--docs 12] [--copies 4] [--workers 3] [--model-latency-ms 300]
+
+  cold:  未要約の全URLを submit() し、すべて完了するまで (同じ内容の別URLは内容ハッシュで再利用)
+  warm:  同じURLをもう一度 summarize() (すべてURLキャッシュから返る)
+モデルの呼び出し回数が異なる内容の数と一致しない場合や、要約に失敗した場合は終了コード 1 で終わる。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from metrics import METRICS  # noqa: E402
+from scraper import PageFetcher  # noqa: E402
+from stand_in import StandInServer  # noqa: E402
+from summarizer import HttpModel, Summarizer, SummaryCache, make_model  # noqa: E402
+
+
+def wait_all(summarizer, urls, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        states = [summarizer.status(url) for url in urls]
+        if "pending" not in states:
+            return states
+        time.sleep(0.02)
+    raise SystemExit("要約が時間内に終わりませんでした")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=12, help="内容の異なるPDFの数")
+    ap.add_argument("--copies", type=int, default=4, help="別URLで同じ内容を公開しているPDFの数")
+    ap.add_argument("--workers", type=int, default=3)
+    ap.add_argument("--latency-ms", type=float, default=20.0, help="PDF取得の応答遅延")
+    ap.add_argument("--model-latency-ms", type=float, default=300.0, help="代替モデルの応答遅延")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    args = ap.parse_args()
+
+    with StandInServer(latency_ms=args.latency_ms, model_latency_ms=args.model_latency_ms) as server, \
+            tempfile.TemporaryDirectory() as root:
+        os.environ["SUMMARY_MODEL_ENDPOINT"] = f"{server.url}/model"
+        model = make_model(api_key=None)
+        if not isinstance(model, HttpModel):
+            raise SystemExit("SUMMARY_MODEL_ENDPOINT が make_model() に反映されていません")
+
+        urls = [f"{server.url}/pdf/doc{i:03d}.pdf" for i in range(args.docs)]
+        urls += [f"{server.url}/pdf/doc{i:03d}.pdf?copy=1" for i in range(min(args.copies, args.docs))]
+        fetcher = PageFetcher(rate_per_sec=0, max_workers=args.workers, cache_ttl=0)
+        summarizer = Summarizer(model, cache=SummaryCache(root), fetch=fetcher.get, max_workers=args.workers)
+
+        started = time.perf_counter()
+        # 複製側は元のPDFの要約が保存された後に投入し、内容ハッシュでの再利用を確かめる
+        queued = summarizer.submit(urls[:args.docs])
+        wait_all(summarizer, urls[:args.docs], args.timeout)
+        queued += summarizer.submit(urls[args.docs:])
+        states = wait_all(summarizer, urls, args.timeout)
+        cold_ms = (time.perf_counter() - started) * 1000
+        cold_calls = server.model_calls
+
+        started = time.perf_counter()
+        texts = [summarizer.summarize(url) for url in urls]
+        warm_ms = (time.perf_counter() - started) * 1000
+        warm_calls = server.model_calls - cold_calls
+        fetcher.close()
+
+    errors = [(url, summarizer.error(url)) for url, state in zip(urls, states) if state != "done"]
+    serial_ms = args.docs * (args.model_latency_ms + args.latency_ms)
+    print(f"{'stage':<8} {'ms':>10} {'model calls':>12}")
+    print(f"{'cold':<8} {cold_ms:>10.1f} {cold_calls:>12}   (直列の目安 {serial_ms:.0f} ms, 投入 {queued}件)")
+    print(f"{'warm':<8} {warm_ms:>10.1f} {warm_calls:>12}")
+    stages = METRICS.stages()
+    print(stages[stages["Stage"].str.startswith("summary")].to_string(index=False))
+
+    failures = []
+    if errors:
+        failures.append(f"要約失敗 {len(errors)}件: {errors[0]}")
+    if cold_calls != args.docs:
+        failures.append(f"モデル呼び出し {cold_calls}回 (期待値 {args.docs}回)")
+    if warm_calls:
+        failures.append(f"キャッシュ済みの再要約でモデルを {warm_calls}回呼び出しました")
+    if len(set(texts)) != args.docs:
+        failures.append(f"異なる要約が {len(set(texts))}件 (期待値 {args.docs}件)")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+保存済みフィクスチャを返すローカル代替サーバ (株探ランキング・個別銘柄 / TDnet一覧 / 日足履歴 / 開示PDF / 要約モデル)。
+
+    python bench/stand_in.py [--port 8765] [--latency-ms 50]
+
+各レスポンスの前に latency_ms (+ 0〜jitter_ms) だけ待機し、実サイトの往復遅延を模擬する。
+ランキングは ranking_pages ページ、TDnet は tdnet_pages ページまで返し、それ以降は表なし / 404 を返す。
+/pdf/<名前>.pdf は名前ごとに決まった内容のダミーPDF (?copy= を付けても同じ内容) を返し、
+POST /model は summarizer.HttpModel の代替モデルとして model_latency_ms 待ってから要約文を返す。
+"""
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+EMPTY_PAGE = "<html><body><p>該当する銘柄はありません</p></body></html>"
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), "rb") as f:
+        return f.read()
+
+
+def shift_codes(html, page):
+    """2ページ目以降は銘柄コードをずらし、ページごとに別銘柄が並ぶようにする。"""
+    if page <= 1:
+        return html
+
+    def shift(code):
+        return str(1000 + (int(code) - 1000 + 100 * (page - 1)) % 9000)
+
+    html = re.sub(r'code=(\d{4})', lambda m: "code=" + shift(m.group(1)), html)
+    return re.sub(r'">(\d{4})</a></td>', lambda m: f'">{shift(m.group(1))}</a></td>', html)
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency_ms + (random.uniform(0, server.jitter_ms) if server.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+        with server.lock:
+            server.requests += 1
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith("/warning"):
+            page = int(query.get("page", ["1"])[0])
+            if page > server.ranking_pages:
+                return self._send(EMPTY_PAGE.encode("utf-8"))
+            decrease = "decrease" in url.path or query.get("mode") == ["2_2"]
+            html = server.fixtures["ranking_down" if decrease else "ranking_up"]
+            return self._send(shift_codes(html, page).encode("utf-8"))
+        m = re.match(r"/inbs/I_list_(\d{3})_\d{8}\.html$", url.path)
+        if m:
+            if int(m.group(1)) > server.tdnet_pages:
+                return self._send(b"not found", status=404)
+            return self._send(server.fixtures["tdnet"])
+        if url.path.startswith("/stock"):
+            return self._send(server.fixtures["detail"])
+        if url.path.startswith("/history/"):
+            return self._send(server.fixtures["history"], content_type="text/csv; charset=utf-8")
+        m = re.match(r"/pdf/([\w-]+)\.pdf$", url.path)
+        if m:
+            return self._send(dummy_pdf(m.group(1)), content_type="application/pdf")
+        return self._send(b"not found", status=404)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if urlsplit(self.path).path != "/model":
+            return self._send(b"not found", status=404)
+        try:
+            payload = json.loads(body)
+            pdf = base64.b64decode(payload["pdf_base64"], validate=True)
+            prompt = payload["prompt"]
+        except (ValueError, KeyError, TypeError):
+            return self._send(b"bad request", status=400)
+        if server.model_latency_ms:
+            time.sleep(server.model_latency_ms / 1000)
+        with server.lock:
+            server.requests += 1
+            server.model_calls += 1
+        text = f"### 📝 発表の要点 (stand-in)\n* PDF {len(pdf)} bytes / sha256 {hashlib.sha256(pdf).hexdigest()[:12]}\n* prompt {len(prompt)} chars"
+        return self._send(json.dumps({"text": text}, ensure_ascii=False).encode("utf-8"),
+                          content_type="application/json; charset=utf-8")
+
+    def _send(self, body, status=200, content_type="text/html; charset=utf-8"):
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def dummy_pdf(name):
+    """名前ごとに決まった内容の小さな PDF 風バイト列。"""
+    return b"%PDF-1.4\n% stand-in " + name.encode("utf-8") + b"\n" + hashlib.sha256(name.encode("utf-8")).digest() * 64 + b"\n%%EOF\n"
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """with 文で使うとバックグラウンドスレッドで起動し、終了時に停止する。port=0 なら空きポートを使う。"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=0.0, jitter_ms=0.0, ranking_pages=5, tdnet_pages=3, model_latency_ms=0.0):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.latency_ms = latency_ms
+        self.model_latency_ms = model_latency_ms
+        self.jitter_ms = jitter_ms
+        self.ranking_pages = ranking_pages
+        self.tdnet_pages = tdnet_pages
+        self.fixtures = {
+            "ranking_up": read_fixture("kabutan_pts_night_increase.html").decode("utf-8"),
+            "ranking_down": read_fixture("kabutan_pts_night_decrease.html").decode("utf-8"),
+            "tdnet": read_fixture("tdnet_I_list_001.html"),
+            "detail": read_fixture("kabutan_stock_7203.html"),
+            "history": read_fixture("history_7203.csv"),
+        }
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.model_calls = 0
+        self.bytes_sent = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--ranking-pages", type=int, default=5)
+    ap.add_argument("--tdnet-pages", type=int, default=3)
+    ap.add_argument("--model-latency-ms", type=float, default=500.0)
+    args = ap.parse_args()
+    server = StandInServer(args.port, args.latency_ms, args.jitter_ms, args.ranking_pages, args.tdnet_pages,
+                           args.model_latency_ms)
+    print(f"serving fixtures on {server.url} (SUMMARY_MODEL_ENDPOINT={server.url}/model)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
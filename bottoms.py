@@ -0,0 +1,115 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from indicators import compute_indicators
+from metrics import METRICS
+
+# ==========================================
+# 底打ちスクリーニング (全銘柄パネルに対する一括判定)
+# ==========================================
+LOW_WINDOW_BARS = 245    # 52週安値の判定本数
+RECENT_LOW_BARS = 60     # この本数以内に52週安値を付けた銘柄を対象にする
+PULLBACK_BARS = 10       # 直近の押し安値を見る本数
+TURN_BARS = 5            # 移動平均が下向き→上向きに転じたとみなす本数
+SURGE_RATIO = 2.0
+MIN_BARS = 80
+
+BOTTOM_SIGNALS = {
+    "MA25_Turn": "25日線↑",
+    "MA75_Turn": "75日線↑",
+    "Higher_Low": "安値切り上げ",
+    "Vol_Spike": "出来高急増",
+}
+BOTTOM_COLUMNS = ["Bottom_Score", "Bottom"]
+
+
+def rolling_mean(values, n):
+    """日付×銘柄の配列の n 本移動平均 (累積和で全銘柄を一度に計算)。窓に欠損を含む位置は NaN。"""
+    valid = ~np.isnan(values)
+    csum = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    count = np.cumsum(valid, axis=0)
+    out = np.full(values.shape, np.nan)
+    if len(values) >= n:
+        total = csum[n - 1:] - np.vstack([np.zeros((1, values.shape[1])), csum[:-n]])
+        full = (count[n - 1:] - np.vstack([np.zeros((1, values.shape[1]), dtype=int), count[:-n]])) == n
+        out[n - 1:] = np.where(full, total / n, np.nan)
+    return out
+
+
+def _turned_up(ma, turn_bars):
+    """直近で上向き、かつ直前 turn_bars 本のうちに横ばい・下向きの日がある (= 最近上向きに転じた)。"""
+    slope = np.diff(ma[-(turn_bars + 2):], axis=0)
+    return (slope[-1] > 0) & (slope[:-1] <= 0).any(axis=0)
+
+
+def screen_bottoms(frames, low_window=LOW_WINDOW_BARS, recent_low=RECENT_LOW_BARS, pullback=PULLBACK_BARS,
+                   turn_bars=TURN_BARS, surge_ratio=SURGE_RATIO, min_bars=MIN_BARS):
+    """
+    日付×銘柄のパネル ({項目: DataFrame}) から底打ちの条件を全銘柄まとめて判定し、銘柄コードを index に返す。
+      MA25_Turn / MA75_Turn: 25日線・75日線が直近 turn_bars 本以内に上向きへ転じた
+      Higher_Low: recent_low 本以内に52週安値を付けた後、直近 pullback 本の安値がそれを下回っていない
+      Vol_Spike: 当日出来高が直前25日平均の surge_ratio 倍以上
+    Bottom_Score は満たした条件の数、Bottom はその表示用ラベル。
+    """
+    if not frames or frames["Close"].empty:
+        return pd.DataFrame(columns=["Close", "Low52", "Low52_Days", "Rebound_Pct", *BOTTOM_SIGNALS, *BOTTOM_COLUMNS])
+
+    with METRICS.span("universe.screen"):
+        close_df = frames["Close"].ffill()
+        close = close_df.to_numpy(dtype=float)
+        low = frames["Low"].to_numpy(dtype=float)
+        ma25 = rolling_mean(close, 25)
+        ma75 = rolling_mean(close, 75)
+        base = compute_indicators(close_df, frames["Volume"])
+
+        with warnings.catch_warnings():
+            # 上場直後などで全期間が欠損の銘柄は NaN のままにする
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            window = low[-low_window:]
+            filled = np.where(np.isnan(window), np.inf, window)
+            low52 = np.nanmin(window, axis=0)
+            days_since = len(window) - 1 - filled.argmin(axis=0)
+            pullback_low = np.nanmin(low[-pullback:], axis=0)
+
+        signals = {
+            "MA25_Turn": _turned_up(ma25, turn_bars),
+            "MA75_Turn": _turned_up(ma75, turn_bars),
+            "Higher_Low": (days_since >= pullback) & (days_since <= recent_low) & (pullback_low > low52),
+            "Vol_Spike": base["Vol_Surge"].to_numpy() >= surge_ratio,
+        }
+        out = pd.DataFrame({
+            "Close": close[-1],
+            "Low52": low52,
+            "Low52_Days": days_since,
+            "Rebound_Pct": (close[-1] / low52 - 1) * 100,
+            **signals,
+        }, index=close_df.columns)
+        out = out.join(base)
+        out = out[np.count_nonzero(~np.isnan(close), axis=0) >= min_bars]
+
+        flags = out[list(BOTTOM_SIGNALS)].to_numpy()
+        out["Bottom_Score"] = flags.sum(axis=1)
+        labels = np.array(list(BOTTOM_SIGNALS.values()), dtype=object)
+        out["Bottom"] = [" / ".join(labels[row]) for row in flags]
+        METRICS.incr("universe.screened", len(out))
+    return out
+
+
+def top_bottoms(screen, min_score=2, codes=None, limit=100):
+    """スコア min_score 以上の銘柄を、スコア → 52週安値からの戻りの小さい順に返す。codes があれば銘柄名を付ける。"""
+    hits = screen[screen["Bottom_Score"] >= min_score]
+    hits = hits.sort_values(["Bottom_Score", "Rebound_Pct"], ascending=[False, True], kind="stable").head(limit)
+    hits = hits.rename_axis("Code").reset_index()
+    if codes is not None:
+        hits = hits.merge(codes, on="Code", how="left")
+    return hits
+
+
+def add_bottom_signals(df, screen):
+    """ランキング表に Bottom_Score・Bottom 列を Code で結合する (パネルに無い銘柄は欠損)。"""
+    if df.empty:
+        return df
+    df = df.drop(columns=[c for c in BOTTOM_COLUMNS if c in df.columns])
+    return df.join(screen[BOTTOM_COLUMNS], on="Code")
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# ==========================================
+# ローソク足チャートの構築 (描画は呼び出し側)
+# ==========================================
+RENDER_MODES = {
+    "標準": "standard",
+    "間引き (長期向け)": "decimate",
+    "WebGL (ライン)": "webgl",
+}
+MAX_POINTS = 300
+
+
+def decimate_ohlc(df, max_points=MAX_POINTS):
+    """
+    足の本数が max_points を超える場合、連続する k 本を1本の足にまとめる。
+    高値・安値は区間の最大・最小を保つため、値幅の見た目は変わらない。
+    """
+    n = len(df)
+    if n <= max_points:
+        return df
+    k = int(np.ceil(n / max_points))
+    groups = np.arange(n) // k
+    agg = {"Open": "first", "High": "max", "Low": "min", "Close": "last"}
+    agg.update({c: "last" for c in df.columns if c not in agg and c != "Volume"})
+    if "Volume" in df.columns:
+        agg["Volume"] = "sum"
+    out = df.groupby(groups).agg(agg)
+    out.index = df.index[::k][:len(out)]
+    return out
+
+
+def build_candle_figure(df, title, ma1, ma2, label_ma1, label_ma2, interval, height=350, x_range=None,
+                        render_mode="standard", max_points=MAX_POINTS):
+    df = df.copy()
+    df['MA1'] = df['Close'].rolling(window=ma1).mean()
+    df['MA2'] = df['Close'].rolling(window=ma2).mean()
+
+    # 表示範囲外のウォームアップ期間は移動平均の計算にだけ使い、描画データからは外す
+    if x_range and render_mode != "standard":
+        df = df[df.index.date >= x_range[0]]
+
+    fig = go.Figure()
+    if render_mode == "webgl":
+        # WebGL は描画が軽いぶん多めの点数まで残し、それを超える分だけ間引く
+        df = decimate_ohlc(df, max_points * 4)
+        fig.add_trace(go.Scattergl(x=df.index, y=df['Close'], mode='lines', name='株価', line=dict(color='#333333', width=1)))
+        fig.add_trace(go.Scattergl(x=df.index, y=df['MA1'], mode='lines', name=label_ma1, line=dict(color='orange', width=1)))
+        fig.add_trace(go.Scattergl(x=df.index, y=df['MA2'], mode='lines', name=label_ma2, line=dict(color='skyblue', width=1)))
+    else:
+        if render_mode == "decimate":
+            df = decimate_ohlc(df, max_points)
+        fig.add_trace(go.Candlestick(
+            x=df.index, open=df['Open'], high=df['High'], low=df['Low'], close=df['Close'],
+            name='株価', increasing_line_color='#00C805', decreasing_line_color='#FF333A'
+        ))
+        fig.add_trace(go.Scatter(x=df.index, y=df['MA1'], mode='lines', name=label_ma1, line=dict(color='orange', width=1)))
+        fig.add_trace(go.Scatter(x=df.index, y=df['MA2'], mode='lines', name=label_ma2, line=dict(color='skyblue', width=1)))
+
+    fig.update_layout(
+        title=title,
+        height=height, margin=dict(l=10, r=10, t=40, b=10),
+        xaxis_rangeslider_visible=False, template="plotly_white", showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+
+    xaxes_config = {}
+    if interval == "1d":
+        xaxes_config['rangebreaks'] = [dict(bounds=["sat", "mon"])]
+    if x_range:
+        xaxes_config['range'] = x_range
+
+    if xaxes_config:
+        fig.update_xaxes(**xaxes_config)
+    return fig
+
+
+BAND_COLORS = {(10, 90): "rgba(30, 120, 220, 0.12)", (25, 75): "rgba(30, 120, 220, 0.25)"}
+
+
+def build_seasonal_figure(analogs, title, height=380, show_years=True):
+    """
+    季節性アナログ (seasonal.seasonal_analogs の結果) を1枚に重ねる。
+    過去年の分位帯・平均・各年の線と、今年の基準日までの線を今年の日付軸に描く。
+    """
+    x = analogs.dates
+    fig = go.Figure()
+    for (lo, hi), (lower, upper) in sorted(analogs.bands.items()):
+        fig.add_trace(go.Scatter(x=x, y=upper, mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip"))
+        fig.add_trace(go.Scatter(x=x, y=lower, mode="lines", line=dict(width=0), fill="tonexty",
+                                 fillcolor=BAND_COLORS.get((lo, hi), "rgba(30, 120, 220, 0.15)"),
+                                 name=f"{lo}〜{hi}%点", hoverinfo="skip"))
+    if show_years:
+        for year, path in zip(analogs.years, analogs.paths):
+            fig.add_trace(go.Scatter(x=x, y=path, mode="lines", name=str(year), opacity=0.35,
+                                     line=dict(width=1, color="#888888"), legendgroup="years", showlegend=False,
+                                     hovertemplate=f"{year}年: %{{y:+.1f}}%<extra></extra>"))
+    if len(analogs.years):
+        fig.add_trace(go.Scatter(x=x, y=analogs.mean, mode="lines", name=f"過去{len(analogs.years)}年平均",
+                                 line=dict(color="#1E78DC", width=2)))
+    fig.add_trace(go.Scatter(x=x, y=analogs.current, mode="lines", name="今年",
+                             line=dict(color="#FF333A", width=2.5)))
+    fig.add_vline(x=pd.Timestamp(analogs.anchor), line=dict(color="#333333", width=1, dash="dot"))
+
+    fig.update_layout(
+        title=title, height=height, margin=dict(l=10, r=10, t=40, b=10),
+        yaxis_title="基準日比 (%)", template="plotly_white", hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+# ==========================================
+# ランキング全銘柄の出来高急増率・移動平均乖離率 (一括取得 + ベクトル演算)
+# ==========================================
+INDICATOR_COLUMNS = ["Vol_Surge", "MA25_Dev", "MA75_Dev"]
+HISTORY_PERIOD = "6mo"
+BATCH_SIZE = 200
+
+
+def _default_downloader(symbols, period=HISTORY_PERIOD):
+    import yfinance as yf
+    with METRICS.span("yfinance.download", caller="indicators"):
+        return yf.download(symbols, period=period, interval="1d", group_by="column",
+                           auto_adjust=False, threads=True, progress=False)
+
+
+def _field(panel, field, symbols):
+    data = panel[field]
+    if isinstance(data, pd.Series):
+        data = data.to_frame(symbols[0])
+    return data.reindex(columns=symbols)
+
+
+def last_mean(values, n):
+    """日付×銘柄の配列の末尾 n 本の平均。欠損を含む・本数不足の銘柄は NaN (rolling(n).mean() の最終行と同じ)。"""
+    if len(values) < n:
+        return np.full(values.shape[1], np.nan)
+    return values[-n:].mean(axis=0)
+
+
+def compute_indicators(close, volume):
+    """
+    日付×銘柄の終値・出来高パネルから指標を一括計算する。
+    Vol_Surge は直近出来高 / 直前25日平均、MAxx_Dev は直近終値の移動平均からの乖離率 (%)。
+    """
+    values = close.to_numpy(dtype=float)
+    ma25 = last_mean(values, 25)
+    ma75 = last_mean(values, 75)
+    last_close = close.ffill().iloc[-1].to_numpy()
+
+    vol = volume.to_numpy(dtype=float)
+    if len(vol) > 25:
+        avg_25 = np.nanmean(vol[-26:-1], axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            surge = np.where(avg_25 > 0, vol[-1] / avg_25, np.nan)
+    else:
+        surge = np.full(vol.shape[1], np.nan)
+
+    return pd.DataFrame({
+        "Vol_Surge": surge,
+        "MA25_Dev": (last_close / ma25 - 1) * 100,
+        "MA75_Dev": (last_close / ma75 - 1) * 100,
+    }, index=close.columns)
+
+
+class IndicatorCache:
+    """銘柄コードごとに指標を ttl 秒保持し、未計算の銘柄だけをまとめてダウンロードする。"""
+
+    def __init__(self, ttl=900, downloader=None, batch_size=BATCH_SIZE):
+        self.ttl = ttl
+        self.downloader = downloader or _default_downloader
+        self.batch_size = batch_size
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def get(self, codes):
+        codes = list(dict.fromkeys(codes))
+        now = time.time()
+        with self._lock:
+            missing = [c for c in codes if c not in self._rows or now - self._rows[c][0] > self.ttl]
+        METRICS.incr("indicators.cache", len(codes) - len(missing), result="hit")
+        METRICS.incr("indicators.cache", len(missing), result="miss")
+
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            symbols = [f"{c}.T" for c in batch]
+            try:
+                panel = self.downloader(symbols)
+                result = compute_indicators(_field(panel, "Close", symbols), _field(panel, "Volume", symbols))
+            except Exception as e:
+                # 失敗した銘柄は保持せず、次回の呼び出しで再取得する
+                METRICS.error("indicators.batch", e)
+                continue
+            with self._lock:
+                for code, sym in zip(batch, symbols):
+                    self._rows[code] = (now, result.loc[sym].to_dict())
+
+        with self._lock:
+            rows = {c: self._rows[c][1] for c in codes if c in self._rows}
+        return pd.DataFrame.from_dict(rows, orient="index", columns=INDICATOR_COLUMNS)
+
+
+def add_indicators(df, indicators):
+    """ランキング表に指標列を Code で結合する。"""
+    if df.empty:
+        return df
+    df = df.drop(columns=[c for c in INDICATOR_COLUMNS if c in df.columns])
+    return df.join(indicators, on="Code")
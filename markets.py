@@ -0,0 +1,37 @@
+from metrics import METRICS
+
+# ==========================================
+# グローバル市況 (米国指数・先物・為替)
+# ==========================================
+GLOBAL_TICKERS = {
+    "NYダウ": "^DJI",
+    "NASDAQ": "^IXIC",
+    "日経先物 (CME)": "NIY=F",
+    "ドル / 円": "JPY=X"
+}
+
+
+def fetch_global_markets(tickers=GLOBAL_TICKERS):
+    import yfinance as yf
+    data = {}
+    for name, symbol in tickers.items():
+        try:
+            tkr = yf.Ticker(symbol)
+            with METRICS.span("yfinance.history", kind="global"):
+                hist = tkr.history(period="5d")
+            if len(hist) >= 2:
+                current_price = hist['Close'].iloc[-1]
+                prev_price = hist['Close'].iloc[-2]
+                diff = current_price - prev_price
+                pct_change = (diff / prev_price) * 100
+                data[name] = {
+                    "price": current_price,
+                    "diff": diff,
+                    "pct": pct_change
+                }
+            else:
+                data[name] = None
+        except Exception as e:
+            METRICS.error(f"global:{symbol}", e)
+            data[name] = None
+    return data
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 計測: ステージごとの所要時間 (span) とカウンタ
+# ==========================================
+# PTS_MONITOR_METRICS にファイルパスを指定すると計測結果を書き出す。
+# 拡張子 .prom は Prometheus テキスト形式 (最新の集計で上書き)、それ以外は JSON Lines (1イベント1行で追記)。
+METRICS_PATH = os.environ.get("PTS_MONITOR_METRICS")
+PROMETHEUS_FLUSH_SEC = 5.0
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """
+    プロセス内で共有する軽量な計測器。
+    span() でステージの所要時間を、incr() で件数・バイト数・キャッシュヒットなどを記録する。
+    """
+
+    def __init__(self, path=None, max_samples=500, max_errors=50):
+        self.path = path
+        self.format = "prometheus" if path and path.endswith(".prom") else "jsonl"
+        self.max_samples = max_samples
+        self._durations = {}
+        self._span_errors = {}
+        self._counters = {}
+        self._errors = deque(maxlen=max_errors)
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._last_flush = 0.0
+
+    @contextmanager
+    def span(self, name, **labels):
+        """with ブロックの所要時間を name のステージとして記録する。例外は記録したうえで再送出する。"""
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            key = (name, _label_key(labels))
+            with self._lock:
+                self._durations.setdefault(key, deque(maxlen=self.max_samples)).append(elapsed)
+                if error is not None:
+                    self._span_errors[key] = self._span_errors.get(key, 0) + 1
+            if error is not None:
+                self.error(name, error)
+            self._emit({"type": "span", "name": name, "labels": labels, "seconds": round(elapsed, 6),
+                        "error": str(error) if error is not None else None})
+
+    def incr(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self.format == "prometheus":
+            self._emit(None)
+
+    def error(self, stage, exc):
+        """握りつぶす例外もここで記録し、診断パネルに表示する。"""
+        with self._lock:
+            self._errors.append((datetime.now(), stage, f"{type(exc).__name__}: {exc}"))
+        self.incr("errors", stage=stage)
+
+    # --- 集計 ---
+    def stages(self):
+        """ステージごとの回数・エラー数・合計/平均/p95/直近の所要時間を DataFrame で返す。"""
+        with self._lock:
+            items = [(k, np.array(v), self._span_errors.get(k, 0)) for k, v in self._durations.items()]
+        rows = []
+        for (name, labels), samples, errors in items:
+            rows.append({
+                "Stage": name + _prom_labels(labels),
+                "Count": len(samples),
+                "Errors": errors,
+                "Total_s": samples.sum(),
+                "Mean_ms": samples.mean() * 1000,
+                "P95_ms": np.percentile(samples, 95) * 1000,
+                "Last_ms": samples[-1] * 1000,
+            })
+        df = pd.DataFrame(rows, columns=["Stage", "Count", "Errors", "Total_s", "Mean_ms", "P95_ms", "Last_ms"])
+        return df.sort_values("Total_s", ascending=False, kind="stable").reset_index(drop=True)
+
+    def counters(self):
+        with self._lock:
+            return {name + _prom_labels(labels): value for (name, labels), value in sorted(self._counters.items())}
+
+    def errors(self):
+        with self._lock:
+            return list(reversed(self._errors))
+
+    def prometheus_text(self):
+        """Prometheus テキスト形式の集計 (span は件数と合計秒、カウンタは累計値)。"""
+        with self._lock:
+            durations = {k: (len(v), sum(v)) for k, v in self._durations.items()}
+            counters = dict(self._counters)
+        lines = []
+        for (name, labels), (count, total) in sorted(durations.items()):
+            lbl = _prom_labels((("stage", name),) + labels)
+            lines.append(f"pts_monitor_span_seconds_count{lbl} {count}")
+            lines.append(f"pts_monitor_span_seconds_sum{lbl} {total:.6f}")
+        for (name, labels), value in sorted(counters.items()):
+            metric = "pts_monitor_" + name.replace(".", "_").replace("-", "_") + "_total"
+            lines.append(f"{metric}{_prom_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # --- 書き出し ---
+    def _emit(self, event):
+        if not self.path:
+            return
+        try:
+            if self.format == "jsonl":
+                if event is None:
+                    return
+                event["ts"] = datetime.now().isoformat(timespec="milliseconds")
+                line = json.dumps(event, ensure_ascii=False, default=str)
+                with self._io_lock, open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            else:
+                self.flush()
+        except OSError:
+            # 計測の書き出し失敗で本処理を止めない
+            pass
+
+    def flush(self, force=False):
+        """Prometheus 形式のファイルを最新の集計で置き換える (既定では PROMETHEUS_FLUSH_SEC 秒に1回)。"""
+        if not self.path or self.format != "prometheus":
+            return
+        now = time.monotonic()
+        with self._io_lock:
+            if not force and now - self._last_flush < PROMETHEUS_FLUSH_SEC:
+                return
+            self._last_flush = now
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp, self.path)
+
+
+METRICS = Metrics(METRICS_PATH)
@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from metrics import METRICS
+
+# ==========================================
+# 銘柄別 日足OHLCV ストア (Parquet)
+# ==========================================
+DATA_DIR = os.environ.get("PTS_MONITOR_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+RESAMPLE_RULES = {"1wk": "W-MON", "1mo": "MS"}
+RESAMPLE_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+
+def _default_loader(symbol, start=None):
+    import yfinance as yf
+    tkr = yf.Ticker(symbol)
+    with METRICS.span("yfinance.history", kind="full" if start is None else "delta"):
+        if start is None:
+            return tkr.history(period="max", interval="1d")
+        return tkr.history(start=start.strftime('%Y-%m-%d'), interval="1d")
+
+
+class OhlcvStore:
+    """
+    銘柄ごとに長期の日足を1度だけ取得してディスクに保存し、以後は不足分の直近足だけを追記する。
+    週足・月足は日足からローカルでリサンプルする。
+    最終確認から refresh_ttl 秒以内の再読込はネットワークにアクセスしない。
+    """
+
+    def __init__(self, root=None, refresh_ttl=900, loader=None):
+        self.root = os.path.join(root or DATA_DIR, "ohlcv")
+        self.refresh_ttl = refresh_ttl
+        self.loader = loader or _default_loader
+        self._frames = {}
+        self._checked = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol.replace('^', '_')}.parquet")
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _normalize(self, df):
+        if df is None or df.empty:
+            # 上場廃止・誤ったコードなどで空の場合も、日付で絞り込めるよう DatetimeIndex にしておく
+            return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([]), dtype=float)
+        df = df[[c for c in OHLCV_COLUMNS if c in df.columns]].copy()
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        return df
+
+    def _load_disk(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None, 0.0
+        try:
+            return pd.read_parquet(path), os.path.getmtime(path)
+        except Exception as e:
+            METRICS.error("ohlcv.load_disk", e)
+            return None, 0.0
+
+    def _save(self, symbol, df):
+        path = self._path(symbol)
+        tmp = path + ".tmp"
+        df.to_parquet(tmp)
+        os.replace(tmp, path)
+
+    def _update(self, symbol, df):
+        """不足している直近足を取得して追記する。株式分割等で過去足が変わっていれば全体を取り直す。"""
+        if df is None or len(df) < 2:
+            return self._normalize(self.loader(symbol))
+
+        # 直近2本を重ねて取得し、確定済みの1本で調整後価格のずれを検出する
+        overlap_start = df.index[-2]
+        fresh = self._normalize(self.loader(symbol, start=overlap_start))
+        if fresh.empty:
+            return df
+        if overlap_start in fresh.index:
+            old_close = df.loc[overlap_start, "Close"]
+            new_close = fresh.loc[overlap_start, "Close"]
+            if old_close and abs(new_close / old_close - 1) > 0.005:
+                return self._normalize(self.loader(symbol))
+        merged = pd.concat([df[df.index < fresh.index[0]], fresh])
+        return self._normalize(merged)
+
+    def daily(self, symbol, refresh=True):
+        with self._symbol_lock(symbol):
+            df = self._frames.get(symbol)
+            checked = self._checked.get(symbol, 0.0)
+            if df is None:
+                df, checked = self._load_disk(symbol)
+                METRICS.incr("ohlcv.cache", result="disk" if df is not None else "miss")
+            else:
+                METRICS.incr("ohlcv.cache", result="memory")
+
+            stale = time.time() - checked > self.refresh_ttl
+            if df is None or (refresh and stale):
+                try:
+                    updated = self._update(symbol, df)
+                    if not updated.empty:
+                        self._save(symbol, updated)
+                    df = updated
+                    checked = time.time()
+                except Exception as e:
+                    METRICS.error("ohlcv.update", e)
+                    if df is None:
+                        raise
+                    # 取得失敗時も手元のデータを返し、再試行は次の refresh_ttl 経過後とする
+                    checked = time.time()
+
+            self._frames[symbol] = df
+            self._checked[symbol] = checked
+            return df
+
+    def bars(self, symbol, interval="1d", start=None, end=None):
+        """日足/週足/月足を返す。start, end は日付 (end を含む)。"""
+        df = self.daily(symbol)
+        if df.empty:
+            return df.copy()
+        if interval in RESAMPLE_RULES:
+            df = df.resample(RESAMPLE_RULES[interval], label="left", closed="left").agg(RESAMPLE_AGG).dropna(subset=["Open"])
+        if start is not None:
+            df = df[df.index.date >= start]
+        if end is not None:
+            df = df[df.index.date <= end]
+        return df.copy()
+
+    def period(self, symbol, interval="1d", days=None, months=None, years=None):
+        """yfinance の period="6mo" や "2y" 相当の直近期間を返す。"""
+        df = self.bars(symbol, interval)
+        if df.empty:
+            return df
+        offset = pd.DateOffset(days=days or 0, months=months or 0, years=years or 0)
+        return df[df.index >= pd.Timestamp.now(tz=df.index.tz) - offset]
@@ -0,0 +1,267 @@
+import re
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = object
+
+from metrics import METRICS
+
+# ==========================================
+# サイト別の既知エンコーディング (文字コード判定を省略する)
+# ==========================================
+SITE_ENCODINGS = {
+    "kabutan.jp": "utf-8",
+    "www.release.tdnet.info": "utf-8",
+}
+
+
+def known_encoding(url):
+    return SITE_ENCODINGS.get(urlsplit(url).netloc)
+
+
+def decode_response(res):
+    """既知サイトは固定エンコーディング、それ以外のみ apparent_encoding で判定する。"""
+    res.encoding = known_encoding(res.url) or res.apparent_encoding
+    return res.text
+
+
+RANKING_IDXS = {"code": 0, "name": 1, "market": 2, "price": 6, "change": 7, "pct": 8, "volume": 9}
+RANKING_COLUMNS = ["Code", "Name", "Market", "Price", "Change", "Change_Pct", "Volume", "Label"]
+RANKING_LABELS = ["急騰", "急落"]
+OHLC_LABELS = {"Open": "始値", "High": "高値", "Low": "安値", "Close": "終値", "Volume": "出来高", "Value": "売買代金"}
+
+
+# ==========================================
+# 行の変換 (バックエンド共通)
+# ==========================================
+def _ranking_cells(texts, code, idxs):
+    """セル文字列のリストから (コード, 銘柄名, 市場, 株価, 前日比, 前日比%, 出来高) の生の文字列を取り出す。"""
+    return (code, texts[idxs["name"]], texts[idxs["market"]],
+            texts[idxs["price"]], texts[idxs["change"]], texts[idxs["pct"]], texts[idxs["volume"]])
+
+
+_NUMBER_NOISE = str.maketrans("", "", ",+%")
+
+
+def _to_number(values):
+    """"+1,234" や "-5.2%" のような文字列の列をまとめて float 配列にする。数値でないものは NaN。"""
+    cleaned = pd.Series([v.translate(_NUMBER_NOISE) for v in values], dtype=object)
+    return pd.to_numeric(cleaned, errors="coerce").to_numpy(dtype=float)
+
+
+def ranking_frame(cells, label, threshold=0.0):
+    """
+    1ページ分の生のセル列を DataFrame に変換する。数値化は列単位で一括して行い、
+    変動率が空・0・閾値未満の行を除く。株価・前日比が数値でない場合は 0、出来高が数値でない場合は NaN とする。
+    """
+    if not cells:
+        return pd.DataFrame({c: pd.Series(dtype=float if c in ("Price", "Change", "Change_Pct", "Volume") else object)
+                             for c in RANKING_COLUMNS})
+    code, name, market, price, change, pct, volume = zip(*cells)
+    change_pct = _to_number(pct)
+    keep = np.flatnonzero(~np.isnan(change_pct) & (change_pct != 0) & (np.abs(change_pct) >= threshold))
+    return pd.DataFrame({
+        "Code": [code[i] for i in keep],
+        "Name": [name[i] for i in keep],
+        "Market": [market[i] for i in keep],
+        "Price": np.nan_to_num(_to_number(price)[keep]),
+        "Change": np.nan_to_num(_to_number(change)[keep]),
+        "Change_Pct": change_pct[keep],
+        "Volume": _to_number(volume)[keep],
+        "Label": [label] * len(keep),
+    })
+
+
+def compact_ranking(df):
+    """全件表を省メモリの型にする (コード・銘柄名は Arrow 文字列、市場・急騰/急落は category)。"""
+    return df.astype({
+        "Code": STRING_DTYPE, "Name": STRING_DTYPE,
+        "Market": "category", "Label": pd.CategoricalDtype(RANKING_LABELS),
+    })
+
+
+def _tdnet_record(texts, href, root_url):
+    pdf_url = root_url + href if href is not None else ""
+    return (texts[1][:4], {"time": texts[0], "title": texts[3], "url": pdf_url})
+
+
+# ==========================================
+# バックエンド: html.parser で全体を構築 (従来方式)
+# ==========================================
+class SoupParser:
+    name = "bs4"
+
+    def soup(self, html, only=None):
+        return BeautifulSoup(html, 'html.parser')
+
+    def ranking(self, html, label, threshold=0.0, idxs=RANKING_IDXS):
+        table = self.soup(html, "ranking").select_one("table.stock_table")
+        if not table:
+            return None
+
+        tbody = table.find("tbody")
+        rows = tbody.find_all("tr") if tbody else table.find_all("tr")[1:]
+
+        cells = []
+        for row in rows:
+            cols = row.find_all(["td", "th"])
+            if len(cols) < max(idxs.values()) + 1: continue
+            texts = [c.text.strip() for c in cols]
+            code_tag = cols[idxs["code"]].find('a')
+            code = code_tag.text.strip() if code_tag else texts[idxs["code"]]
+            cells.append(_ranking_cells(texts, code, idxs))
+        return ranking_frame(cells, label, threshold)
+
+    def tdnet(self, html, root_url):
+        items = []
+        for row in self.soup(html, "tdnet").select("table tr"):
+            cols = row.find_all('td')
+            if len(cols) >= 4:
+                link_tag = cols[3].find('a')
+                href = link_tag['href'] if link_tag and 'href' in link_tag.attrs else None
+                items.append(_tdnet_record([c.text.strip() for c in cols], href, root_url))
+        return items
+
+    def stock_detail(self, html):
+        soup = self.soup(html, "detail")
+        d = {key: "-" for key in OHLC_LABELS}
+
+        def find_val(label):
+            th = soup.find("th", string=label)
+            if th:
+                td = th.find_next_sibling("td")
+                if td: return td.text.strip()
+            return "-"
+
+        for key, label in OHLC_LABELS.items():
+            d[key] = find_val(label)
+
+        if d["Close"] == "-":
+            span = soup.select_one("span.kabuka")
+            if span: d["Close"] = span.text.strip()
+        return d
+
+
+# ==========================================
+# バックエンド: 対象テーブルのみ構築 (高速)
+# ==========================================
+class TargetedParser(SoupParser):
+    """
+    対象テーブルを文字列検索で切り出し、その範囲だけを解析する。
+    lxml があれば lxml で直接、無ければ SoupStrainer 付きの BeautifulSoup で木を作る。
+    """
+
+    name = "fast"
+    TABLE_MARKERS = {
+        "ranking": 'class="stock_table',
+        "tdnet": 'id="main-list-table"',
+    }
+    STRAINERS = {
+        "ranking": SoupStrainer("table", class_=re.compile(r"\bstock_table\b")),
+        "tdnet": SoupStrainer("table"),
+        "detail": SoupStrainer(["table", "span"]),
+    }
+
+    def __init__(self, use_lxml=None):
+        self.use_lxml = lxml is not None if use_lxml is None else use_lxml
+
+    def _slice_table(self, html, only):
+        marker = self.TABLE_MARKERS.get(only)
+        if not marker:
+            return html
+        pos = html.find(marker)
+        if pos < 0:
+            return html
+        start = html.rfind("<table", 0, pos)
+        end = html.find("</table>", pos)
+        if start < 0 or end < 0 or html.find("<table", start + 1, end) >= 0:
+            return html
+        return html[start:end + len("</table>")]
+
+    def soup(self, html, only=None):
+        return BeautifulSoup(self._slice_table(html, only), 'html.parser', parse_only=self.STRAINERS.get(only))
+
+    def _tree(self, html, only):
+        fragment = self._slice_table(html, only)
+        if not fragment.strip():
+            return None
+        try:
+            return lxml.html.fromstring(fragment)
+        except ValueError:
+            # XML宣言付きの文字列は lxml がそのまま受け付けないためバイト列で渡す
+            return lxml.html.fromstring(fragment.encode("utf-8"))
+
+    def ranking(self, html, label, threshold=0.0, idxs=RANKING_IDXS):
+        if not self.use_lxml:
+            return super().ranking(html, label, threshold, idxs)
+        tree = self._tree(html, "ranking")
+        if tree is None:
+            return None
+        tables = tree.xpath("descendant-or-self::table[contains(concat(' ', normalize-space(@class), ' '), ' stock_table ')]")
+        if not tables:
+            return None
+
+        table = tables[0]
+        tbody = table.find("tbody")
+        rows = tbody.xpath(".//tr") if tbody is not None else table.xpath(".//tr")[1:]
+
+        cells = []
+        for row in rows:
+            cols = row.xpath(".//td|.//th")
+            if len(cols) < max(idxs.values()) + 1: continue
+            texts = [c.text_content().strip() for c in cols]
+            code_tag = cols[idxs["code"]].find(".//a")
+            code = code_tag.text_content().strip() if code_tag is not None else texts[idxs["code"]]
+            cells.append(_ranking_cells(texts, code, idxs))
+        return ranking_frame(cells, label, threshold)
+
+    def tdnet(self, html, root_url):
+        if not self.use_lxml:
+            return super().tdnet(html, root_url)
+        tree = self._tree(html, "tdnet")
+        if tree is None:
+            return []
+        items = []
+        for row in tree.xpath("descendant-or-self::table//tr"):
+            cols = row.xpath(".//td")
+            if len(cols) >= 4:
+                link_tag = cols[3].find(".//a")
+                href = link_tag.get("href") if link_tag is not None else None
+                items.append(_tdnet_record([c.text_content().strip() for c in cols], href, root_url))
+        return items
+
+
+PARSERS = {
+    SoupParser.name: SoupParser,
+    TargetedParser.name: TargetedParser,
+}
+DEFAULT_PARSER = TargetedParser.name
+
+_instances = {}
+
+
+def get_parser(name=None):
+    name = name or DEFAULT_PARSER
+    if name not in _instances:
+        if name not in PARSERS:
+            raise ValueError(f"unknown parser backend: {name}")
+        _instances[name] = PARSERS[name]()
+    return _instances[name]
+
+
+def parse_stock_detail(html, parser=None):
+    """株探の個別銘柄ページから4本値・出来高・売買代金を取り出す。"""
+    with METRICS.span("parse.stock_detail"):
+        return get_parser(parser).stock_detail(html)
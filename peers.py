@@ -0,0 +1,72 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+# ==========================================
+# 相関行列によるピア銘柄探索
+# ==========================================
+RETURN_PERIOD = "6mo"
+MIN_OBSERVATIONS = 20
+
+
+def _default_downloader(symbols, period=RETURN_PERIOD):
+    import yfinance as yf
+    with METRICS.span("yfinance.download", caller="peers"):
+        return yf.download(symbols, period=period, interval="1d", group_by="column",
+                           auto_adjust=True, threads=True, progress=False)
+
+
+def parse_codes(text):
+    """カンマ・空白・改行区切りの入力から4桁の銘柄コードを取り出す。"""
+    return list(dict.fromkeys(re.findall(r"\b\d{3}[0-9A-Z]\b", text or "")))
+
+
+def build_return_matrix(codes, downloader=None, period=RETURN_PERIOD):
+    """日付×銘柄の日次対数リターン行列 (日付で整列済み) を返す。列名は銘柄コード。"""
+    codes = list(dict.fromkeys(codes))
+    if not codes:
+        return pd.DataFrame()
+    symbols = [f"{c}.T" for c in codes]
+    panel = (downloader or _default_downloader)(symbols, period=period)
+    close = panel["Close"]
+    if isinstance(close, pd.Series):
+        close = close.to_frame(symbols[0])
+    close = close.reindex(columns=symbols)
+    close.columns = codes
+    returns = np.log(close).diff().iloc[1:]
+    return returns.loc[:, returns.notna().sum() >= MIN_OBSERVATIONS]
+
+
+def correlation_matrix(returns):
+    """
+    欠損を含むリターン行列から、銘柄ペアごとに共通して値がある日だけを使った相関係数を行列演算で求める。
+    """
+    if returns.empty:
+        return pd.DataFrame()
+    x = returns.to_numpy(dtype=float)
+    mask = ~np.isnan(x)
+    m = mask.astype(float)
+    x0 = np.where(mask, x, 0.0)
+
+    n = m.T @ m
+    sx = x0.T @ m
+    sxx = (x0 * x0).T @ m
+    sxy = x0.T @ x0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[n < MIN_OBSERVATIONS] = np.nan
+    np.fill_diagonal(corr, 1.0)
+    return pd.DataFrame(corr, index=returns.columns, columns=returns.columns)
+
+
+def top_peers(corr, code, k=5):
+    """code と最も相関が高い/低い銘柄を k 件ずつ返す。"""
+    if corr.empty or code not in corr.index:
+        return pd.Series(dtype=float), pd.Series(dtype=float)
+    row = corr.loc[code].drop(code).dropna()
+    return row.nlargest(k), row.nsmallest(k)
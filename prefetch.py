@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+from result_cache import RESULT_CACHE
+
+# ==========================================
+# 上位銘柄の詳細データ先読み
+# ==========================================
+PREFETCH_TOP_N = 20
+DETAIL_TTL = 180
+PREFETCH_WORKERS = 4
+
+
+class DetailPrefetcher:
+    """
+    ランキング上位の銘柄について、行クリック時に必要な詳細データ (load(code) の結果) を
+    上限つきのスレッドプールで先に読み込み、共有キャッシュに ttl 秒保持する。
+    クリック時は get() で、先読み済みならそのまま、読み込み中なら完了を待って同じ結果を返す。
+    """
+
+    def __init__(self, load, top_n=PREFETCH_TOP_N, ttl=DETAIL_TTL, max_workers=PREFETCH_WORKERS,
+                 cache=RESULT_CACHE, namespace="detail"):
+        self.load = load
+        self.top_n = top_n
+        self.ttl = ttl
+        self.cache = cache
+        self.namespace = namespace
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="detail-prefetch")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _key(self, code):
+        return (self.namespace, code)
+
+    def _compute(self, code):
+        return self.cache.get_or_compute(self._key(code), lambda: self.load(code), ttl=self.ttl)
+
+    def prefetch(self, codes):
+        """codes の先頭 top_n 件のうち、未取得・期限切れで読み込み待ちでもない銘柄を投入する。投入件数を返す。"""
+        queued = 0
+        with self._lock:
+            for code in list(dict.fromkeys(codes))[:self.top_n]:
+                if code in self._pending or self.cache.contains(self._key(code)):
+                    continue
+                self._pending.add(code)
+                self._pool.submit(self._run, code)
+                queued += 1
+        if queued:
+            METRICS.incr("prefetch.queued", queued)
+        return queued
+
+    def _run(self, code):
+        try:
+            with METRICS.span("prefetch.load"):
+                self._compute(code)
+        except Exception as e:
+            METRICS.error("prefetch", e)
+        finally:
+            with self._lock:
+                self._pending.discard(code)
+
+    def get(self, code):
+        """先読み済みなら即座に、読み込み中なら完了を待って、無ければその場で読み込んで返す。"""
+        with self._lock:
+            pending = code in self._pending
+        state = "hit" if self.cache.contains(self._key(code)) else ("wait" if pending else "miss")
+        METRICS.incr("prefetch.get", result=state)
+        return self._compute(code)
+
+    def cached(self, code):
+        return self.cache.contains(self._key(code))
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
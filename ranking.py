@@ -0,0 +1,47 @@
+import pandas as pd
+
+# ==========================================
+# ランキングのローカル絞り込み (取得済みスナップショットに対する処理)
+# ==========================================
+NEWS_MARK = "📄あり"
+
+SORT_KEYS = {
+    "変動率": "Change_Pct",
+    "出来高急増率": "Vol_Surge",
+    "25日線乖離": "MA25_Dev",
+    "75日線乖離": "MA75_Dev",
+    "底打スコア": "Bottom_Score",
+}
+
+
+def filter_ranking(df, threshold=0.0, min_price=0, max_price=0, news_codes=None, news_only=False, top_n=0,
+                   min_vol_surge=0.0, sort_by="Change_Pct", topic_hits=None, min_bottom_score=0):
+    """
+    全件スナップショットに閾値・価格帯・適時開示・出来高急増率の条件を適用し、
+    sort_by の絶対値の降順で上位 top_n 件を返す。ネットワークアクセスは行わない。
+    topic_hits ({code: [該当キーワード, ...]}) を渡すと該当銘柄だけに絞り、Topic 列を付ける。
+    min_bottom_score は add_bottom_signals で結合した底打スコアの下限。
+    """
+    if df.empty:
+        return df
+
+    abs_pct = df["Change_Pct"].abs()
+    mask = abs_pct >= threshold
+    if min_price > 0: mask &= df["Price"] >= min_price
+    if max_price > 0: mask &= df["Price"] <= max_price
+    if min_vol_surge > 0 and "Vol_Surge" in df.columns: mask &= df["Vol_Surge"] >= min_vol_surge
+    if min_bottom_score > 0 and "Bottom_Score" in df.columns: mask &= df["Bottom_Score"] >= min_bottom_score
+
+    has_news = df["Code"].isin(list(news_codes or ()))
+    if news_only: mask &= has_news
+    if topic_hits is not None: mask &= df["Code"].isin(list(topic_hits))
+
+    out = df.loc[mask].copy()
+    out["News"] = has_news[mask].map({True: NEWS_MARK, False: ""})
+    if topic_hits is not None:
+        topics = pd.Series({code: " / ".join(labels) for code, labels in topic_hits.items()}, dtype=object)
+        out["Topic"] = out["Code"].map(topics).fillna("")
+    sort_col = sort_by if sort_by in out.columns else "Change_Pct"
+    out = out.loc[out[sort_col].abs().sort_values(ascending=False, kind="stable", na_position="last").index]
+    if top_n > 0: out = out.head(top_n)
+    return out
@@ -0,0 +1,114 @@
+import os
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+
+from metrics import METRICS
+from ohlcv_store import DATA_DIR
+from parsers import RANKING_LABELS, STRING_DTYPE
+
+JST = timezone(timedelta(hours=9))
+
+# ==========================================
+# ランキングのスナップショット履歴 (日ごとの Parquet)
+# ==========================================
+# 1回の取得 = 1スナップショット。当日分はスナップショットごとの小さなファイルで pending/ に置き、
+# 日付が変わったら1日1ファイル (YYYY-MM-DD.parquet) にまとめる。
+HISTORY_COLUMNS = ["Fetched_At", "Mode", "Code", "Market", "Price", "Change_Pct", "Label", "News"]
+
+
+def snapshot_rows(mode, df, fetched_at, news_codes=()):
+    """ランキング表から履歴に残す列だけを小さい型で取り出す。"""
+    news = df["Code"].isin(list(news_codes or ()))
+    return pd.DataFrame({
+        "Fetched_At": pd.Series(pd.Timestamp(fetched_at), index=df.index).astype("datetime64[ms, Asia/Tokyo]"),
+        "Mode": pd.Categorical([mode] * len(df)),
+        "Code": df["Code"].astype(STRING_DTYPE),
+        "Market": df["Market"].astype("category"),
+        "Price": df["Price"].astype("float32"),
+        "Change_Pct": df["Change_Pct"].astype("float32"),
+        "Label": pd.Categorical(df["Label"], categories=RANKING_LABELS),
+        "News": news.to_numpy(),
+    }).reset_index(drop=True)
+
+
+class RankingHistory:
+    """
+    ランキング取得ごとの全件スナップショットを追記する。
+    前回と同じ内容 (ETag 一致などで変化なし) のスナップショットは記録しない。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or DATA_DIR, "history", "ranking")
+        self.pending = os.path.join(self.root, "pending")
+        self._last = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.pending, exist_ok=True)
+
+    def append(self, mode, df, fetched_at=None, news_codes=()):
+        """スナップショットを1件追記する。記録した場合は True。"""
+        if df is None or df.empty:
+            return False
+        fetched_at = fetched_at or datetime.now(JST)
+        rows = snapshot_rows(mode, df, fetched_at, news_codes)
+        signature = int(pd.util.hash_pandas_object(rows.drop(columns="Fetched_At"), index=False).sum())
+        with self._lock:
+            if self._last.get(mode) == signature:
+                METRICS.incr("history.snapshots", result="unchanged")
+                return False
+            self._last[mode] = signature
+            name = f"{fetched_at.strftime('%Y-%m-%d_%H%M%S_%f')}_{mode}.parquet"
+            path = os.path.join(self.pending, name)
+            rows.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+        METRICS.incr("history.snapshots", result="saved")
+        return True
+
+    def _pending_by_day(self):
+        days = {}
+        for name in sorted(os.listdir(self.pending)):
+            if name.endswith(".parquet"):
+                days.setdefault(name[:10], []).append(os.path.join(self.pending, name))
+        return days
+
+    def compact(self, today=None):
+        """today より前の pending ファイルを日ごとの1ファイルにまとめる。"""
+        today = (today or datetime.now(JST).date()).isoformat()
+        with self._lock:
+            for day, paths in self._pending_by_day().items():
+                if day >= today:
+                    continue
+                day_path = os.path.join(self.root, f"{day}.parquet")
+                parts = [pd.read_parquet(p) for p in paths]
+                if os.path.exists(day_path):
+                    parts.insert(0, pd.read_parquet(day_path))
+                merged = pd.concat(parts, ignore_index=True).sort_values(["Fetched_At", "Mode"], kind="stable")
+                merged.to_parquet(day_path + ".tmp", index=False)
+                os.replace(day_path + ".tmp", day_path)
+                for p in paths:
+                    os.remove(p)
+
+    def load(self, start=None, end=None, modes=None):
+        """start〜end (日付, 両端を含む) のスナップショットを1つの DataFrame で返す。"""
+        self.compact()
+        start = (start or date.min).isoformat()
+        end = (end or date.max).isoformat()
+        with METRICS.span("history.load"):
+            paths = [os.path.join(self.root, n) for n in sorted(os.listdir(self.root))
+                     if n.endswith(".parquet") and start <= n[:10] <= end]
+            paths += [p for day, ps in self._pending_by_day().items() if start <= day <= end for p in ps]
+            if not paths:
+                return pd.DataFrame(columns=HISTORY_COLUMNS)
+            df = pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+            df["Mode"] = df["Mode"].astype("category")
+            df["Market"] = df["Market"].astype("category")
+            if modes:
+                df = df[df["Mode"].isin(modes)].reset_index(drop=True)
+        return df
+
+    def days(self):
+        """記録のある日付の一覧。"""
+        names = {n[:10] for n in os.listdir(self.root) if n.endswith(".parquet")}
+        names |= set(self._pending_by_day())
+        return sorted(date.fromisoformat(n) for n in names)
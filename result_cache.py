@@ -0,0 +1,218 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from metrics import METRICS
+
+# ==========================================
+# プロセス共有の結果キャッシュ (サイズ上限つき LRU)
+# ==========================================
+# st.cache_data はセッションごとに結果を複製して返すため、同じ表や図がセッション数だけメモリに載る。
+# ここでは結果を1つだけ保持し、全セッションに読み取り専用のまま共有する。
+CACHE_MAX_MB = float(os.environ.get("PTS_MONITOR_CACHE_MB", "256"))
+
+
+def estimate_size(obj, _depth=0):
+    """結果のおおよそのメモリ量 (バイト)。表・配列は実データ量、入れ子の辞書・リストは要素の合計。"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if hasattr(obj, "nbytes") and hasattr(obj, "schema"):  # pyarrow.Table / RecordBatch
+        return int(obj.nbytes)
+    if hasattr(obj, "to_plotly_json"):
+        return estimate_size(obj.to_plotly_json(), _depth + 1)
+    if _depth > 8:
+        return sys.getsizeof(obj)
+    if isinstance(obj, (dict, MappingProxyType)):
+        return sys.getsizeof(obj) + sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(v, _depth + 1) for v in obj)
+    return sys.getsizeof(obj)
+
+
+def freeze(obj):
+    """共有する結果を読み取り専用にする。辞書は MappingProxyType、リストは tuple に置き換える。"""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+
+def share(obj):
+    """
+    キャッシュ中の値を呼び出し元に渡す形にする。
+    DataFrame は浅いコピー (Copy-on-Write によりデータは共有し、列の追加・変更は呼び出し元だけに反映) を返す。
+    Copy-on-Write が常に有効なのは pandas 3 以降のため、requirements.txt で pandas>=3 を要求している。
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        out = obj.copy(deep=False)
+        out.attrs = dict(obj.attrs)
+        return out
+    return obj
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at")
+
+    def __init__(self, value, size, expires_at):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class ResultCache:
+    """
+    キーごとの計算結果を max_bytes までプロセス内で保持し、超えたら最も長く使われていないものから捨てる。
+    同じキーの同時計算は1回にまとめ、待っていた側は同じ結果を受け取る。
+    統計 (ヒット・ミス・追い出し・使用量) は名前空間 (キーの先頭要素) ごとに集計する。
+    """
+
+    def __init__(self, max_bytes=int(CACHE_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace, field, n=1):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "evictions": 0, "oversize": 0})
+        stats[field] += n
+        METRICS.incr("result_cache", n, cache=namespace, result=field)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get_or_compute(self, key, func, ttl=None):
+        """key の結果を返す。無ければ func() を1回だけ実行して保持する (例外はキャッシュしない)。"""
+        namespace = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._count(namespace, "hits")
+                return share(entry.value)
+            waiter = self._inflight.get(key)
+            owner = waiter is None
+            if owner:
+                waiter = self._inflight[key] = threading.Event()
+                self._count(namespace, "misses")
+
+        if not owner:
+            # 同じキーを計算中なら待って結果を共有する (ヒットとして数える)
+            waiter.wait()
+            with self._lock:
+                entry = self._lookup(key)
+                self._count(namespace, "hits" if entry is not None else "misses")
+            if entry is not None:
+                return share(entry.value)
+            # 計算側が失敗した・保持できなかった場合は自分で計算する
+            return share(freeze(func()))
+
+        try:
+            value = freeze(func())
+            size = estimate_size(value)
+            with self._lock:
+                if size > self.max_bytes:
+                    self._count(namespace, "oversize")
+                else:
+                    if key in self._entries:
+                        self._drop(key)
+                    self._entries[key] = _Entry(value, size, time.monotonic() + ttl if ttl else None)
+                    self._bytes += size
+                    self._evict()
+            return share(value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter.set()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._count(key[0] if isinstance(key, tuple) else key, "evictions")
+
+    def contains(self, key):
+        """key の有効な結果を保持しているか (統計・LRU の順序は変えない)。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry.expires_at is None or entry.expires_at > time.monotonic())
+
+    def invalidate(self, namespace=None):
+        """namespace (省略時はすべて) の結果を捨てる。"""
+        with self._lock:
+            for key in [k for k in self._entries if namespace is None or (k[0] if isinstance(k, tuple) else k) == namespace]:
+                self._drop(key)
+
+    def stats(self):
+        """名前空間ごとの 件数・使用量 (MB)・ヒット・ミス・追い出し を DataFrame で返す。"""
+        with self._lock:
+            usage = {}
+            for key, entry in self._entries.items():
+                ns = key[0] if isinstance(key, tuple) else key
+                n, size = usage.get(ns, (0, 0))
+                usage[ns] = (n + 1, size + entry.size)
+            stats = {ns: dict(v) for ns, v in self._stats.items()}
+        rows = []
+        for ns in sorted(set(stats) | set(usage)):
+            s = stats.get(ns, {"hits": 0, "misses": 0, "evictions": 0, "oversize": 0})
+            n, size = usage.get(ns, (0, 0))
+            total = s["hits"] + s["misses"]
+            rows.append({"Cache": ns, "Entries": n, "MB": size / 1024 / 1024, "Hits": s["hits"], "Misses": s["misses"],
+                         "Hit_Rate": s["hits"] / total * 100 if total else np.nan,
+                         "Evictions": s["evictions"], "Oversize": s["oversize"]})
+        return pd.DataFrame(rows, columns=["Cache", "Entries", "MB", "Hits", "Misses", "Hit_Rate", "Evictions", "Oversize"])
+
+    @property
+    def used_bytes(self):
+        return self._bytes
+
+
+RESULT_CACHE = ResultCache()
+
+
+def _hashable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def shared_cache(ttl=None, name=None, cache=None):
+    """
+    st.cache_data の代わりに使うデコレータ。引数 (ハッシュ可能であること) ごとの結果を RESULT_CACHE で共有する。
+    name は統計の表示名 (既定: 関数名)。返した値は全セッションで共有するため、呼び出し側で書き換えないこと。
+    """
+    def decorator(func):
+        namespace = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (namespace, _hashable(args), _hashable(kwargs))
+            return (cache or RESULT_CACHE).get_or_compute(key, lambda: func(*args, **kwargs), ttl=ttl)
+
+        wrapper.invalidate = lambda: (cache or RESULT_CACHE).invalidate(namespace)
+        return wrapper
+    return decorator
@@ -0,0 +1,148 @@
+"""
+ランキング取得と TDnet 突き合わせを Streamlit なしで実行するコマンドライン版。
+
+    python scan.py --mode PTS --threshold 3 --news-days 1 -o pts.csv
+    python scan.py --mode PTS_DAY --category 上方修正 --indicators -o hits.parquet
+
+条件はサイドバーと同じで、出力形式は拡張子 (.csv / .parquet / .json) または --format で選ぶ。
+起動を軽くするため、必要な機能のモジュールだけを実行時に読み込む (plotly / yfinance / genai は使う場合のみ)。
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+JST = timezone(timedelta(hours=9))
+
+MODES = ("PTS", "PTS_DAY", "Daytime")
+FORMATS = ("csv", "parquet", "json")
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="PTS・東証ランキングと適時開示のスキャン")
+    ap.add_argument("--mode", choices=MODES, default="PTS", help="対象市場・時間 (既定: PTS 夜間)")
+    ap.add_argument("--date", help="TDnet検索日 YYYY-MM-DD (既定: 本日)")
+    ap.add_argument("--news-days", type=int, default=1, help="開示の対象期間 (日)")
+    ap.add_argument("--threshold", type=float, default=3.0, help="変動率 閾値 (%%)")
+    ap.add_argument("--min-price", type=float, default=0)
+    ap.add_argument("--max-price", type=float, default=0)
+    ap.add_argument("--max-items", type=int, default=0, help="出力件数の上限 (0 で全件)")
+    ap.add_argument("--news-only", action="store_true", help="適時開示ありの銘柄のみ")
+    ap.add_argument("--category", action="append", default=[], help="開示種別で絞り込み (複数指定可)")
+    ap.add_argument("--keyword", action="append", default=[], help="開示タイトルのキーワード (複数指定可)")
+    ap.add_argument("--indicators", action="store_true", help="出来高急増率・移動平均乖離を計算する")
+    ap.add_argument("--min-vol-surge", type=float, default=0.0)
+    ap.add_argument("--bottoms", action="store_true", help="東証全銘柄の日足パネルを更新し、底打スコアを付ける")
+    ap.add_argument("--min-bottom-score", type=int, default=0)
+    ap.add_argument("--sort", default="変動率", help="並び順 (変動率 / 出来高急増率 / 25日線乖離 / 75日線乖離 / 底打スコア)")
+    ap.add_argument("-o", "--output", default="-", help="出力先 (既定: 標準出力に CSV)")
+    ap.add_argument("--format", choices=FORMATS, help="出力形式 (既定: 拡張子から判定)")
+    ap.add_argument("--record", action="store_true", help="取得したランキングを履歴 (ranking_history) に追記する")
+    ap.add_argument("--rate", type=float, default=5.0, help="ホストあたりのリクエスト/秒")
+    ap.add_argument("--workers", type=int, default=4)
+    return ap.parse_args(argv)
+
+
+def output_format(args):
+    if args.format:
+        return args.format
+    ext = args.output.rsplit(".", 1)[-1].lower() if "." in args.output else ""
+    return ext if ext in FORMATS else "csv"
+
+
+def load_disclosures(args, fetcher, target_date):
+    """サイドバーと同じ規則で {code: [item, ...]} と、キーワード指定時の該当ラベルを返す。"""
+    from tdnet import TdnetIngester
+
+    need_archive = args.news_days > 1 or args.keyword or args.category
+    if not need_archive:
+        return dict(TdnetIngester(fetcher=fetcher).refresh(target_date).disclosure_map), None
+
+    from tdnet_archive import CATEGORY_KEYWORDS, TdnetArchive
+    unknown = [c for c in args.category if c not in CATEGORY_KEYWORDS]
+    if unknown:
+        raise SystemExit(f"未知の開示種別: {', '.join(unknown)} (指定可能: {', '.join(CATEGORY_KEYWORDS)})")
+
+    archive = TdnetArchive()
+    ingester = TdnetIngester(fetcher=fetcher, listeners=[archive.on_rows])
+    start = target_date - timedelta(days=args.news_days - 1)
+    failed = archive.backfill(ingester, start, target_date, today=datetime.now(JST).date())
+    if failed:
+        print("TDnetの取得が完了しなかった日: " + ", ".join(d.isoformat() for d in failed), file=sys.stderr)
+    topic_hits = None
+    if args.keyword or args.category:
+        topic_hits = archive.topic_labels(start, target_date, args.keyword, args.category)
+    return archive.disclosure_map(start, target_date), topic_hits
+
+
+def scan(args):
+    import pandas as pd
+    from ranking import SORT_KEYS, filter_ranking
+    from scraper import PageFetcher, fetch_ranking
+
+    if args.sort not in SORT_KEYS and args.sort not in SORT_KEYS.values():
+        raise SystemExit(f"未知の並び順: {args.sort} (指定可能: {', '.join(SORT_KEYS)})")
+    sort_by = SORT_KEYS.get(args.sort, args.sort)
+    target_date = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else datetime.now(JST).date()
+
+    fetcher = PageFetcher(rate_per_sec=args.rate, max_workers=args.workers)
+    try:
+        universe = fetch_ranking(args.mode, 0.0, 0, fetcher=fetcher)
+        disclosures, topic_hits = load_disclosures(args, fetcher, target_date)
+    finally:
+        fetcher.close()
+    if args.record:
+        from ranking_history import RankingHistory
+        RankingHistory().append(args.mode, universe, news_codes=disclosures)
+
+    if args.indicators and not universe.empty:
+        from indicators import IndicatorCache, add_indicators
+        hit_codes = universe.loc[universe["Change_Pct"].abs() >= args.threshold, "Code"]
+        universe = add_indicators(universe, IndicatorCache().get(hit_codes))
+
+    if args.bottoms and not universe.empty:
+        from bottoms import add_bottom_signals, screen_bottoms
+        from universe import UniversePanel
+        universe = add_bottom_signals(universe, screen_bottoms(UniversePanel().update_if_stale()))
+
+    result = filter_ranking(
+        universe, threshold=args.threshold, min_price=args.min_price, max_price=args.max_price,
+        news_codes=disclosures, news_only=args.news_only, top_n=args.max_items,
+        min_vol_surge=args.min_vol_surge if args.indicators else 0.0, sort_by=sort_by, topic_hits=topic_hits,
+        min_bottom_score=args.min_bottom_score if args.bottoms else 0
+    )
+    if not result.empty:
+        counts = pd.Series({code: len(items) for code, items in disclosures.items()}, dtype=float)
+        titles = pd.Series({code: " / ".join(n["title"] for n in items) for code, items in disclosures.items()}, dtype=object)
+        result["News_Count"] = result["Code"].map(counts).fillna(0).astype(int)
+        result["News_Titles"] = result["Code"].map(titles).fillna("")
+    return result
+
+
+def write_result(df, args):
+    fmt = output_format(args)
+    if fmt == "parquet":
+        if args.output == "-":
+            raise SystemExit("Parquet は -o でファイルを指定してください")
+        df.to_parquet(args.output, index=False)
+    elif fmt == "json":
+        text = df.to_json(orient="records", force_ascii=False, indent=1)
+        if args.output == "-":
+            sys.stdout.write(text + "\n")
+        else:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(text)
+    else:
+        df.to_csv(sys.stdout if args.output == "-" else args.output, index=False,
+                  encoding="utf-8" if args.output == "-" else "utf-8-sig")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = scan(args)
+    write_result(result, args)
+    if args.output != "-":
+        print(f"{len(result)}件を {args.output} に書き出しました", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone, time as dt_time
+
+from metrics import METRICS
+
+JST = timezone(timedelta(hours=9))
+
+# ==========================================
+# 市場時間帯の判定
+# ==========================================
+PHASE_NIGHT = "night"      # PTS ナイトタイム 17:00〜23:59
+PHASE_ZARABA = "zaraba"    # 東証ザラ場 9:00〜15:30
+PHASE_IDLE = "idle"
+
+PHASE_LABELS = {PHASE_NIGHT: "PTS夜間", PHASE_ZARABA: "ザラ場", PHASE_IDLE: "閑散時間"}
+
+
+def market_phase(now=None):
+    now = now or datetime.now(JST)
+    if now.weekday() >= 5:
+        return PHASE_IDLE
+    t = now.time()
+    if dt_time(9, 0) <= t < dt_time(15, 30):
+        return PHASE_ZARABA
+    if t >= dt_time(17, 0):
+        return PHASE_NIGHT
+    return PHASE_IDLE
+
+
+class Snapshot:
+    """ジョブ結果の公開用スナップショット。version は更新ごとに1ずつ増える。"""
+
+    def __init__(self, key, version, data, fetched_at, elapsed, error=None):
+        self.key = key
+        self.version = version
+        self.data = data
+        self.fetched_at = fetched_at
+        self.elapsed = elapsed
+        self.error = error
+
+    def age(self, now=None):
+        return ((now or datetime.now(JST)) - self.fetched_at).total_seconds()
+
+
+class Job:
+    def __init__(self, key, func, intervals, lane=None):
+        self.key = key
+        self.func = func
+        self.intervals = intervals
+        self.lane = lane
+        self.next_run = 0.0
+        self.lock = threading.Lock()
+
+    def interval(self, phase):
+        return self.intervals.get(phase, self.intervals.get(PHASE_IDLE, 1800))
+
+
+# ==========================================
+# バックグラウンド更新スケジューラ (プロセス内で共有)
+# ==========================================
+class PrefetchScheduler:
+    """
+    登録したジョブを市場時間帯ごとの間隔でバックグラウンド実行し、最新結果を Snapshot として公開する。
+    各セッションは snapshot() で待ち時間なしに結果を読み、refresh() で強制更新できる。
+    lane を指定したジョブ (全銘柄の日足更新など数分かかるもの) はレーンごとの専用スレッドで実行し、
+    市場時間中の短い間隔のジョブ (ランキング・開示など) を待たせない。
+    """
+
+    def __init__(self, phase_func=market_phase):
+        self.phase_func = phase_func
+        self._jobs = {}
+        self._snapshots = {}
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_job(self, key, func, intervals, lane=None):
+        """
+        func() の戻り値を key のスナップショットとして公開する。intervals は {phase: 秒}。
+        lane を指定すると、同じレーンのジョブだけを順に実行する専用スレッドで動かす。
+        """
+        with self._lock:
+            self._jobs[key] = Job(key, func, intervals, lane)
+        self._wake.set()
+
+    def _lane(self, lane):
+        """レーンの実行スレッド。stop() で止めたレーンは次に使うときに作り直す。"""
+        with self._lock:
+            if lane not in self._lanes:
+                self._lanes[lane] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"prefetch-{lane}")
+            return self._lanes[lane]
+
+    def running(self, key):
+        """key のジョブが実行中か (バックグラウンド・refresh() のどちらでも)。"""
+        job = self._jobs.get(key)
+        return job is not None and job.lock.locked()
+
+    def snapshot(self, key):
+        with self._lock:
+            return self._snapshots.get(key)
+
+    def snapshots(self):
+        with self._lock:
+            return dict(self._snapshots)
+
+    def refresh(self, key, **kwargs):
+        """key のジョブを呼び出し元スレッドで即時実行し、新しいスナップショットを返す。"""
+        job = self._jobs[key]
+        with job.lock:
+            return self._run(job, **kwargs)
+
+    def force(self, key=None):
+        """次のループで (key 指定時はそのジョブだけ) 即時更新させる。"""
+        with self._lock:
+            for job in self._jobs.values():
+                if key is None or job.key == key:
+                    job.next_run = 0.0
+        self._wake.set()
+
+    def _run(self, job, **kwargs):
+        started = time.monotonic()
+        prev = self.snapshot(job.key)
+        try:
+            with METRICS.span("job", key=job.key):
+                data, error = job.func(**kwargs), None
+        except Exception as e:
+            # 失敗時は前回のデータを残し、エラーだけを記録する
+            data, error = (prev.data if prev else None), str(e)
+        snap = Snapshot(job.key, (prev.version + 1) if prev else 1, data,
+                        datetime.now(JST), time.monotonic() - started, error)
+        with self._lock:
+            self._snapshots[job.key] = snap
+        job.next_run = time.monotonic() + job.interval(self.phase_func())
+        return snap
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            now = time.monotonic()
+            with self._lock:
+                due = [j for j in self._jobs.values() if j.next_run <= now]
+            for job in due:
+                if self._stop.is_set():
+                    break
+                # 強制更新などで実行中のジョブは飛ばす
+                if not job.lock.acquire(blocking=False):
+                    continue
+                if job.lane is None:
+                    try:
+                        self._run(job)
+                    finally:
+                        job.lock.release()
+                else:
+                    self._dispatch(job)
+            with self._lock:
+                next_due = min((j.next_run for j in self._jobs.values()), default=now + 60)
+            self._wake.wait(timeout=min(60.0, max(0.5, next_due - time.monotonic())))
+
+    def _dispatch(self, job):
+        """job.lock を取得済みの job をレーンに渡す。渡せなかった・取り消された場合はロックと実行時刻を戻す。"""
+        due = job.next_run
+
+        def release(future=None):
+            if future is None or future.cancelled():
+                job.next_run = due
+                job.lock.release()
+
+        # 完了時に _run が次回の実行時刻を設定するまで、このループでは選ばない
+        job.next_run = float("inf")
+        try:
+            if self._stop.is_set():
+                raise RuntimeError("scheduler stopped")
+            future = self._lane(job.lane).submit(self._run_in_lane, job)
+        except RuntimeError as e:
+            METRICS.error("scheduler.lane", e)
+            release()
+            return
+        future.add_done_callback(release)
+
+    def _run_in_lane(self, job):
+        try:
+            self._run(job)
+        finally:
+            job.lock.release()
+            self._wake.set()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="prefetch-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            lanes, self._lanes = list(self._lanes.values()), {}
+        for lane in lanes:
+            lane.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,554 @@
+import hashlib
+import heapq
+import queue
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from metrics import METRICS
+from parsers import RANKING_IDXS, compact_ranking, decode_response, get_parser, ranking_frame
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+}
+
+# ==========================================
+# ランキング取得先 (株探)
+# ==========================================
+KABUTAN_BASE = "https://kabutan.jp"
+
+RANKING_TARGETS = {
+    "PTS": [
+        ("/warning/pts_night_price_increase", "急騰"),
+        ("/warning/pts_night_price_decrease", "急落")
+    ],
+    "PTS_DAY": [
+        ("/warning/pts_day_price_increase", "急騰"),
+        ("/warning/pts_day_price_decrease", "急落")
+    ],
+    "Daytime": [
+        ("/warning/?mode=2_1", "急騰"),
+        ("/warning/?mode=2_2", "急落")
+    ],
+}
+
+MAX_PAGES = 20
+
+
+def ranking_page_url(base_url, page):
+    separator = "&" if "?" in base_url else "?"
+    return base_url if page == 1 else f"{base_url}{separator}page={page}"
+
+
+# ==========================================
+# 取得エンジン: ホスト単位レート制限 + 同時接続数上限
+# ==========================================
+class HostRateLimiter:
+    """ホストごとにリクエスト開始間隔を 1/rate 秒以上あける。"""
+
+    def __init__(self, rate_per_sec=5.0):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec and rate_per_sec > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if self.interval <= 0:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CircuitOpenError(requests.RequestException):
+    """ホストへの連続失敗で遮断中のため、リクエストを送らずに失敗させた。"""
+
+
+class CircuitBreaker:
+    """
+    ホスト単位のサーキットブレーカー。failure_threshold 回連続で失敗すると cooldown 秒間リクエストを遮断し、
+    経過後は試行を1回だけ通して、成功すれば復帰・失敗すれば再び遮断する。
+    """
+
+    def __init__(self, host, failure_threshold=5, cooldown=30.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def check(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = None
+                self.failures = self.failure_threshold - 1
+                return
+        METRICS.incr("http.circuit_rejected", host=self.host)
+        raise CircuitOpenError(f"{self.host} への接続を一時停止中です (連続{self.failure_threshold}回失敗)")
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                METRICS.incr("http.circuit_opened", host=self.host)
+
+
+class _InflightCall:
+    """同一URLの同時リクエストを1回の取得にまとめるための待ち合わせ。"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def resolve(self, response=None, error=None):
+        self.response, self.error = response, error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+# 一時的な障害とみなして再試行するステータス
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PageFetcher:
+    """
+    keep-alive セッションを共有するページ取得クライアント。
+    同じURLへの同時リクエストは1回の取得を共有し、成功した応答は cache_ttl 秒だけ再利用する。
+    接続エラー・タイムアウト・5xx はジッター付き指数バックオフで retries 回まで再試行し、
+    連続して失敗したホストはサーキットブレーカーで一時的に遮断する。
+    ETag / Last-Modified を返すURLは次回から条件付きGETとし、304 なら前回の本文から応答を組み立て直して返す。
+    前回の本文は圧縮して保持し、合計 validator_budget バイトを超えたら古いURLから捨てる。
+    """
+
+    def __init__(self, rate_per_sec=5.0, max_workers=4, timeout=10, session=None, cache_ttl=5.0,
+                 cache_size=256, retries=2, backoff=0.5, failure_threshold=5, cooldown=30.0,
+                 validator_size=512, validator_max_bytes=1_000_000, validator_budget=16_000_000):
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.limiter = HostRateLimiter(rate_per_sec)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.validator_size = validator_size
+        self.validator_max_bytes = validator_max_bytes
+        self.validator_budget = validator_budget
+        self._validator_bytes = 0
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._inflight = {}
+        self._breakers = {}
+        self._validators = {}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        session.headers.update(HEADERS)
+        self.session = session
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.cooldown)
+            return self._breakers[host]
+
+    def open_circuits(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [b.host for b in breakers if b.is_open]
+
+    def get(self, url, timeout=None, max_age=None):
+        """url を取得する。max_age 秒以内に取得済みの応答があればそれを返す (既定は cache_ttl)。"""
+        max_age = self.cache_ttl if max_age is None else max_age
+        with self._lock:
+            cached = self._cache.get(url)
+            if cached and max_age > 0 and time.monotonic() - cached[0] <= max_age:
+                METRICS.incr("http.cache", result="hit")
+                return cached[1]
+            call = self._inflight.get(url)
+            leader = call is None
+            if leader:
+                call = self._inflight[url] = _InflightCall()
+        if not leader:
+            METRICS.incr("http.coalesced", host=urlsplit(url).netloc)
+            return call.wait()
+
+        try:
+            res = self._fetch(url, timeout)
+        except Exception as e:
+            call.resolve(error=e)
+            raise
+        else:
+            call.resolve(response=res)
+            if res.status_code == 200 and self.cache_ttl > 0:
+                self._store(url, res)
+            return res
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def _store(self, url, res):
+        with self._lock:
+            now = time.monotonic()
+            self._cache.pop(url, None)
+            self._cache[url] = (now, res)
+            # 挿入順 = 取得順なので、先頭から期限切れ・上限超過の分を捨てる
+            while self._cache:
+                oldest = next(iter(self._cache))
+                if len(self._cache) <= self.cache_size and now - self._cache[oldest][0] <= self.cache_ttl:
+                    break
+                self._cache.pop(oldest)
+
+    def _conditional_headers(self, url):
+        with self._lock:
+            entry = self._validators.get(url)
+        if entry is None:
+            return {}, None
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers, entry
+
+    def _remember_validators(self, url, res):
+        etag, last_modified = res.headers.get("ETag"), res.headers.get("Last-Modified")
+        if not (etag or last_modified) or len(res.content) > self.validator_max_bytes:
+            return
+        entry = _Validator(etag, last_modified, res)
+        with self._lock:
+            self._drop_validator(url)
+            self._validators[url] = entry
+            self._validator_bytes += len(entry.body)
+            while self._validators and (len(self._validators) > self.validator_size
+                                        or self._validator_bytes > self.validator_budget):
+                self._drop_validator(next(iter(self._validators)))
+
+    def _drop_validator(self, url):
+        entry = self._validators.pop(url, None)
+        if entry is not None:
+            self._validator_bytes -= len(entry.body)
+
+    def _fetch(self, url, timeout):
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        headers, previous = self._conditional_headers(url)
+        for attempt in range(self.retries + 1):
+            breaker.check()
+            res, error = None, None
+            try:
+                with self._slots:
+                    self.limiter.wait(url)
+                    with METRICS.span("http.get", host=host):
+                        res = self.session.get(url, timeout=timeout or self.timeout, headers=headers)
+            except requests.RequestException as e:
+                error = e
+            else:
+                METRICS.incr("http.requests", host=host, status=res.status_code)
+                METRICS.incr("http.bytes", len(res.content), host=host)
+                if res.status_code == 304 and previous is not None:
+                    breaker.record(True)
+                    return previous.response(url)
+                if res.status_code not in RETRY_STATUS:
+                    breaker.record(True)
+                    if res.status_code == 200:
+                        self._remember_validators(url, res)
+                    return res
+            breaker.record(False)
+            if attempt == self.retries:
+                if error is not None:
+                    raise error
+                return res
+            METRICS.incr("http.retries", host=host)
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def close(self):
+        self.session.close()
+
+
+class _Validator:
+    """条件付きGET用に、ETag / Last-Modified と前回の本文 (圧縮) だけを保持する。"""
+    __slots__ = ("etag", "last_modified", "body", "content_type", "encoding")
+
+    def __init__(self, etag, last_modified, res):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = zlib.compress(res.content, 6)
+        self.content_type = res.headers.get("Content-Type")
+        self.encoding = res.encoding
+
+    def response(self, url):
+        """304 のときに返す、前回の 200 応答と同じ本文の Response。"""
+        res = requests.Response()
+        res.status_code = 200
+        res.url = url
+        res._content = zlib.decompress(self.body)
+        res.encoding = self.encoding
+        res.headers = CaseInsensitiveDict({k: v for k, v in (("Content-Type", self.content_type), ("ETag", self.etag),
+                                                              ("Last-Modified", self.last_modified)) if v})
+        return res
+
+
+# ==========================================
+# 解析: ランキング1ページ分
+# ==========================================
+def parse_ranking_page(html, label, threshold=0.0, idxs=RANKING_IDXS, parser=None):
+    """ランキング表の行を DataFrame (RANKING_COLUMNS) で返す。表が無ければ None。"""
+    with METRICS.span("parse.ranking"):
+        return get_parser(parser).ranking(html, label, threshold, idxs)
+
+
+class ParsedPageCache:
+    """
+    URL ごとに直前の本文ハッシュと解析結果を保持し、本文が変わっていなければ解析を省いて前回の結果を返す。
+    高頻度のポーリングでは大半のページが前回と同じため、取得後の解析コストがほぼ無くなる。
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_parse(self, key, content, parse):
+        digest = hashlib.sha1(content).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == digest:
+            METRICS.incr("parse_cache", result="hit")
+            return entry[1]
+        METRICS.incr("parse_cache", result="miss")
+        parsed = parse()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (digest, parsed)
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        return parsed
+
+
+RANKING_PAGE_CACHE = ParsedPageCache()
+
+
+def build_ranking_frame(results):
+    """
+    ターゲットごとのページ表のリストを1つの表に連結し、先に現れた銘柄コードを優先して重複排除する。
+    列の型は compact_ranking で省メモリ化する。
+    """
+    frames = [frame for frames in results for frame in frames if not frame.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else ranking_frame([], "")
+    df = df.drop_duplicates("Code", keep="first").reset_index(drop=True)
+    return compact_ranking(df)
+
+
+def count_rows(results):
+    return sum(len(frame) for frames in results for frame in frames)
+
+
+# ==========================================
+# ランキング取得 (急騰/急落を並列取得し、ページ到着順に逐次処理)
+# ==========================================
+class RankingPage:
+    """
+    iter_ranking_pages が1ページ取得・解析するごとに返すイベント。
+    rows はそのページの表、results はターゲットごとの取得済みページ表のリスト、failures は取得・解析に失敗したページ [(label, page, error), ...]。
+    """
+
+    def __init__(self, target, label, page, rows, results, done_pages, active_targets, failures):
+        self.target = target
+        self.label = label
+        self.page = page
+        self.rows = rows
+        self.results = results
+        self.done_pages = done_pages
+        self.active_targets = active_targets
+        self.failures = failures
+
+
+def iter_ranking_pages(mode, fetcher, base_url=KABUTAN_BASE, max_pages=MAX_PAGES, threshold=0.0,
+                       stop_on_empty=True, parser=None, page_cache=RANKING_PAGE_CACHE):
+    """
+    急騰・急落の各ターゲットをスレッドで並列に巡回し、解析済みのページを到着順に RankingPage で返すジェネレータ。
+    呼び出し側がループを抜ける (ジェネレータを閉じる) と、各スレッドは次のページを取得せずに終了する。
+    本文が前回取得時と同じページは page_cache の解析結果を再利用する。
+    """
+    targets = [(base_url + path, label) for path, label in RANKING_TARGETS.get(mode, RANKING_TARGETS["Daytime"])]
+    results = [[] for _ in targets]
+    failures = []
+    events = queue.Queue()
+    stop = threading.Event()
+
+    def crawl(idx, target_url, label):
+        try:
+            for page in range(1, max_pages + 1):
+                if stop.is_set():
+                    break
+                try:
+                    url = ranking_page_url(target_url, page)
+                    res = fetcher.get(url)
+                    # 再試行しきった 429 / 5xx などは表なし (最終ページ) と区別し、取得失敗として記録する
+                    if res.status_code != 200:
+                        raise requests.HTTPError(f"HTTP {res.status_code}: {url}", response=res)
+                    rows = page_cache.get_or_parse(
+                        (url, label, threshold, parser), res.content,
+                        lambda: parse_ranking_page(decode_response(res), label, threshold, parser=parser)
+                    )
+                except Exception as e:
+                    METRICS.error("ranking.page", e)
+                    failures.append((label, page, e))
+                    break
+                if rows is None:
+                    break
+                METRICS.incr("ranking.pages", mode=mode)
+                events.put((idx, label, page, rows))
+                if stop_on_empty and rows.empty:
+                    break
+        finally:
+            events.put((idx, None, None, None))
+
+    pool = ThreadPoolExecutor(max_workers=len(targets))
+    try:
+        for i, (target_url, label) in enumerate(targets):
+            pool.submit(crawl, i, target_url, label)
+        active = len(targets)
+        done_pages = 0
+        while active:
+            idx, label, page, rows = events.get()
+            if label is None:
+                active -= 1
+                yield RankingPage(idx, None, None, None, results, done_pages, active, failures)
+                continue
+            results[idx].append(rows)
+            done_pages += 1
+            yield RankingPage(idx, label, page, rows, results, done_pages, active, failures)
+    finally:
+        stop.set()
+        pool.shutdown(wait=True)
+
+
+class TopNTracker:
+    """
+    各ターゲットの行が |変動率| の降順で届くことを利用し、上位 top_n 件が今後変わり得なくなったかを判定する。
+    どのターゲットの直近行も現在の top_n 番目より小さければ、以降のページで順位が入れ替わることはない。
+    降順でない行が届いた場合は判定をやめ (常に False)、最後まで取得する。
+    """
+
+    def __init__(self, top_n, n_targets):
+        self.top_n = top_n
+        self._heap = []
+        self._codes = set()
+        self._last_abs = [float("inf")] * n_targets
+        self._finished = [False] * n_targets
+        self.ordered = True
+
+    def add(self, target, rows):
+        if self.top_n <= 0:
+            return
+        for code, value in zip(rows["Code"].tolist(), rows["Change_Pct"].abs().tolist()):
+            if value > self._last_abs[target]:
+                self.ordered = False
+            self._last_abs[target] = value
+            if code in self._codes:
+                continue
+            self._codes.add(code)
+            if len(self._heap) < self.top_n:
+                heapq.heappush(self._heap, value)
+            elif value > self._heap[0]:
+                heapq.heapreplace(self._heap, value)
+
+    def finish(self, target):
+        self._finished[target] = True
+
+    def settled(self):
+        if self.top_n <= 0 or not self.ordered or len(self._heap) < self.top_n:
+            return False
+        kth = self._heap[0]
+        return all(done or last < kth for done, last in zip(self._finished, self._last_abs))
+
+
+def fetch_ranking(mode, threshold, max_items, fetcher=None, base_url=KABUTAN_BASE,
+                  max_pages=MAX_PAGES, stop_on_empty=True, progress=None, parser=None, partial=None,
+                  page_cache=RANKING_PAGE_CACHE):
+    """
+    急騰・急落の各ターゲットを並列に取得し、旧実装と同じ列の DataFrame を返す。
+    max_items > 0 のときは |変動率| の上位 max_items 件が確定した時点で全ターゲットの取得を打ち切り、
+    結果の attrs["complete"] を False にする。取得に失敗したページがあれば attrs["failed_pages"] に記録し、
+    1件も取得できなかった場合は空の表を返さずに例外を送出する (前回の結果を残せるように)。
+    progress(done_pages, total_pages, label, page, n_rows) と partial(DataFrame) は呼び出し元スレッドで呼ばれる。
+    total_pages は「取得済みページ数 + 取得中のターゲット数」の見込み値。
+    page_cache は本文が変わっていないページの解析結果を再利用するキャッシュ (iter_ranking_pages を参照)。
+    """
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = PageFetcher()
+
+    tracker = TopNTracker(max_items, len(RANKING_TARGETS.get(mode, RANKING_TARGETS["Daytime"])))
+    results = []
+    failures = []
+    stopped_early = False
+    pages = iter_ranking_pages(mode, fetcher, base_url, max_pages, threshold, stop_on_empty, parser, page_cache)
+    try:
+        for ev in pages:
+            results, failures = ev.results, ev.failures
+            if ev.label is None:
+                tracker.finish(ev.target)
+                continue
+            tracker.add(ev.target, ev.rows)
+            if progress:
+                n_rows = count_rows(ev.results)
+                progress(ev.done_pages, ev.done_pages + ev.active_targets, ev.label, ev.page, n_rows)
+            if partial:
+                partial(build_ranking_frame(ev.results))
+            if tracker.settled():
+                stopped_early = ev.active_targets > 0
+                break
+    finally:
+        pages.close()
+        if own_fetcher:
+            fetcher.close()
+
+    if stopped_early:
+        METRICS.incr("ranking.early_stop", mode=mode)
+    if failures and not count_rows(results):
+        label, page, error = failures[0]
+        raise RuntimeError(f"ランキングを取得できませんでした ({label} {page}ページ目: {error})") from error
+    with METRICS.span("ranking.build", mode=mode):
+        df = build_ranking_frame(results)
+    df.attrs["complete"] = not (stopped_early or failures)
+    df.attrs["stopped_early"] = stopped_early
+    df.attrs["failed_pages"] = [(label, page, str(error)) for label, page, error in failures]
+    return df
\ No newline at end of file
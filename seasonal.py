@@ -0,0 +1,89 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 季節性アナログ: 過去の同じ時期の値動きを今年の暦に重ねる
+# ==========================================
+MAX_YEARS = 10
+LOOKBACK_DAYS = 120
+HORIZON_DAYS = 60
+BANDS = ((10, 90), (25, 75))
+
+
+class SeasonalAnalogs:
+    """
+    offsets は基準日 (今日・各年の同じ月日) からの暦日数、paths は 年×offset の騰落率 (%)。
+    current は今年の基準日までの騰落率、mean と bands[(lo, hi)] は過去年の平均と分位点。
+    """
+
+    def __init__(self, anchor, offsets, years, paths, current):
+        self.anchor = anchor
+        self.offsets = offsets
+        self.years = years
+        self.paths = paths
+        self.current = current
+        with warnings.catch_warnings():
+            # 全年が欠損の列で出る "Mean of empty slice" などの警告は無視する
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            self.mean = np.nanmean(paths, axis=0) if len(years) else np.full(len(offsets), np.nan)
+            self.bands = {
+                (lo, hi): (np.nanpercentile(paths, lo, axis=0), np.nanpercentile(paths, hi, axis=0))
+                for lo, hi in BANDS
+            } if len(years) > 1 else {}
+
+    @property
+    def dates(self):
+        """offsets を今年の日付に置き換えた横軸。"""
+        return pd.Timestamp(self.anchor) + pd.to_timedelta(self.offsets, unit="D")
+
+
+def _same_day(anchor, years_ago):
+    try:
+        return anchor.replace(year=anchor.year - years_ago)
+    except ValueError:
+        return anchor.replace(year=anchor.year - years_ago, day=28)
+
+
+def seasonal_analogs(daily, anchor, years=5, lookback_days=LOOKBACK_DAYS, horizon_days=HORIZON_DAYS):
+    """
+    日足 (Close 列) から、anchor と同じ月日を基準にした過去 years 年分 (最大 MAX_YEARS) の値動きを揃えて返す。
+    終値を暦日に前方補完した1本の配列から、各年の基準位置 + offset をまとめて取り出して 年×offset の行列にし、
+    基準日の終値を 0% として正規化する (データの無い期間は NaN)。
+    """
+    years = max(0, min(int(years), MAX_YEARS))
+    offsets = np.arange(-lookback_days, horizon_days + 1)
+    close = daily["Close"].dropna()
+    if close.empty:
+        return SeasonalAnalogs(anchor, offsets, [], np.empty((0, len(offsets))), np.full(len(offsets), np.nan))
+
+    dates = close.index.tz_localize(None).normalize() if close.index.tz is not None else close.index.normalize()
+    close = pd.Series(close.to_numpy(dtype=float), index=dates)
+    close = close[~close.index.duplicated(keep="last")]
+    # 基準日に足が無い (未取得・休日) 場合は直近の足の日を今年の基準日とする
+    anchor = min(pd.Timestamp(anchor), close.index[-1]).date()
+    first_day = close.index[0]
+    calendar = pd.date_range(first_day, pd.Timestamp(anchor) + pd.Timedelta(days=horizon_days), freq="D")
+    values = close.reindex(calendar).ffill().to_numpy(dtype=float, copy=True)
+    # 最終取得日より後 (今年の未来部分) は補完しない
+    values[calendar > close.index[-1]] = np.nan
+
+    anchors = [pd.Timestamp(_same_day(anchor, k)) for k in range(years + 1)]
+    positions = np.array([(a - first_day).days for a in anchors])
+    grid = positions[:, None] + offsets[None, :]
+    valid = (grid >= 0) & (grid < len(values))
+    matrix = np.where(valid, values[np.clip(grid, 0, len(values) - 1)], np.nan)
+
+    base = matrix[:, lookback_days]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = (matrix / base[:, None] - 1) * 100
+
+    current = normalized[0].copy()
+    current[offsets > 0] = np.nan
+    past = normalized[1:]
+    # 基準日にデータが無い年 (上場前など) は除く
+    has_base = ~np.isnan(base[1:])
+    year_labels = [a.year for a in anchors[1:]]
+    return SeasonalAnalogs(anchor, offsets, [y for y, ok in zip(year_labels, has_base) if ok],
+                           past[has_base], current)
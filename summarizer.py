@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from metrics import METRICS
+from ohlcv_store import DATA_DIR
+from scraper import PageFetcher
+
+# ==========================================
+# 適時開示PDFのAI要約 (ディスクキャッシュ + 並列事前要約)
+# ==========================================
+MODEL_NAME = 'gemini-1.5-flash'
+
+PROMPT = """
+あなたはプロの株式アナリストです。添付された適時開示（PDF）を読み取り、個人投資家向けに分かりやすく分析してください。
+
+### 📊 決算・開示スコア (5段階評価)
+* サプライズ度: (★1〜5)
+* 業績モメンタム: (★1〜5)
+
+### 📝 発表の要点 (3行で)
+* ### 💡 ポジティブ材料 / ⚠️ ネガティブ材料
+* ### 🎯 投資家への示唆 (今後の注目ポイント)
+* """
+
+
+class GeminiModel:
+    def __init__(self, api_key, model_name=MODEL_NAME):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.name = model_name
+
+    def generate(self, pdf_bytes, prompt):
+        ai_res = self.model.generate_content([
+            {"mime_type": "application/pdf", "data": pdf_bytes},
+            prompt
+        ])
+        return ai_res.text
+
+
+class HttpModel:
+    """
+    ローカルの代替モデル (テスト用スタンドイン) を呼ぶクライアント。
+    {"prompt": ..., "pdf_base64": ...} を POST し、JSON の "text" を要約として受け取る。
+    """
+
+    def __init__(self, endpoint, timeout=60):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.name = f"http:{endpoint}"
+
+    def generate(self, pdf_bytes, prompt):
+        res = requests.post(self.endpoint, timeout=self.timeout, json={
+            "prompt": prompt, "pdf_base64": base64.b64encode(pdf_bytes).decode("ascii")
+        })
+        res.raise_for_status()
+        return res.json()["text"]
+
+
+def make_model(api_key):
+    """環境変数 SUMMARY_MODEL_ENDPOINT があればローカル代替モデル、なければ Gemini を使う。"""
+    endpoint = os.environ.get("SUMMARY_MODEL_ENDPOINT")
+    if endpoint:
+        return HttpModel(endpoint)
+    return GeminiModel(api_key)
+
+
+class SummaryCache:
+    """PDFのURLと内容ハッシュの両方をキーに要約をJSONで保存する。"""
+
+    def __init__(self, root=None):
+        self.root = os.path.join(root or DATA_DIR, "summaries")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, f"{kind}_{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+    def _read(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get_by_url(self, url):
+        return self._read(self._path("url", url))
+
+    def get_by_content(self, content_hash):
+        return self._read(self._path("sha", content_hash))
+
+    def put(self, url, content_hash, text, model_name):
+        entry = {"url": url, "content_hash": content_hash, "text": text, "model": model_name,
+                 "created_at": datetime.now().isoformat(timespec="seconds")}
+        for path in (self._path("url", url), self._path("sha", content_hash)):
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        return entry
+
+
+class Summarizer:
+    """
+    要約サービス。キャッシュ済みなら即時に返し、未要約ならPDFを取得してモデルを呼ぶ。
+    submit() で複数PDFを上限付きのワーカープールで事前要約する。
+    """
+
+    def __init__(self, model, cache=None, fetch=None, max_workers=3, prompt=PROMPT):
+        self.model = model
+        self.cache = cache or SummaryCache()
+        self.fetch = fetch or PageFetcher(rate_per_sec=2.0, max_workers=max_workers, cache_ttl=0).get
+        self.prompt = prompt
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def cached(self, url):
+        entry = self.cache.get_by_url(url)
+        return entry["text"] if entry else None
+
+    def summarize(self, url):
+        entry = self.cache.get_by_url(url)
+        if entry:
+            METRICS.incr("summary.cache", result="url")
+            return entry["text"]
+        res = self.fetch(url)
+        res.raise_for_status()
+        content_hash = hashlib.sha256(res.content).hexdigest()
+        entry = self.cache.get_by_content(content_hash)
+        if entry:
+            # 同じPDFが別URLで公開されている場合はURL側にも登録する
+            METRICS.incr("summary.cache", result="content")
+            return self.cache.put(url, content_hash, entry["text"], entry["model"])["text"]
+        METRICS.incr("summary.cache", result="miss")
+        with METRICS.span("summary.generate"):
+            text = self.model.generate(res.content, self.prompt)
+        return self.cache.put(url, content_hash, text, self.model.name)["text"]
+
+    def submit(self, urls):
+        """未要約のURLをバックグラウンドに投入する。投入済みのもの (失敗を含む) は再投入しない。"""
+        queued = 0
+        with self._lock:
+            for url in urls:
+                if url in self._futures or self.cached(url):
+                    continue
+                self._futures[url] = self._pool.submit(self.summarize, url)
+                queued += 1
+        return queued
+
+    def status(self, url):
+        """要約状態を "done" / "pending" / "error" / None (未投入) で返す。"""
+        if self.cached(url):
+            return "done"
+        with self._lock:
+            fut = self._futures.get(url)
+        if fut is None:
+            return None
+        if not fut.done():
+            return "pending"
+        return "error" if fut.exception() else "done"
+
+    def error(self, url):
+        with self._lock:
+            fut = self._futures.get(url)
+        return fut.exception() if fut and fut.done() else None
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+from datetime import datetime
+
+from metrics import METRICS
+from parsers import get_parser
+from scraper import PageFetcher
+
+# ==========================================
+# TDnet 適時開示一覧
+# ==========================================
+TDNET_LIST_URL = "https://www.release.tdnet.info/inbs/I_list_{}_{}.html"
+TDNET_ROOT_URL = "https://www.release.tdnet.info/inbs/"
+MAX_PAGES = 200
+
+
+def parse_tdnet_page(html, root_url=TDNET_ROOT_URL, parser=None):
+    """一覧1ページ分を (銘柄コード4桁, {"time", "title", "url"}) のリストで返す。"""
+    with METRICS.span("parse.tdnet"):
+        return get_parser(parser).tdnet(html, root_url)
+
+
+def _row_key(code, item):
+    return (code, item["time"], item["title"], item["url"])
+
+
+class TdnetDayState:
+    """1日分の取り込み状態 (既読ページ・既読行・マージ済み disclosure_map)。"""
+
+    def __init__(self, date_str):
+        self.date_str = date_str
+        self.disclosure_map = {}
+        self.seen_rows = set()
+        self.page_hashes = {}
+        self.complete = False
+        self.failed_pages = []
+        self.new_rows = 0
+        self.pages_fetched = 0
+        self.pages_parsed = 0
+        self.updated_at = None
+
+    @property
+    def truncated(self):
+        return bool(self.failed_pages)
+
+
+class TdnetIngester:
+    """
+    TDnet 一覧を日付単位で差分取得する。
+
+    一覧は新しい開示が先頭に追加されるため、前回の取得が最後まで完了していれば
+    既読の行を含むページに到達した時点で打ち切る。内容が前回と同一のページは解析しない。
+    取得に失敗したページは failed_pages に記録し、次回は最後まで取得し直す。
+    """
+
+    def __init__(self, fetcher=None, list_url=TDNET_LIST_URL, root_url=TDNET_ROOT_URL,
+                 max_pages=MAX_PAGES, timeout=5, parser=None, listeners=None):
+        self.fetcher = fetcher or PageFetcher(rate_per_sec=10.0)
+        self.list_url = list_url
+        self.root_url = root_url
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.parser = parser
+        # 新着行の通知先: listener(date_str, [(code, item), ...], complete)
+        self.listeners = list(listeners or [])
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, date_str):
+        with self._lock:
+            if date_str not in self._states:
+                self._states[date_str] = (TdnetDayState(date_str), threading.Lock())
+            return self._states[date_str]
+
+    def report(self, target_date):
+        return self._state(target_date.strftime('%Y%m%d'))[0]
+
+    def refresh(self, target_date):
+        state, day_lock = self._state(target_date.strftime('%Y%m%d'))
+        with day_lock, METRICS.span("tdnet.refresh"):
+            self._refresh(state)
+        METRICS.incr("tdnet.pages_fetched", state.pages_fetched)
+        METRICS.incr("tdnet.pages_parsed", state.pages_parsed)
+        METRICS.incr("tdnet.new_rows", state.new_rows)
+        return state
+
+    def _refresh(self, state):
+        was_complete = state.complete
+        state.failed_pages = []
+        state.new_rows = 0
+        state.pages_fetched = 0
+        state.pages_parsed = 0
+        fresh = []
+        reached_end = False
+
+        for page in range(1, self.max_pages + 1):
+            url = self.list_url.format(f"{page:03}", state.date_str)
+            try:
+                res = self.fetcher.get(url, timeout=self.timeout)
+            except Exception as e:
+                state.failed_pages.append((page, str(e)))
+                break
+            state.pages_fetched += 1
+            if res.status_code == 404:
+                reached_end = True
+                break
+            if res.status_code != 200:
+                state.failed_pages.append((page, f"HTTP {res.status_code}"))
+                break
+
+            digest = hashlib.sha1(res.content).hexdigest()
+            if state.page_hashes.get(page) == digest:
+                if was_complete:
+                    break
+                continue
+
+            res.encoding = 'utf-8'
+            try:
+                items = parse_tdnet_page(res.text, self.root_url, parser=self.parser)
+            except Exception as e:
+                state.failed_pages.append((page, f"parse error: {e}"))
+                break
+            state.pages_parsed += 1
+            state.page_hashes[page] = digest
+
+            hit_known = False
+            for code, item in items:
+                key = _row_key(code, item)
+                if key in state.seen_rows:
+                    hit_known = True
+                    continue
+                state.seen_rows.add(key)
+                fresh.append((code, item))
+            if hit_known and was_complete:
+                break
+        else:
+            state.failed_pages.append((self.max_pages + 1, "page limit reached"))
+
+        # 新着行は既存行より新しいため、銘柄ごとに先頭へ差し込む
+        new_by_code = {}
+        for code, item in fresh:
+            new_by_code.setdefault(code, []).append(item)
+        for code, items in new_by_code.items():
+            state.disclosure_map[code] = items + state.disclosure_map.get(code, [])
+        state.new_rows = len(fresh)
+
+        if state.failed_pages:
+            state.complete = False
+        elif reached_end or was_complete:
+            state.complete = True
+        state.updated_at = datetime.now()
+
+        for listener in self.listeners:
+            listener(state.date_str, fresh, state.complete)
@@ -0,0 +1,260 @@
+import os
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from ohlcv_store import DATA_DIR
+
+# ==========================================
+# TDnet 適時開示アーカイブ (SQLite)
+# ==========================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS disclosures (
+    code TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (date, code, time, title, url)
+);
+CREATE INDEX IF NOT EXISTS idx_disclosures_code_date ON disclosures (code, date, time);
+CREATE INDEX IF NOT EXISTS idx_disclosures_date ON disclosures (date, time);
+CREATE TABLE IF NOT EXISTS archive_days (
+    date TEXT PRIMARY KEY,
+    complete INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS title_grams (
+    gram TEXT NOT NULL,
+    date TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, date, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_doc_id INTEGER NOT NULL
+);
+"""
+# 日付を持たない旧形式の索引。見つかれば削除して title_grams を作り直す
+LEGACY_INDEX = "title_index"
+
+# 開示種別ごとの検索キーワード (いずれかを含めば該当)
+CATEGORY_KEYWORDS = {
+    "上方修正": ["上方修正"],
+    "下方修正": ["下方修正"],
+    "業績予想修正": ["業績予想の修正", "業績予想修正", "業績修正"],
+    "決算短信": ["決算短信"],
+    "自己株式取得": ["自己株式の取得", "自己株式取得", "自社株買"],
+    "配当": ["配当"],
+    "株式分割": ["株式分割"],
+    "業務提携": ["業務提携", "資本提携"],
+    # "株式取得" 単独だと "自己株式取得" (自社株買い) にも一致するため、子会社化を伴う取得に限る
+    "M&A・TOB": ["公開買付", "株式の取得(子会社化)", "子会社化", "合併", "株式交換"],
+    "新株・増資": ["新株", "募集株式", "第三者割当", "新株予約権"],
+}
+
+
+def normalize_text(text):
+    """全角・半角と大文字小文字の揺れを吸収し、空白を除く。"""
+    return "".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def ngrams(text, n=2):
+    """正規化済み文字列の文字 n-gram の集合 (n より短い場合は文字列そのもの)。"""
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _iso(date_str):
+    return f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
+
+
+class TdnetArchive:
+    """
+    TDnet の開示を (銘柄コード, 日付, 時刻) で索引付けして保存する。
+    TdnetIngester の listener として登録すると、新着行だけが差分で追記される。
+    タイトルは (bigram, 日付) をキーとする転置索引にも同時に追加され、search() でキーワード・開示種別を検索できる。
+    索引は日付で先に絞り込むため、検索のコストはアーカイブ全体ではなく指定期間の件数で決まる。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DATA_DIR, "tdnet.sqlite3")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (LEGACY_INDEX,)).fetchone():
+                conn.execute(f"DROP TABLE {LEGACY_INDEX}")
+                conn.execute("DELETE FROM index_state")
+            # 索引導入前に保存された開示があれば、ここで索引に追加する
+            self._index_new(conn)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- 書き込み ---
+    def on_rows(self, date_str, rows, complete):
+        """TdnetIngester から新着行 [(code, {"time", "title", "url"}), ...] を受け取る。"""
+        day = _iso(date_str)
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO disclosures (code, date, time, title, url) VALUES (?, ?, ?, ?, ?)",
+                [(code, day, item["time"], item["title"], item["url"]) for code, item in rows]
+            )
+            self._index_new(conn)
+            conn.execute(
+                "INSERT INTO archive_days (date, complete, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(date) DO UPDATE SET complete = excluded.complete, updated_at = excluded.updated_at",
+                (day, int(complete), datetime.now().isoformat(timespec="seconds"))
+            )
+
+    def _index_new(self, conn):
+        """未索引の開示 (rowid が前回索引済みより大きいもの) のタイトルを (bigram, 日付) の転置索引に追加する。"""
+        row = conn.execute("SELECT last_doc_id FROM index_state WHERE id = 1").fetchone()
+        last_doc_id = row[0] if row else 0
+        docs = conn.execute("SELECT rowid, date, title FROM disclosures WHERE rowid > ? ORDER BY rowid", (last_doc_id,)).fetchall()
+        if not docs:
+            return
+        conn.executemany(
+            "INSERT OR IGNORE INTO title_grams (gram, date, doc_id) VALUES (?, ?, ?)",
+            [(gram, day, doc_id) for doc_id, day, title in docs for gram in ngrams(normalize_text(title))]
+        )
+        conn.execute(
+            "INSERT INTO index_state (id, last_doc_id) VALUES (1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET last_doc_id = excluded.last_doc_id",
+            (docs[-1][0],)
+        )
+
+    def complete_days(self, start, end):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date FROM archive_days WHERE complete = 1 AND date BETWEEN ? AND ?",
+                (start.isoformat(), end.isoformat())
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def backfill(self, ingester, start, end, today=None):
+        """
+        start〜end の平日のうち、取得が完了していない日を ingester で取り込む。
+        当日分は開示が続くため毎回差分更新する。取得に失敗した日付のリストを返す。
+        """
+        today = today or datetime.now().date()
+        done = self.complete_days(start, end)
+        failed = []
+        day = start
+        while day <= end:
+            if day.weekday() < 5 and (day.isoformat() not in done or day >= today):
+                state = ingester.refresh(day)
+                if state.truncated:
+                    failed.append(day)
+            day += timedelta(days=1)
+        return failed
+
+    def version(self):
+        """索引済みの最新の開示 rowid。新しい開示が追加されると増えるため、検索結果のキャッシュキーに使える。"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT last_doc_id FROM index_state WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    # --- 読み出し ---
+    def query_code(self, code, days=7, end=None):
+        """code の直近 days 日分の開示を新しい順に返す。"""
+        end = end or datetime.now().date()
+        start = end - timedelta(days=days - 1)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT date, time, title, url FROM disclosures "
+                "WHERE code = ? AND date BETWEEN ? AND ? ORDER BY date DESC, time DESC",
+                (code, start.isoformat(), end.isoformat())
+            ).fetchall()
+        return [{"date": d, "time": t, "title": title, "url": url} for d, t, title, url in rows]
+
+    def disclosure_map(self, start, end):
+        """期間内の開示を get_tdnet_data と同じ {code: [item, ...]} 形式 (新しい順) で返す。"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT code, date, time, title, url FROM disclosures "
+                "WHERE date BETWEEN ? AND ? ORDER BY date DESC, time DESC",
+                (start.isoformat(), end.isoformat())
+            ).fetchall()
+        result = {}
+        for code, d, t, title, url in rows:
+            result.setdefault(code, []).append({"date": d, "time": t, "title": title, "url": url})
+        return result
+
+    # --- キーワード検索 ---
+    def _match_ids(self, conn, keyword, start, end):
+        norm = normalize_text(keyword)
+        if not norm:
+            return []
+        if len(norm) < 2:
+            # 1文字のキーワードは bigram 索引では引けないため、期間内のタイトルを直接調べる
+            rows = conn.execute(
+                "SELECT rowid, title FROM disclosures WHERE date BETWEEN ? AND ?",
+                (start.isoformat(), end.isoformat())
+            ).fetchall()
+            return [rowid for rowid, title in rows if norm in normalize_text(title)]
+        grams = ngrams(norm)
+        placeholders = ",".join("?" * len(grams))
+        rows = conn.execute(
+            f"SELECT d.rowid, d.title FROM disclosures d JOIN ("
+            f"  SELECT doc_id FROM title_grams WHERE gram IN ({placeholders}) AND date BETWEEN ? AND ?"
+            f"  GROUP BY doc_id HAVING COUNT(*) = ?"
+            f") hit ON hit.doc_id = d.rowid",
+            (*grams, start.isoformat(), end.isoformat(), len(grams))
+        ).fetchall()
+        # bigram の一致だけでは語順が保証されないため、最後に部分一致で確認する
+        return [rowid for rowid, title in rows if norm in normalize_text(title)]
+
+    def search(self, start, end, keywords=(), categories=()):
+        """
+        期間内で、いずれかのキーワードまたは開示種別に該当する開示を {code: [item, ...]} で返す。
+        item には該当した種別・キーワードが "matched" として入る。
+        """
+        terms = [(kw, kw) for kw in keywords if kw.strip()]
+        for cat in categories:
+            terms += [(cat, kw) for kw in CATEGORY_KEYWORDS.get(cat, [])]
+        if not terms:
+            return {}
+
+        with self._connect() as conn:
+            matched = {}
+            for label, kw in terms:
+                for rowid in self._match_ids(conn, kw, start, end):
+                    matched.setdefault(rowid, [])
+                    if label not in matched[rowid]:
+                        matched[rowid].append(label)
+            if not matched:
+                return {}
+            ids = list(matched)
+            rows = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                rows += conn.execute(
+                    f"SELECT rowid, code, date, time, title, url FROM disclosures WHERE rowid IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+
+        result = {}
+        for rowid, code, d, t, title, url in sorted(rows, key=lambda r: (r[2], r[3]), reverse=True):
+            result.setdefault(code, []).append(
+                {"date": d, "time": t, "title": title, "url": url, "matched": matched[rowid]}
+            )
+        return result
+
+    def topic_labels(self, start, end, keywords=(), categories=()):
+        """search() の結果を銘柄ごとの該当ラベル {code: [label, ...]} にまとめる (filter_ranking の topic_hits 用)。"""
+        return {
+            code: list(dict.fromkeys(label for item in items for label in item["matched"]))
+            for code, items in self.search(start, end, keywords, categories).items()
+        }
@@ -0,0 +1,245 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone, time as dt_time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import requests
+
+from metrics import METRICS
+from ohlcv_store import DATA_DIR
+from scraper import HEADERS
+
+JST = timezone(timedelta(hours=9))
+
+# ==========================================
+# 東証全銘柄の日足パネル (日付×銘柄、項目ごとに Parquet)
+# ==========================================
+JPX_LIST_URL = "https://www.jpx.co.jp/markets/statistics-equities/misc/tvdivq0000001vg2-att/data_j.xls"
+PANEL_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+HISTORY_PERIOD = "2y"
+KEEP_BARS = 320          # 52週安値 (約245本) と75日線の向きを判定できる本数
+OVERLAP_DAYS = 7         # 差分取得で前回分と重ねる日数 (株式分割などの調整検出用)
+BATCH_SIZE = 200
+CODES_TTL_DAYS = 7
+SESSION_CLOSE = dt_time(15, 30)
+# 大引け直後の日足は遅延・未確定のことがあるため、この時間が経つまでの取得は確定扱いにしない
+SETTLE_DELAY = timedelta(minutes=90)
+
+
+def fetch_tse_codes():
+    """JPX の上場銘柄一覧から内国株式 (プライム/スタンダード/グロース) の Code, Name, Market を返す。"""
+    res = requests.get(JPX_LIST_URL, headers=HEADERS, timeout=30)
+    res.raise_for_status()
+    df = pd.read_excel(BytesIO(res.content), dtype={"コード": str})
+    df = df[df["市場・商品区分"].astype(str).str.contains("内国株式")]
+    return pd.DataFrame({
+        "Code": df["コード"].str.strip(),
+        "Name": df["銘柄名"].astype(str),
+        "Market": df["市場・商品区分"].str.replace("（内国株式）", "", regex=False),
+    }).drop_duplicates("Code").reset_index(drop=True)
+
+
+def _default_loader(symbols, start=None):
+    import yfinance as yf
+    kwargs = {"period": HISTORY_PERIOD} if start is None else {"start": start.strftime("%Y-%m-%d")}
+    with METRICS.span("yfinance.download", caller="universe"):
+        return yf.download(symbols, interval="1d", group_by="column", auto_adjust=True,
+                           threads=True, progress=False, **kwargs)
+
+
+def _split_fields(panel, codes):
+    """yf.download 形式の結果を {項目: 日付×銘柄コード} に分ける。"""
+    symbols = [f"{c}.T" for c in codes]
+    out = {}
+    for field in PANEL_FIELDS:
+        data = panel[field] if field in panel else pd.DataFrame(index=panel.index)
+        if isinstance(data, pd.Series):
+            data = data.to_frame(symbols[0])
+        data = data.reindex(columns=symbols).astype("float32")
+        data.columns = list(codes)
+        if data.index.tz is not None:
+            data.index = data.index.tz_localize(None)
+        out[field] = data
+    return out
+
+
+def _write_field(df, path):
+    # 銘柄を列にすると Parquet の列数が数千になり読み込みが遅いため、銘柄×日付に転置して保存する
+    out = df.T
+    out.columns = df.index.strftime("%Y-%m-%d")
+    out.to_parquet(path)
+
+
+def _read_field(path):
+    df = pd.read_parquet(path).T
+    df.index = pd.to_datetime(df.index)
+    return df
+
+
+def _overlay(base, new):
+    """base を new の欠損でない値で上書きした 日付×銘柄 の表 (行・列は和集合)。"""
+    index = base.index.union(new.index)
+    columns = base.columns.append(new.columns.difference(base.columns))
+    values = base.reindex(index=index, columns=columns).to_numpy(dtype="float32", copy=True)
+    block = np.ix_(index.get_indexer(new.index), columns.get_indexer(new.columns))
+    incoming = new.to_numpy(dtype="float32")
+    values[block] = np.where(np.isnan(incoming), values[block], incoming)
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def last_session_close(now=None):
+    """now 以前で直近の大引け時刻 (土日は遡る。祝日は考慮しない)。"""
+    now = now or datetime.now(JST)
+    day = now.date() if now.time() >= SESSION_CLOSE else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return datetime.combine(day, SESSION_CLOSE, tzinfo=JST)
+
+
+class UniversePanel:
+    """
+    東証全銘柄の直近 keep_bars 本の日足を、項目ごとの 日付×銘柄 行列として保持する。
+    初回は全期間をまとめて取得し、以後は大引け後に1日1回、前回分と少し重ねた差分だけを取得して上書きする。
+    重ねた期間の終値が変わった銘柄 (株式分割など) は、その銘柄だけ全期間を取り直す。
+    """
+
+    def __init__(self, root=None, loader=None, codes_loader=None, keep_bars=KEEP_BARS, batch_size=BATCH_SIZE):
+        self.root = os.path.join(root or DATA_DIR, "universe")
+        self.loader = loader or _default_loader
+        self.codes_loader = codes_loader or fetch_tse_codes
+        self.keep_bars = keep_bars
+        self.batch_size = batch_size
+        self._frames = None
+        self._codes = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    # --- 銘柄一覧 ---
+    def codes(self):
+        """銘柄一覧 (Code, Name, Market)。CODES_TTL_DAYS 日ごとに取り直し、失敗時は保存済みの一覧を使う。"""
+        if self._codes is not None:
+            return self._codes
+        path = self._path("codes.parquet")
+        cached = pd.read_parquet(path) if os.path.exists(path) else None
+        fresh = cached is not None and (datetime.now().timestamp() - os.path.getmtime(path)) < CODES_TTL_DAYS * 86400
+        if not fresh:
+            try:
+                loaded = self.codes_loader()
+                if not loaded.empty:
+                    loaded.to_parquet(path, index=False)
+                    cached = loaded
+            except Exception as e:
+                METRICS.error("universe.codes", e)
+                if cached is None:
+                    raise
+        self._codes = cached
+        return cached
+
+    # --- パネル ---
+    def frames(self):
+        """{項目: 日付×銘柄コード (float32)}。まだ取得していなければ空の辞書。"""
+        with self._lock:
+            if self._frames is None:
+                paths = {f: self._path(f"{f.lower()}.parquet") for f in PANEL_FIELDS}
+                self._frames = {f: _read_field(p) for f, p in paths.items() if os.path.exists(p)}
+                if len(self._frames) < len(PANEL_FIELDS):
+                    self._frames = {}
+            return self._frames
+
+    def updated_at(self):
+        try:
+            with open(self._path("meta.json"), encoding="utf-8") as f:
+                return datetime.fromisoformat(json.load(f)["updated_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def is_stale(self, now=None):
+        """
+        直近の確定済みセッション (大引け + SETTLE_DELAY を過ぎた日) の足を、確定後に取得していなければ古いとみなす。
+        大引け直後の未確定の足で更新したパネルは、確定時刻を過ぎたら取り直す。
+        確定後に取得しても当日の足が無い場合 (祝日) は、次のセッションまで取り直さない。
+        """
+        now = now or datetime.now(JST)
+        frames = self.frames()
+        updated = self.updated_at()
+        if not frames or updated is None:
+            return True
+        settled = last_session_close(now - SETTLE_DELAY) + SETTLE_DELAY
+        return updated < settled
+
+    def _download(self, codes, start=None):
+        """codes をバッチごとに取得して項目ごとに連結する。失敗したバッチは飛ばし、次回の更新で取り直す。"""
+        parts = {f: [] for f in PANEL_FIELDS}
+        for i in range(0, len(codes), self.batch_size):
+            batch = codes[i:i + self.batch_size]
+            try:
+                fields = _split_fields(self.loader([f"{c}.T" for c in batch], start=start), batch)
+            except Exception as e:
+                METRICS.error("universe.download", e)
+                continue
+            for f in PANEL_FIELDS:
+                parts[f].append(fields[f])
+            METRICS.incr("universe.symbols", len(batch), kind="full" if start is None else "delta")
+        return {f: pd.concat(v, axis=1) for f, v in parts.items() if v}
+
+    def update(self, now=None):
+        """銘柄一覧に合わせて差分を取得し、保存する。更新後のパネルを返す。"""
+        now = now or datetime.now(JST)
+        codes = list(self.codes()["Code"])
+        with METRICS.span("universe.update"):
+            old = self.frames()
+            if old:
+                known = [c for c in codes if c in old["Close"].columns]
+                start = old["Close"].index[-1] - timedelta(days=OVERLAP_DAYS)
+                fresh = self._download(known, start=start)
+                refetch = [c for c in codes if c not in old["Close"].columns]
+                if fresh:
+                    refetch += self._adjusted_codes(old["Close"], fresh["Close"])
+            else:
+                fresh, refetch = {}, codes
+            full = self._download(refetch) if refetch else {}
+
+            merged = {}
+            for f in PANEL_FIELDS:
+                df = old.get(f, pd.DataFrame(dtype="float32")).drop(columns=refetch, errors="ignore")
+                if f in fresh:
+                    df = _overlay(df, fresh[f])
+                if f in full:
+                    df = _overlay(df, full[f])
+                merged[f] = df
+            # 上場廃止などで一覧から消えた銘柄と、全銘柄が欠損の日 (休場日) を落とす
+            close = merged["Close"].reindex(columns=[c for c in codes if c in merged["Close"].columns])
+            rows = close.index[close.notna().any(axis=1)][-self.keep_bars:]
+            merged = {f: df.reindex(index=rows, columns=close.columns).astype("float32") for f, df in merged.items()}
+            self._save(merged, now)
+        return merged
+
+    def update_if_stale(self, now=None):
+        return self.update(now) if self.is_stale(now) else self.frames()
+
+    def _adjusted_codes(self, old_close, new_close):
+        """重ねた期間の最初の共通日で終値が 0.5% 超ずれた銘柄 (過去足が調整された銘柄)。"""
+        common = old_close.index.intersection(new_close.index)
+        if common.empty:
+            return []
+        cols = new_close.columns.intersection(old_close.columns)
+        old_v = old_close.loc[common[0], cols]
+        new_v = new_close.loc[common[0], cols]
+        ratio = (new_v / old_v - 1).abs()
+        return list(ratio.index[ratio > 0.005])
+
+    def _save(self, frames, now):
+        for f, df in frames.items():
+            path = self._path(f"{f.lower()}.parquet")
+            _write_field(df, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        with open(self._path("meta.json"), "w", encoding="utf-8") as fp:
+            json.dump({"updated_at": now.isoformat(), "symbols": len(frames["Close"].columns)}, fp)
+        with self._lock:
+            self._frames = frames
@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from metrics import METRICS
+from ohlcv_store import DATA_DIR
+from scheduler import PHASE_NIGHT, PHASE_ZARABA
+
+JST = timezone(timedelta(hours=9))
+
+# ==========================================
+# ウォッチリスト監視 (ランキングページからの一括取得 + アラート)
+# ==========================================
+# 株価はスケジューラが定期取得するランキング (急騰・急落の全ページ) のスナップショットから拾う。
+# ランキングに無い銘柄は、ザラ場中は日足の一括ダウンロード (BATCH_SIZE 銘柄ごとに1回) で補い、
+# PTS 夜間は約定・値動きなしとみなす。1回の監視のコストはページ数・バッチ数で決まり、銘柄数には比例しない。
+MAX_CODES = 300
+BATCH_SIZE = 200
+QUOTE_MAX_AGE = 120.0    # ランキング外の銘柄の株価を取り直す間隔 (秒)
+BASELINE_PERIOD = "3mo"
+TICK_HISTORY = 240
+ALERT_HISTORY = 200
+PHASE_MODES = {PHASE_NIGHT: "PTS", PHASE_ZARABA: "Daytime"}
+TICK_COLUMNS = ["Time", "Price", "Change_Pct", "Volume", "Vol_Multiple"]
+
+
+class AlertRules:
+    """アラート条件。pct は |前日比%| の閾値、vol_multiple は 出来高 / 25日平均 の閾値 (0 で無効)。"""
+
+    def __init__(self, pct=5.0, vol_multiple=3.0, news=True):
+        self.pct = pct
+        self.vol_multiple = vol_multiple
+        self.news = news
+
+    def to_dict(self):
+        return {"pct": self.pct, "vol_multiple": self.vol_multiple, "news": self.news}
+
+
+def _default_downloader(symbols, period="5d"):
+    import yfinance as yf
+    with METRICS.span("yfinance.download", caller="watchlist"):
+        return yf.download(symbols, period=period, interval="1d", group_by="column",
+                           auto_adjust=False, threads=True, progress=False)
+
+
+def _daily_panel(codes, downloader, period, batch_size=BATCH_SIZE):
+    """codes の日足を batch_size 銘柄ずつ一括ダウンロードし、{項目: 日付×銘柄コード} で返す。"""
+    fields = {"Close": [], "Volume": []}
+    for i in range(0, len(codes), batch_size):
+        batch = list(codes[i:i + batch_size])
+        symbols = [f"{c}.T" for c in batch]
+        panel = downloader(symbols, period=period)
+        for field, parts in fields.items():
+            data = panel[field]
+            if isinstance(data, pd.Series):
+                data = data.to_frame(symbols[0])
+            data = data.reindex(columns=symbols)
+            data.columns = batch
+            if data.index.tz is not None:
+                data.index = data.index.tz_localize(None)
+            parts.append(data)
+    return {f: pd.concat(parts, axis=1) if parts else pd.DataFrame() for f, parts in fields.items()}
+
+
+def volume_baseline(codes, frames=None, downloader=None, today=None):
+    """
+    銘柄ごとの直近25営業日 (当日を除く) の平均出来高。
+    全銘柄パネル (frames) があればそこから、無ければ日足を BATCH_SIZE 銘柄ずつ一括ダウンロードして求める。
+    """
+    today = pd.Timestamp(today or datetime.now(JST).date())
+    codes = list(codes)
+    if not codes:
+        return pd.Series(dtype=float)
+    if not frames:
+        frames = _daily_panel(codes, downloader or _default_downloader, BASELINE_PERIOD)
+    volume = frames["Volume"]
+    volume = volume[volume.index.normalize() < today].iloc[-25:]
+    return volume.mean().reindex(codes).astype(float)
+
+
+def latest_quotes(codes, today=None, downloader=None):
+    """
+    codes の当日の日足から Price・Change_Pct・Volume を一括ダウンロードで求める。
+    当日の足がまだ無い (寄り付き前・データの遅延) 場合は空を返し、前日の値をアラートに使わない。
+    """
+    empty = pd.DataFrame(columns=["Code", "Price", "Change_Pct", "Volume"])
+    if not codes:
+        return empty
+    panel = _daily_panel(list(codes), downloader or _default_downloader, "5d")
+    close = panel["Close"].ffill()
+    if close.empty or close.index[-1].date() != (today or datetime.now(JST).date()):
+        return empty
+    last = close.iloc[-1] if len(close) else pd.Series(dtype=float)
+    prev = close.iloc[-2] if len(close) > 1 else pd.Series(float("nan"), index=last.index)
+    quotes = pd.DataFrame({
+        "Price": last,
+        "Change_Pct": (last / prev - 1) * 100,
+        "Volume": panel["Volume"].iloc[-1] if len(panel["Volume"]) else float("nan"),
+    })
+    return quotes.dropna(subset=["Price"]).rename_axis("Code").reset_index()
+
+
+class WatchlistMonitor:
+    """
+    プロセス内で共有するウォッチリスト。poll() ごとに市場時間帯のランキングから監視銘柄の価格を取り出して
+    銘柄ごとに直近 TICK_HISTORY 件を保持し、前日比・出来高倍率が閾値を超えた時点と、新しい適時開示でアラートを出す。
+    監視銘柄とアラート条件は path (JSON) に保存し、再起動後も引き継ぐ。
+    """
+
+    def __init__(self, path=None, baseline=None, quotes=None, max_codes=MAX_CODES, history_len=TICK_HISTORY,
+                 quote_max_age=QUOTE_MAX_AGE):
+        self.path = path or os.path.join(DATA_DIR, "watchlist.json")
+        self.baseline = baseline
+        self.quotes = quotes
+        self.max_codes = max_codes
+        self.quote_max_age = quote_max_age
+        self.history_len = history_len
+        self.codes = []
+        self.rules = AlertRules()
+        self._names = {}
+        self._ticks = {}
+        self._above = {}
+        self._seen_news = {}
+        self._baseline = (None, pd.Series(dtype=float))
+        self._quotes = (None, (), pd.DataFrame())
+        self._ingested = {}
+        self._alerts = deque(maxlen=ALERT_HISTORY)
+        self._alert_seq = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    # --- 設定 ---
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.codes = list(saved.get("codes", []))[:self.max_codes]
+        self.rules = AlertRules(**saved.get("rules", {}))
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"codes": self.codes, "rules": self.rules.to_dict()}, f, ensure_ascii=False)
+        except OSError as e:
+            METRICS.error("watchlist.save", e)
+
+    def configure(self, codes=None, rules=None):
+        """監視銘柄 (最大 max_codes) とアラート条件を置き換える。外れた銘柄の履歴は捨てる。"""
+        with self._lock:
+            if codes is not None:
+                self.codes = list(dict.fromkeys(codes))[:self.max_codes]
+                for code in set(self._ticks) - set(self.codes):
+                    self._ticks.pop(code, None)
+                    self._above.pop(code, None)
+                    self._seen_news.pop(code, None)
+                # 加えた銘柄が次のランキング更新を待たずに表示されるよう、最新のスナップショットを取り込み直す
+                self._ingested.clear()
+            if rules is not None:
+                self.rules = rules
+                self._above.clear()
+            self._save()
+
+    # --- 取り込み ---
+    def refresh_baseline(self, today):
+        """
+        平均出来高を、日付が変わったら全銘柄、同じ日なら新しく加わった銘柄だけ求め直す。
+        ダウンロードを伴うため poll() (スケジューラの専用レーン) から呼び、ロックの外で計算する。
+        """
+        with self._lock:
+            codes, (day, series) = list(self.codes), self._baseline
+        if self.baseline is None or not codes:
+            return series
+        if day != today:
+            series = pd.Series(dtype=float)
+        missing = [c for c in codes if c not in series.index]
+        if missing:
+            try:
+                fresh = self.baseline(missing)
+                series = pd.concat([series, fresh]) if not series.empty else fresh
+            except Exception as e:
+                METRICS.error("watchlist.baseline", e)
+        with self._lock:
+            self._baseline = (today, series)
+        return series
+
+    def _quotes_for(self, codes, now):
+        """ランキングに無い監視銘柄の株価 (QUOTE_MAX_AGE 秒ごとに一括取得)。"""
+        fetched_at, requested, quotes = self._quotes
+        stale = fetched_at is None or (now - fetched_at).total_seconds() > self.quote_max_age
+        if self.quotes is not None and codes and (stale or not set(codes) <= set(requested)):
+            try:
+                quotes = self.quotes(codes, now.date())
+            except Exception as e:
+                # 前回の株価を今回のティックとして記録しないよう空を返し、次の poll で取り直す
+                METRICS.error("watchlist.quotes", e)
+                return quotes.iloc[0:0]
+            self._quotes = (now, tuple(codes), quotes)
+        return quotes[quotes["Code"].isin(codes)] if not quotes.empty else quotes
+
+    def _alert(self, ts, code, kind, message):
+        self._alert_seq += 1
+        self._alerts.append((self._alert_seq, ts, code, self._names.get(code, ""), kind, message))
+        METRICS.incr("watchlist.alerts", kind=kind)
+
+    def ingest(self, ranking, fetched_at, news_map=None, quotes=None):
+        """
+        ランキング表 (全件) と当日の開示 {code: [item, ...]} から監視銘柄の1回分のティックを記録する。
+        quotes (Code, Price, Change_Pct, Volume) はランキングに無い銘柄の株価で、ランキング側を優先する。
+        news_map が None (開示がまだ取得できていない) の間は開示の既読状態を作らない。
+        """
+        with self._lock:
+            if not self.codes:
+                return 0
+            rules = self.rules
+            columns = ["Code", "Name", "Price", "Change_Pct", "Volume"]
+            hits = ranking.loc[ranking["Code"].isin(self.codes), columns] if not ranking.empty else pd.DataFrame(columns=columns)
+            if quotes is not None and not quotes.empty:
+                extra = quotes[quotes["Code"].isin(self.codes) & ~quotes["Code"].isin(hits["Code"])]
+                extra = extra.assign(Name=extra["Code"].map(self._names).fillna(""))[columns]
+                hits = pd.concat([hits, extra], ignore_index=True) if not hits.empty else extra
+            baseline = self._baseline[1]
+            multiple = hits["Volume"].to_numpy(dtype=float) / baseline.reindex(hits["Code"].astype(str)).to_numpy(dtype=float)
+
+            for (code, name, price, pct, volume), vol_x in zip(
+                    hits.itertuples(index=False, name=None), multiple):
+                code = str(code)
+                self._names[code] = name
+                ticks = self._ticks.setdefault(code, deque(maxlen=self.history_len))
+                ticks.append((fetched_at, price, pct, volume, vol_x))
+
+                above = self._above.setdefault(code, {"pct": False, "vol": False})
+                pct_hit = rules.pct > 0 and abs(pct) >= rules.pct
+                if pct_hit and not above["pct"]:
+                    self._alert(fetched_at, code, "変動率", f"{pct:+.2f}% ({price:,.0f}円)")
+                above["pct"] = pct_hit
+                vol_hit = rules.vol_multiple > 0 and vol_x == vol_x and vol_x >= rules.vol_multiple
+                if vol_hit and not above["vol"]:
+                    self._alert(fetched_at, code, "出来高", f"25日平均の{vol_x:.1f}倍 ({volume:,.0f}株)")
+                above["vol"] = vol_hit
+
+            if news_map is not None:
+                for code in self.codes:
+                    # 起動直後・監視に加えた直後は、既にある当日分の開示をまとめて通知しない
+                    first = code not in self._seen_news
+                    seen = self._seen_news.setdefault(code, set())
+                    for item in news_map.get(code, ()):
+                        key = (item["time"], item["title"])
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        if not first and rules.news:
+                            self._alert(fetched_at, code, "適時開示", f"{item['time']} {item['title']}")
+            METRICS.incr("watchlist.ticks", len(hits))
+            return len(hits)
+
+    def poll(self, scheduler, phase):
+        """
+        時間帯に対応するランキングの最新スナップショットを取り込む。ランキングの取得はスケジューラの間隔
+        (REFRESH_INTERVALS) に任せ、ここでは取り直さない。閑散時間は何もしない。
+        ingest 済みのスナップショット (version が同じ) と、途中で打ち切った・一部のページが取れなかった
+        スナップショット (attrs["complete"] が False) は取り込まない。
+        """
+        mode = PHASE_MODES.get(phase)
+        if mode is None or not self.codes:
+            return None
+        key = f"ranking:{mode}"
+        snap = scheduler.snapshot(key)
+        if snap is None or snap.data is None or self._ingested.get(key) == snap.version:
+            return snap
+        self._ingested[key] = snap.version
+        if not snap.data.attrs.get("complete", True):
+            METRICS.incr("watchlist.skipped", reason="partial")
+            return snap
+        self.refresh_baseline(snap.fetched_at.date())
+        quotes = None
+        if phase == PHASE_ZARABA:
+            missing = [c for c in self.codes if c not in set(snap.data["Code"])]
+            quotes = self._quotes_for(missing, snap.fetched_at)
+        news = scheduler.snapshot("tdnet:today")
+        with METRICS.span("watchlist.ingest"):
+            self.ingest(snap.data, snap.fetched_at, news.data if news and news.data is not None else None, quotes)
+        return snap
+
+    # --- 参照 ---
+    def table(self):
+        """監視銘柄ごとの最新ティック。値動きのない銘柄は価格が欠損。"""
+        with self._lock:
+            rows = []
+            for code in self.codes:
+                ticks = self._ticks.get(code)
+                last = ticks[-1] if ticks else (None, float("nan"), float("nan"), float("nan"), float("nan"))
+                rows.append({"Code": code, "Name": self._names.get(code, ""), "Price": last[1], "Change_Pct": last[2],
+                             "Volume": last[3], "Vol_Multiple": last[4], "Updated": last[0], "Ticks": len(ticks or ())})
+        return pd.DataFrame(rows, columns=["Code", "Name", "Price", "Change_Pct", "Volume", "Vol_Multiple", "Updated", "Ticks"])
+
+    def ticks(self, code):
+        with self._lock:
+            return pd.DataFrame(list(self._ticks.get(code, ())), columns=TICK_COLUMNS)
+
+    def alerts(self, since=0):
+        """id が since より大きいアラートを新しい順に返す。"""
+        with self._lock:
+            return [a for a in reversed(self._alerts) if a[0] > since]